@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'base.profiling.RequestProfilingMiddleware',  # inactif sauf REQUEST_PROFILING_ENABLED
 ]
 
 # CORS settings
@@ -81,11 +83,75 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Profil base de données piloté par l'environnement
+#   DB_ENGINE=sqlite (défaut) : fichier DB_NAME (défaut db.sqlite3), pragmas appliqués
+#       à chaque connexion (base.db.configure_sqlite), transactions IMMEDIATE: un écrivain
+#       attend busy_timeout au lieu d'échouer en "database is locked". Le mode WAL est à
+#       activer en déploiement (DB_SQLITE_JOURNAL_MODE=WAL, voir SQLITE_JOURNAL_MODE)
+#   DB_ENGINE=postgresql : DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#       DB_POOL=1 active le pool psycopg 3 de Django (pip install "psycopg[binary,pool]"),
+#       tailles DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE; sans pool, connexions persistantes
+#       (CONN_MAX_AGE)
+#   Communs: DB_CONN_MAX_AGE (secondes, défaut 60), DB_CONN_HEALTH_CHECKS (défaut 1)
+def _env_bool(name, default):
+    return os.environ.get(name, str(int(default))).lower() in ('1', 'true', 'yes', 'on')
+
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_CONN_HEALTH_CHECKS = _env_bool('DB_CONN_HEALTH_CHECKS', True)
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('DB_SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = _env_bool('DB_POOL', False)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'application_industrial'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Le pool gère lui-même la réutilisation: CONN_MAX_AGE doit rester à 0
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+                'transaction_mode': os.environ.get('DB_SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            },
+        }
     }
+
+# Mode de journal SQLite (base.db.configure_sqlite). Il est enregistré dans le fichier:
+# appliqué une seule fois par fichier et par process, pas à chaque connexion. Vide par
+# défaut: la base de dev versionnée (db.sqlite3) reste en mode rollback et l'arbre git
+# reste propre. En déploiement: DB_SQLITE_JOURNAL_MODE=WAL (lecteurs et écrivain ne se
+# bloquent plus mutuellement); retour arrière avec DB_SQLITE_JOURNAL_MODE=DELETE.
+SQLITE_JOURNAL_MODE = os.environ.get('DB_SQLITE_JOURNAL_MODE', '').upper()
+
+# Pragmas de connexion exécutés à chaque nouvelle connexion SQLite (base.db.configure_sqlite)
+SQLITE_PRAGMAS = {
+    'busy_timeout': SQLITE_BUSY_TIMEOUT_MS,  # en premier: le passage en WAL peut attendre un verrou
+    # NORMAL n'est sûr qu'en WAL (beaucoup moins de fsync); FULL (défaut SQLite) sinon
+    'synchronous': 'NORMAL' if SQLITE_JOURNAL_MODE == 'WAL' else 'FULL',
+    'cache_size': int(os.environ.get('DB_SQLITE_CACHE_KIB', 20000)) * -1,  # négatif = KiB
+    'mmap_size': int(os.environ.get('DB_SQLITE_MMAP_BYTES', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
 }
 
 
@@ -142,9 +208,112 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 # Pour le développement (optionnel) - affiche les emails dans la console
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# File d'envoi (base.outbox): les requêtes ne font qu'insérer dans EmailOutbox,
+# le worker `python manage.py send_outbox --loop` envoie par lots.
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF_SECONDS = 60  # 60s, 120s, 240s... entre les essais
+EMAIL_OUTBOX_BACKOFF_MAX_SECONDS = 3600
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 600  # reprise des lots d'un worker tombé
+
+# Gabarits emails (base/templates/emails) et notifications admins
+EMAIL_LOGO_PATH = None  # chemin explicite du logo inline (sinon base/media puis frontend/public)
+EMAIL_NOTIFY_STOCK_ALERTS = False  # email aux admins quand un stock passe sous DASHBOARD_LOW_STOCK_THRESHOLD
+EMAIL_NOTIFY_FAILURE_REPORTS = False  # email aux admins à chaque nouveau formulaire de défaillance
+
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Permettre un accès anonyme par défaut
     ],
 }
+
+# Authentification (base.tokens): jetons signés émis par /login/
+CONNEX_TOKEN_MAX_AGE = 12 * 3600  # secondes (un jeton fermé par /logout/ reste refusé, en cache, jusque-là)
+CONNEX_ALLOW_LEGACY_SESSION_ID = False  # True: accepte encore "Session <id>" (aucun secret: migration seulement)
+# Empreinte mot de passe/rôle relue en base après ce délai: avec le cache LocMem (par
+# process), un jeton révoqué sur un worker reste accepté par les autres au plus ce temps
+CONNEX_CREDENTIALS_CHECK_TTL = 60  # secondes
+CONNEX_USER_CACHE_SIZE = 512
+CONNEX_USER_CACHE_TTL = 60  # secondes
+
+# Onboarding en lot (base.onboarding)
+ONBOARDING_MAX_ROWS = 1000
+ONBOARDING_HASH_WORKERS = 4  # threads de hachage des mots de passe
+
+# Pagination keyset des listes (base.pagination.KeysetPagination):
+# True  -> paginé seulement si le client envoie ?cursor= ou ?page_size=; la liste complète
+#          est dépréciée (en-têtes Deprecation / Link) en attendant la migration des clients
+# False -> toutes les listes sont paginées (cible: défaut une fois les clients migrés)
+LIST_PAGINATION_OPT_IN = _env_bool('LIST_PAGINATION_OPT_IN', True)
+
+# Cache (versions/ETags du tableau de bord). LocMem par défaut: en multi-workers,
+# préférer un backend partagé (Redis, base de données) pour des ETags cohérents.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+CACHE_VERSION_TTL = 300  # secondes: péremption max d'une version non partagée
+# /ateliers/, /equipements/: réécrits à chaque modification. Avec un cache non partagé,
+# la version est bornée par CACHE_VERSION_TTL (écritures des autres workers invisibles)
+REFERENCE_CACHE_TTL = 3600
+
+# Tableau de bord
+DASHBOARD_LOW_STOCK_THRESHOLD = 2  # quantité <= seuil => stock critique
+DASHBOARD_LIST_LIMIT = 10
+
+# Pareto des défaillances (/api/reports/pareto/<nature_panne|cause_panne|equipement|atelier>/)
+PARETO_THRESHOLD = 80  # % du total couvert par les catégories "vital_few"
+
+# Profilage des requêtes (base.profiling) -> /api/metrics/ (format Prometheus)
+REQUEST_PROFILING_ENABLED = False
+REQUEST_PROFILING_WINDOW = 1000  # échantillons conservés par route pour p50/p95/p99
+REQUEST_PROFILING_SLOW_MS = 500  # seuil d'écriture d'un profil cProfile
+REQUEST_PROFILING_CPROFILE_DIR = None  # ex. BASE_DIR / 'profiles' pour activer cProfile
+
+# Recherche plein texte des formulaires (/api/formulaires/search/)
+# 'auto': FTS5 si la table base_formulaire_fts existe (SQLite), sinon index Python
+FORMULAIRE_SEARCH_BACKEND = 'auto'
+
+# Export en flux des formulaires (/api/formulaires/export/?format=csv|ndjson)
+EXPORT_CHUNK_SIZE = 2000  # lignes lues par lot (iterator)
+EXPORT_CSV_DELIMITER = ';'  # Excel en locale française
+
+# Listes de choix des formulaires (méthode, nature, cause, gravité, état: base.lookups)
+FORMULAIRE_CHOICES_AUTO_CREATE = False  # libellé inconnu refusé en 400 (True: ajouté à la liste avec le formulaire)
+
+# Écritures en lot (POST /api/<formulaires|stocks|ateliers|equipements>/batch/)
+BATCH_MAX_ITEMS = 500  # éléments par requête, toutes opérations confondues
+BATCH_ATOMIC_DEFAULT = True  # tout ou rien, sauf "atomic": false dans le corps
+BATCH_CHUNK_SIZE = 200  # lignes par INSERT / UPDATE (bulk_create, bulk_update)
+
+# Synchronisation incrémentale (/api/changes/?since=<curseur>)
+SYNC_MAX_CHANGES = 1000  # lignes par modèle au-delà desquelles le client recharge tout (reset)
+SYNC_CURSOR_OVERLAP = 5  # secondes relues avant le curseur (transactions validées en retard)
+SYNC_TOMBSTONE_RETENTION_DAYS = 30  # purge: python manage.py purge_tombstones
+
+# Événements temps réel (SSE: /api/events/, servi sous ASGI, ex. uvicorn backend.asgi:application)
+#   EVENTS_BACKEND=base.events.LocalBackend (défaut): un seul processus
+#   EVENTS_BACKEND=base.events.FileBackend: plusieurs workers d'une même machine,
+#       journal partagé EVENTS_FILE (défaut BASE_DIR/events.jsonl)
+EVENTS_ENABLED = _env_bool('EVENTS_ENABLED', True)
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'base.events.LocalBackend')
+EVENTS_OPTIONS = {'path': os.environ['EVENTS_FILE']} if os.environ.get('EVENTS_FILE') else {}
+EVENTS_HEARTBEAT = 25  # secondes: commentaire SSE pour garder la connexion ouverte (proxys)
+EVENTS_MAX_IDS = 100  # ids par message au-delà desquels le client recharge le modèle
+
+# Logs de connexion (/login/, /logout/) écrits en lot par base.connexions
+CONNEXION_LOG_BATCH_SIZE = 100  # entrées en attente avant écriture
+CONNEXION_LOG_FLUSH_INTERVAL = 5  # secondes max d'attente d'une entrée (vérifié à chaque ajout)
+CONNEXION_LOG_LOGOUT_RETENTION = 3600  # secondes: déconnexion retentée tant que sa connexion n'est pas écrite (autre worker)
+CONNEXION_LOG_RETENTION_DAYS = 90  # python manage.py compact_connexion_logs
+CONNEXION_LOG_ARCHIVE_DIR = BASE_DIR / 'archives' / 'connexionlogs'  # un .jsonl.gz par jour compacté
+
+# Statistiques de sessions (/api/analytics/sessions/<active|daily|durations|concurrency>/)
+SESSION_ANALYTICS_BUCKET = 60  # secondes: tranche de cache des plages incluant aujourd'hui
+SESSION_ANALYTICS_PAST_TTL = 3600  # secondes: cache des plages entièrement passées
+SESSION_ANALYTICS_MAX_DAYS = 366  # jours max par requête (daily, durations)
+SESSION_ANALYTICS_CONCURRENCY_MAX_DAYS = 31  # jours max du pic horaire (24 tranches par jour)
+
+# Mouvements de stock (/api/stocks/movements/)
+STOCK_MOVEMENTS_MAX_BATCH = 500  # mouvements max par requête
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Technicien, Admin, ConnexUser, ConnexionLog
+from .models import (
+    Technicien, Admin, ConnexUser, ConnexionLog, ConnexionLogDaily, EmailOutbox, StockMovement, FormulairePiece,
+    MethodeEntretien, NaturePanne, CausePanne, IndiceGravite, EtatActionImmediate,
+)
 
 
 @admin.register(Technicien)
@@ -39,4 +42,44 @@ class ConnexionLogAdmin(admin.ModelAdmin):
     date_hierarchy = 'date_connexion'
 
 
+@admin.register(ConnexionLogDaily)
+class ConnexionLogDailyAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'sessions', 'closed_sessions', 'total_duration', 'first_connexion', 'last_deconnexion')
+    list_filter = ('user__role',)
+    search_fields = ('user__username',)
+    date_hierarchy = 'day'
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'to_email', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('to_email',)
+    readonly_fields = ('created_at', 'sent_at', 'claimed_at', 'claim_token', 'last_error')
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('stock', 'kind', 'delta', 'quantite_apres', 'motif', 'user', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('stock__reference', 'motif')
+    date_hierarchy = 'created_at'
+    # Journal en lecture seule: les quantités ne bougent que par mouvements
+    readonly_fields = ('stock', 'kind', 'delta', 'quantite_apres', 'motif', 'user', 'created_at')
+
+
+@admin.register(FormulairePiece)
+class FormulairePieceAdmin(admin.ModelAdmin):
+    list_display = ('formulaire', 'stock', 'quantite')
+    search_fields = ('stock__reference', 'stock__element')
+    list_select_related = ('formulaire__atelier', 'formulaire__equipement', 'stock')
+
+
+@admin.register(MethodeEntretien, NaturePanne, CausePanne, IndiceGravite, EtatActionImmediate)
+class FormulaireChoiceAdmin(admin.ModelAdmin):
+    # Libellés renvoyés par l'API: un renommage s'applique à tous les formulaires
+    list_display = ('id', 'label')
+    search_fields = ('label',)
+
+
 # Register your models here.
@@ -0,0 +1,174 @@
+from datetime import date, timedelta
+
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
+from django.utils.dateparse import parse_date
+
+from .lookups import with_labels
+
+
+GRANULARITES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+# Formats d'étiquette par granularité (les timeframes historiques gardent les leurs)
+LABEL_FORMATS = {
+    'day': "%d/%m",
+    'week': "%d/%m/%y",
+    'month': "%b %y",
+    'year': "%Y",
+}
+
+# Dimensions autorisées pour le group-by: (champ de regroupement, champ libellé).
+# Listes de choix (base.lookups): regroupement sur l'id, libellé lu dans le cache.
+GROUP_BY_FIELDS = {
+    'atelier': ('atelier', 'atelier__nom'),
+    'equipement': ('equipement', 'equipement__nom'),
+    'indice_gravite': ('indice_gravite', 'indice_gravite'),
+    'nature_panne': ('nature_panne', 'nature_panne'),
+}
+
+MAX_BUCKETS = 3660
+
+
+class AggregationError(ValueError):
+    """Paramètres d'agrégation invalides (renvoyés en 400 par la vue)."""
+
+
+def bucket_start(d, granularity):
+    """Ramène une date au début de son intervalle (lundi, 1er du mois, 1er janvier)."""
+    if granularity == 'week':
+        return d - timedelta(days=d.weekday())
+    if granularity == 'month':
+        return d.replace(day=1)
+    if granularity == 'year':
+        return d.replace(month=1, day=1)
+    return d
+
+
+def next_bucket(d, granularity):
+    if granularity == 'week':
+        return d + timedelta(days=7)
+    if granularity == 'month':
+        return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+    if granularity == 'year':
+        return date(d.year + 1, 1, 1)
+    return d + timedelta(days=1)
+
+
+def iter_buckets(start, end, granularity):
+    """Énumère en Python les débuts d'intervalles couvrant [start, end]."""
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        if len(buckets) > MAX_BUCKETS:
+            raise AggregationError(f"Plage trop large (max {MAX_BUCKETS} intervalles).")
+        current = next_bucket(current, granularity)
+    return buckets
+
+
+def _as_date(value):
+    # TruncDay & co. peuvent renvoyer un datetime selon le backend
+    return value.date() if hasattr(value, 'date') and callable(value.date) else value
+
+
+def resolve_range(params, today):
+    """
+    Traduit les query params en (start, end, granularity, label_format).
+    - timeframe=week|month|year : comportement historique (7 jours, 30 jours, 12 mois)
+    - from/to (YYYY-MM-DD) + granularity=day|week|month|year : plage arbitraire
+    """
+    raw_from = params.get('from')
+    raw_to = params.get('to')
+    granularity = params.get('granularity')
+
+    if raw_from or raw_to:
+        start = parse_date(raw_from) if raw_from else None
+        end = parse_date(raw_to) if raw_to else today
+        if (raw_from and start is None) or end is None:
+            raise AggregationError("Dates invalides (format attendu: YYYY-MM-DD).")
+        if start is None:
+            start = end - timedelta(days=29)
+        if start > end:
+            raise AggregationError("'from' doit être antérieur ou égal à 'to'.")
+        granularity = granularity or 'day'
+        if granularity not in GRANULARITES:
+            raise AggregationError(f"Granularité inconnue: {granularity}.")
+        return start, end, granularity, LABEL_FORMATS[granularity]
+
+    tf = params.get('timeframe', 'week')
+    if tf == 'year':
+        first_month = (today.year * 12 + today.month - 1) - 11
+        start = date(first_month // 12, first_month % 12 + 1, 1)
+        end = next_bucket(today.replace(day=1), 'month') - timedelta(days=1)
+        return start, end, granularity or 'month', "%b %y"
+    if tf == 'month':
+        return today - timedelta(days=29), today, granularity or 'day', "%d/%m"
+    return today - timedelta(days=6), today, granularity or 'day', "%a"
+
+
+def timeseries(queryset, start, end, granularity='day', group_by=None,
+               date_field='date_defaillance', label_format=None):
+    """
+    Compte les lignes de `queryset` par intervalle en UNE requête groupée
+    (Trunc<granularity> + Count), puis complète les intervalles vides en Python.
+
+    Retourne {labels, data, buckets} et, si `group_by`, une clé `series`
+    (une série par valeur de la dimension, alignée sur `labels`).
+    """
+    if granularity not in GRANULARITES:
+        raise AggregationError(f"Granularité inconnue: {granularity}.")
+    if group_by and group_by not in GROUP_BY_FIELDS:
+        raise AggregationError(
+            f"group_by invalide: {group_by} (valeurs possibles: {', '.join(GROUP_BY_FIELDS)})."
+        )
+
+    buckets = iter_buckets(start, end, granularity)
+    fmt = label_format or LABEL_FORMATS[granularity]
+    index = {b: i for i, b in enumerate(buckets)}
+
+    qs = (
+        queryset
+        .filter(**{f"{date_field}__gte": start, f"{date_field}__lte": end})
+        .annotate(bucket=GRANULARITES[granularity](date_field))
+        .order_by()
+    )
+
+    result = {
+        "labels": [b.strftime(fmt) for b in buckets],
+        "buckets": [b.isoformat() for b in buckets],
+    }
+
+    if not group_by:
+        data = [0] * len(buckets)
+        for row in qs.values('bucket').annotate(n=Count('id')):
+            i = index.get(_as_date(row['bucket']))
+            if i is not None:
+                data[i] = row['n']
+        result["data"] = data
+        return result
+
+    key_field, label_field = GROUP_BY_FIELDS[group_by]
+    value_fields = ['bucket', key_field] + ([label_field] if label_field != key_field else [])
+    series = {}
+    totals = [0] * len(buckets)
+    for row in qs.values(*value_fields).annotate(n=Count('id')):
+        row = with_labels(row)
+        i = index.get(_as_date(row['bucket']))
+        if i is None:
+            continue
+        key = row[key_field]
+        serie = series.get(key)
+        if serie is None:
+            serie = series[key] = {"key": key, "label": str(row[label_field]), "data": [0] * len(buckets)}
+        serie["data"][i] += row['n']
+        totals[i] += row['n']
+
+    result["data"] = totals
+    result["group_by"] = group_by
+    result["series"] = sorted(series.values(), key=lambda s: -sum(s["data"]))
+    return result
@@ -6,4 +6,10 @@ class BaseConfig(AppConfig):
     name = 'base'
 
     def ready(self):
+        from django.db.backends.signals import connection_created
+        from base.db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='base-configure-sqlite')
+
         import base.signals  # Charger les signaux
+        from base.email_utils import warm_email_assets
+        warm_email_assets()  # gabarits compilés + logo encodé une fois par process
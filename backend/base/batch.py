@@ -0,0 +1,323 @@
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import ProtectedError, RestrictedError, UniqueConstraint
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .cache_utils import DASHBOARD_CACHE_NAMESPACE, bump_version
+from .events import publish_on_commit
+from .rollups import deferred_refresh
+
+
+def batch_max_items():
+    return getattr(settings, 'BATCH_MAX_ITEMS', 500)
+
+
+def unique_keys(model):
+    """Champs uniques du modèle (unique=True, UniqueConstraint sans condition), en tuples de noms."""
+    keys = [(f.name,) for f in model._meta.concrete_fields if f.unique and not f.primary_key]
+    keys += [tuple(c.fields) for c in model._meta.constraints
+             if isinstance(c, UniqueConstraint) and c.fields and c.condition is None]
+    return keys + [tuple(fields) for fields in model._meta.unique_together]
+
+
+def _flag(value, default):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+class BatchResult:
+    """Objets créés / modifiés / supprimés d'un lot, transmis au hook batch_applied."""
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.previous = {}  # pk -> valeurs avant modification (batch_snapshot)
+        self.deleted = []
+        self.errors = []
+        self.claimed = {}  # (champs uniques, valeurs) -> élément du lot qui les utilise
+
+    def error(self, op, index, errors, pk=None):
+        self.errors.append({'op': op, 'index': index, 'id': pk, 'errors': errors})
+
+
+class BatchMixin:
+    """
+    POST /<ressource>/batch/ : créations, modifications et suppressions en lot,
+    dans UNE transaction et avec bulk_create / bulk_update.
+
+        {"create": [{...}, ...],
+         "update": [{"id": 3, "champ": "valeur"}, ...],   (modification partielle)
+         "delete": [4, 5],
+         "atomic": true}
+
+    - atomic (défaut BATCH_ATOMIC_DEFAULT): une erreur rejette tout le lot (400);
+      sinon les éléments valides sont appliqués et les erreurs listées (207).
+    - taille max: BATCH_MAX_ITEMS éléments (toutes opérations confondues).
+    - erreurs par élément: {"op", "index" (position dans sa liste), "id", "errors"}.
+    - valeurs uniques (ex. Stock.reference) en double dans le lot: erreur de
+      l'élément; une violation restante à l'écriture (ex. course avec une autre
+      requête) est isolée élément par élément, comme les suppressions bloquées.
+
+    bulk_create / bulk_update ne passent ni par save() ni par les signaux: les
+    viewsets complètent les champs calculés (batch_prepare) et appliquent les
+    effets de bord en une fois (batch_applied: index, rollups, journal...).
+    Les suppressions passent par QuerySet.delete() (signaux et cascades conservés).
+    """
+
+    def batch_clean(self, validated_data):
+        """Contrôles propres au lot sur un élément validé (ValidationError = erreur de l'élément)."""
+        return validated_data
+
+    def batch_prepare(self, instance):
+        """Champs calculés habituellement par save()."""
+
+    def batch_prepared_fields(self):
+        """Champs remplis par batch_prepare, ajoutés au bulk_update."""
+        return ()
+
+    def batch_snapshot(self, instance):
+        """Valeurs à conserver avant modification (comparées dans batch_applied)."""
+        return None
+
+    def batch_applied(self, result):
+        """Effets de bord du lot, dans la transaction (par défaut: invalidation du tableau de bord)."""
+        bump_version(DASHBOARD_CACHE_NAMESPACE)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        data = request.data if isinstance(request.data, dict) else {}
+        ops = {op: data.get(op) or [] for op in ('create', 'update', 'delete')}
+        if not any(ops.values()) or not all(isinstance(v, list) for v in ops.values()):
+            return Response({"error": "Corps attendu: {create: [...], update: [...], delete: [...]}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        total = sum(len(v) for v in ops.values())
+        if total > batch_max_items():
+            return Response({"error": f"Lot trop volumineux ({total} éléments, max {batch_max_items()})."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        atomic = _flag(data.get('atomic', request.query_params.get('atomic')),
+                       getattr(settings, 'BATCH_ATOMIC_DEFAULT', True))
+
+        result = BatchResult()
+        with transaction.atomic():
+            creates = self._validate_creates(ops['create'], result)
+            updates = self._validate_updates(ops['update'], result)
+            deletes = self._validate_deletes(ops['delete'], result)
+            if result.errors and atomic:
+                transaction.set_rollback(True)
+                return Response({'applied': False, 'errors': result.errors}, status=status.HTTP_400_BAD_REQUEST)
+            self._apply(creates, updates, deletes, result)
+            if result.errors and atomic:
+                transaction.set_rollback(True)
+                return Response({'applied': False, 'errors': result.errors}, status=status.HTTP_400_BAD_REQUEST)
+            self.batch_applied(result)
+            # Suppressions publiées par les signaux post_delete
+            publish_on_commit(self.get_queryset().model._meta.model_name, 'save',
+                              [obj.pk for obj in result.created + result.updated])
+
+        payload = {
+            'applied': True,
+            'created': self._serialize(result.created),
+            'updated': self._serialize(result.updated),
+            'deleted': result.deleted,
+            'errors': result.errors,
+        }
+        if result.errors:
+            code = status.HTTP_207_MULTI_STATUS
+        elif result.created:
+            code = status.HTTP_201_CREATED
+        else:
+            code = status.HTTP_200_OK
+        return Response(payload, status=code)
+
+    # ---------- VALIDATION ----------
+    def _validate_creates(self, items, result):
+        """Validation many=True; en cas d'erreur, seconde passe sur les seuls éléments valides."""
+        if not items:
+            return []
+        serializer = self.get_serializer(data=items, many=True)
+        if serializer.is_valid():
+            valid = list(enumerate(serializer.validated_data))
+        else:
+            ok = []
+            for index, errors in enumerate(serializer.errors):
+                if errors:
+                    result.error('create', index, errors)
+                else:
+                    ok.append(index)
+            valid = []
+            if ok:
+                again = self.get_serializer(data=[items[i] for i in ok], many=True)
+                again.is_valid(raise_exception=True)
+                valid = list(zip(ok, again.validated_data))
+        model = self.get_queryset().model
+        instances = []
+        for index, validated in valid:
+            try:
+                instance = model(**self.batch_clean(dict(validated)))
+            except serializers.ValidationError as e:
+                result.error('create', index, e.detail)
+                continue
+            if self._claim_unique(instance, 'create', index, result):
+                instances.append((index, instance))
+        return instances
+
+    def _validate_updates(self, items, result):
+        if not items:
+            return []
+        model = self.get_queryset().model
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        # Lignes verrouillées jusqu'à la fin du lot (PostgreSQL; sans effet sous SQLite)
+        instances = model.objects.select_for_update().in_bulk([i for i in ids if isinstance(i, int)])
+        valid, seen = [], set()
+        for index, item in enumerate(items):
+            pk = item.get('id') if isinstance(item, dict) else None
+            if pk not in instances:
+                result.error('update', index, {'id': ["Objet introuvable."]}, pk)
+                continue
+            if pk in seen:
+                result.error('update', index, {'id': ["Objet présent plusieurs fois dans le lot."]}, pk)
+                continue
+            seen.add(pk)
+            fields = {k: v for k, v in item.items() if k != 'id'}
+            serializer = self.get_serializer(instances[pk], data=fields, partial=True)
+            if not serializer.is_valid():
+                result.error('update', index, serializer.errors, pk)
+                continue
+            try:
+                validated = self.batch_clean(dict(serializer.validated_data))
+            except serializers.ValidationError as e:
+                result.error('update', index, e.detail, pk)
+                continue
+            if self._claim_unique(instances[pk], 'update', index, result, validated):
+                valid.append((index, instances[pk], validated))
+        return valid
+
+    def _validate_deletes(self, ids, result):
+        """[(position dans "delete", pk)], chaque pk une fois (première position)."""
+        model = self.get_queryset().model
+        existing = set(model.objects.filter(pk__in=[i for i in ids if isinstance(i, int)]).values_list('pk', flat=True))
+        valid, seen = [], set()
+        for index, pk in enumerate(ids):
+            if pk not in existing:
+                result.error('delete', index, {'id': ["Objet introuvable."]}, pk)
+            elif pk not in seen:
+                seen.add(pk)
+                valid.append((index, pk))
+        return valid
+
+    def _claim_unique(self, instance, op, index, result, overrides=None):
+        """
+        Réserve les valeurs uniques de l'élément (après modification); False si
+        un autre élément du lot les utilise déjà. La base est contrôlée par les
+        validateurs d'unicité du serializer.
+        """
+        overrides = overrides or {}
+        model = type(instance)
+        keys = []
+        for fields in unique_keys(model):
+            values = []
+            for name in fields:
+                field = model._meta.get_field(name)
+                value = overrides[name] if name in overrides else getattr(instance, field.attname)
+                values.append(value.pk if isinstance(value, models.Model) else value)
+            if None not in values:
+                keys.append((fields, tuple(values)))
+        clashes = [fields for fields, values in keys if (fields, values) in result.claimed]
+        if clashes:
+            result.error(op, index, {
+                name: ["Valeur déjà utilisée par un autre élément du lot."] for fields in clashes for name in fields
+            }, instance.pk)
+            return False
+        for key in keys:
+            result.claimed[key] = (op, index)
+        return True
+
+    # ---------- APPLICATION ----------
+    def _apply(self, creates, updates, deletes, result):
+        model = self.get_queryset().model
+        batch_size = getattr(settings, 'BATCH_CHUNK_SIZE', 200)
+
+        if creates:
+            objs = [instance for _index, instance in creates]
+            for obj in objs:
+                self.batch_prepare(obj)
+            try:
+                with transaction.atomic():
+                    result.created = model.objects.bulk_create(objs, batch_size=batch_size)
+            except IntegrityError:
+                self._create_one_by_one(model, creates, result)
+
+        if updates:
+            # bulk_update ne renseigne pas les champs auto_now (updated_at)
+            auto_now = [f for f in model._meta.concrete_fields if getattr(f, 'auto_now', False)]
+            fields = {f.name for f in auto_now}
+            for _index, instance, validated in updates:
+                result.previous[instance.pk] = self.batch_snapshot(instance)
+                for attr, value in validated.items():
+                    setattr(instance, attr, value)
+                    fields.add(attr)
+                self.batch_prepare(instance)
+                for field in auto_now:
+                    field.pre_save(instance, add=False)
+            fields = sorted(fields | set(self.batch_prepared_fields()))
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_update([instance for _i, instance, _v in updates], fields, batch_size=batch_size)
+                result.updated = [instance for _i, instance, _v in updates]
+            except IntegrityError:
+                self._update_one_by_one(model, updates, fields, result)
+
+        if deletes:
+            # Une ligne par signal post_delete: agrégats recalculés une seule fois
+            with deferred_refresh():
+                try:
+                    with transaction.atomic():
+                        model.objects.filter(pk__in=[pk for _index, pk in deletes]).delete()
+                    result.deleted = [pk for _index, pk in deletes]
+                except (ProtectedError, RestrictedError):
+                    self._delete_one_by_one(model, deletes, result)
+
+    # Rare (contrainte violée malgré la validation, objet référencé): les éléments
+    # sont repris un par un, chacun dans un savepoint, pour isoler les fautifs
+    def _create_one_by_one(self, model, creates, result):
+        for index, obj in creates:
+            obj.pk, obj._state.adding = None, True  # pk éventuellement reçu avant l'annulation
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create([obj])
+                result.created.append(obj)
+            except IntegrityError:
+                result.error('create', index, {'non_field_errors': ["Contrainte d'unicité ou d'intégrité non respectée."]})
+
+    def _update_one_by_one(self, model, updates, fields, result):
+        for index, instance, _validated in updates:
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_update([instance], fields)
+                result.updated.append(instance)
+            except IntegrityError:
+                result.previous.pop(instance.pk, None)
+                result.error('update', index, {'non_field_errors': ["Contrainte d'unicité ou d'intégrité non respectée."]},
+                             instance.pk)
+
+    def _delete_one_by_one(self, model, deletes, result):
+        for index, pk in deletes:
+            try:
+                with transaction.atomic():
+                    model.objects.filter(pk=pk).delete()
+                result.deleted.append(pk)
+            except (ProtectedError, RestrictedError) as e:
+                result.error('delete', index, {'id': [f"Suppression impossible: {len(e.args[1])} objet(s) lié(s)."]}, pk)
+
+    def _serialize(self, objects):
+        if not objects:
+            return []
+        order = {obj.pk: i for i, obj in enumerate(objects)}
+        # Relecture avec les select_related / prefetch du viewset (pas de N+1)
+        fresh = sorted(self.get_queryset().filter(pk__in=list(order)), key=lambda o: order[o.pk])
+        return self.get_serializer(fresh, many=True).data
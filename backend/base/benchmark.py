@@ -0,0 +1,274 @@
+import logging
+import platform
+import subprocess
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import django
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+
+from .models import Atelier, ConnexUser, ConnexionLog, Equipement, Formulaire, Stock
+from .pagination import KeysetPagination
+from .sync import encode_cursor
+from .tokens import issue_token
+
+
+BENCHMARK_PAGE_SIZE = 50
+
+
+# Variantes de query params par route (en plus de l'appel sans paramètre).
+# Les valeurs entre accolades sont tirées des données présentes (sample_context).
+SCENARIOS = {
+    'formulaire-list': [
+        {'atelier': '{atelier}'},
+        {'equipement': '{equipement}', 'from': '{date_365}'},
+        {'from': '{date_30}', 'to': '{today}'},
+    ],
+    'formulaire-search': [{'q': 'mecanique'}, {'q': '{equipement_nom}'}],
+    'stock-list': [{'q': 'roul'}, {'low_stock': '1'}, {'ordering': '-quantite'}],
+    'connexionlog-list': [{'user': '{user}'}],
+    'anomalies-timeseries': [
+        {'timeframe': 'month'},
+        {'timeframe': 'year', 'group_by': 'atelier'},
+        {'from': '{date_365}', 'to': '{today}', 'granularity': 'week', 'group_by': 'indice_gravite'},
+    ],
+    'reliability-kpis': [{'scope': 'atelier'}],
+    'parts-consumption': [{'group': 'atelier'}],
+    'pareto-report': [{'metric': 'failures', 'from': '{date_365}', 'to': '{today}'}],
+    'sessions-daily': [{'from': '{date_365}', 'to': '{today}'}],
+    'sessions-durations': [{'from': '{date_365}', 'to': '{today}'}],
+    'sessions-concurrency': [{'from': '{date_30}', 'to': '{today}'}],
+    'sync-changes': [{'since': '{cursor_hour}'}, {'since': '{cursor_hour}', 'models': 'stock'}],
+}
+# Routes dont l'appel sans paramètre n'a pas de sens (paramètre obligatoire)
+REQUIRED_PARAMS = {'formulaire-search'}
+# Paramètres d'URL autres qu'un pk: une mesure par valeur
+ROUTE_KWARGS = {
+    'pareto-report': [{'dimension': d} for d in ('nature_panne', 'cause_panne', 'equipement', 'atelier')],
+}
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def sample_context():
+    """Valeurs réelles pour les paramètres des routes (pk de détail, filtres)."""
+    today = timezone.localdate()
+    equipement = Equipement.objects.order_by('id').values('id', 'nom', 'atelier_id').first() or {}
+    return {
+        'today': today.isoformat(),
+        'date_30': (today - timedelta(days=30)).isoformat(),
+        'date_365': (today - timedelta(days=365)).isoformat(),
+        'atelier': equipement.get('atelier_id') or Atelier.objects.values_list('id', flat=True).first() or '',
+        'equipement': equipement.get('id', ''),
+        'equipement_nom': equipement.get('nom', ''),
+        'user': ConnexUser.objects.values_list('id', flat=True).first() or '',
+        'cursor_hour': encode_cursor(timezone.now() - timedelta(hours=1)),
+    }
+
+
+def _allows_get(callback):
+    actions = getattr(callback, 'actions', None)  # ViewSet routé: {'get': 'list', ...}
+    if actions is not None:
+        return 'get' in actions
+    view_class = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+    return view_class is not None and hasattr(view_class, 'get')
+
+
+def discover_routes(urlconf='base.urls'):
+    """
+    Routes GET de `urlconf`: [(nom, callback, noms des paramètres)], dans l'ordre
+    de déclaration. Les variantes de suffixe de format (.json) sont ignorées.
+    """
+    routes = []
+    for pattern in get_resolver(urlconf).url_patterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        params = set(pattern.pattern.regex.groupindex)
+        if 'format' in params or not _allows_get(pattern.callback):
+            continue
+        routes.append((pattern.name, pattern.callback, sorted(params)))
+    return routes
+
+
+def _detail_pk(callback):
+    queryset = getattr(getattr(callback, 'cls', None), 'queryset', None)
+    if queryset is None:
+        return None
+    return queryset.model.objects.order_by('pk').values_list('pk', flat=True).first()
+
+
+def _paginated_list(callback):
+    view_class = getattr(callback, 'cls', None)
+    pagination = getattr(view_class, 'pagination_class', None)
+    return (
+        getattr(callback, 'actions', {}).get('get') == 'list'
+        and isinstance(pagination, type) and issubclass(pagination, KeysetPagination)
+    )
+
+
+def build_requests(urlconf='base.urls', prefix='/api', context=None, full_lists=False):
+    """
+    [(nom, url)] à mesurer: chaque route GET + ses variantes de SCENARIOS.
+    Les listes keyset sont demandées par page (page_size), comme le front paginé;
+    full_lists=True mesure l'ancienne réponse complète (LIST_PAGINATION_OPT_IN).
+    """
+    context = context if context is not None else sample_context()
+    requests, skipped = [], []
+    for name, callback, params in discover_routes(urlconf):
+        all_kwargs = [{}]
+        if name in ROUTE_KWARGS:
+            all_kwargs = ROUTE_KWARGS[name]
+        elif params:
+            pk = _detail_pk(callback) if params == ['pk'] else None
+            if pk is None:
+                skipped.append({'name': name, 'reason': "aucune donnée pour les paramètres " + ", ".join(params)})
+                continue
+            all_kwargs = [{'pk': pk}]
+        base_query = {} if full_lists or not _paginated_list(callback) else {'page_size': BENCHMARK_PAGE_SIZE}
+        variants = list(SCENARIOS.get(name, ()))
+        if name not in REQUIRED_PARAMS:
+            variants.insert(0, {})
+        for kwargs in all_kwargs:
+            url = prefix + reverse(name, urlconf=urlconf, kwargs=kwargs)
+            for variant in variants:
+                query = {**base_query, **{k: str(v).format(**context) for k, v in variant.items()}}
+                requests.append((name, f"{url}?{urlencode(query)}" if query else url))
+    return requests, skipped
+
+
+def auth_headers(user=None):
+    """En-tête d'authentification d'un compte admin (routes protégées), si un compte existe."""
+    user = user or ConnexUser.objects.filter(role='admin').order_by('id').first()
+    return {'HTTP_AUTHORIZATION': f"Session {issue_token(user)}"} if user else {}
+
+
+def measure(client, url, iterations=5, headers=None):
+    """
+    Un appel à froid (cache vidé) puis `iterations` appels à chaud.
+    Retourne statut, nombre de requêtes SQL, taille de réponse et latences.
+    """
+    headers = headers or {}
+    cache.clear()
+    timings, queries = [], None
+    for i in range(iterations + 1):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = client.get(url, **headers)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - start
+        if i == 0:
+            first, first_queries = elapsed, len(ctx.captured_queries)
+        else:
+            timings.append(elapsed)
+            queries = len(ctx.captured_queries)
+    return {
+        'status': response.status_code,
+        'bytes': len(body),
+        'queries_cold': first_queries,
+        'queries': queries if queries is not None else first_queries,
+        'first_ms': _ms(first),
+        'ms': {
+            'min': _ms(min(timings, default=first)),
+            'p50': _ms(_quantile(timings or [first], 0.5)),
+            'p95': _ms(_quantile(timings or [first], 0.95)),
+            'max': _ms(max(timings, default=first)),
+        },
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _measure_route(client, name, url, iterations, headers, stdout=None):
+    result = {'name': name, 'url': url, **measure(client, url, iterations, headers)}
+    if stdout is not None:
+        stdout.write(
+            f"{result['status']}  {result['ms']['p50']:>9.2f} ms  {result['queries']:>3} req  "
+            f"{result['bytes']:>9} o  {url}"
+        )
+    return result
+
+
+def run_benchmark(iterations=5, urlconf='base.urls', prefix='/api', only=None, full_lists=False, stdout=None):
+    """
+    Mesure chaque route GET de `urlconf` via le client de test Django.
+    Résultat JSON-sérialisable: {'meta': ..., 'results': [...], 'skipped': [...]}.
+    """
+    client = Client(HTTP_HOST='localhost')
+    headers = auth_headers()
+    requests, skipped = build_requests(urlconf, prefix, full_lists=full_lists)
+    results = []
+    # Les 4xx attendus (détail filtré, droits) ne doivent pas noyer la sortie
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        for name, url in requests:
+            if only and not any(o in name for o in only):
+                continue
+            results.append(_measure_route(client, name, url, iterations, headers, stdout))
+    finally:
+        request_logger.setLevel(level)
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'commit': _git_commit(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'iterations': iterations,
+            'full_lists': full_lists,
+            'authenticated': bool(headers),
+            'rows': {
+                model.__name__: model.objects.count()
+                for model in (Atelier, Equipement, Formulaire, ConnexionLog, Stock, ConnexUser)
+            },
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+def compare(previous, current, threshold=0.2):
+    """
+    Compare deux résultats de run_benchmark par URL.
+    Retourne les écarts: latence p50 en hausse de plus de `threshold` (20 %)
+    ou requêtes SQL supplémentaires.
+    """
+    before = {r['url']: r for r in previous.get('results', [])}
+    regressions = []
+    for result in current.get('results', []):
+        old = before.get(result['url'])
+        if old is None:
+            continue
+        old_p50, new_p50 = old['ms']['p50'], result['ms']['p50']
+        ratio = (new_p50 - old_p50) / old_p50 if old_p50 else 0.0
+        if ratio > threshold or result['queries'] > old['queries']:
+            regressions.append({
+                'url': result['url'],
+                'p50_before': old_p50,
+                'p50_after': new_p50,
+                'change': round(ratio * 100, 1),
+                'queries_before': old['queries'],
+                'queries_after': result['queries'],
+            })
+    return regressions
@@ -0,0 +1,79 @@
+import hashlib
+import secrets
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_http_date_safe
+
+
+VERSION_KEY = "base:version:{}"
+DASHBOARD_CACHE_NAMESPACE = "dashboard"  # /dashboard/summary/
+REFERENCE_CACHE_NAMESPACE = "reference"  # /ateliers/, /equipements/
+
+
+def _new_version():
+    # Jeton aléatoire + horodatage de création (sert de Last-Modified)
+    return f"{secrets.token_hex(8)}.{int(time.time())}"
+
+
+def get_version(namespace, timeout=None):
+    """
+    Jeton de version d'un espace de cache (ex. 'dashboard').
+
+    Le jeton est régénéré après bump_version() ou à l'expiration de `timeout`,
+    ce qui borne la péremption lorsque le cache n'est pas partagé entre workers
+    (LocMemCache). En production multi-process, configurer un CACHES partagé.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'CACHE_VERSION_TTL', 300)
+    key = VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout)
+        version = cache.get(key) or _new_version()
+    return version
+
+
+def cache_is_shared(alias='default'):
+    """Faux si le backend de cache est local au process (LocMemCache, DummyCache)."""
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    return not backend.endswith(('.LocMemCache', '.DummyCache'))
+
+
+def version_timestamp(version):
+    """Date de création d'un jeton de get_version() (datetime UTC), ou None."""
+    _token, _sep, stamp = str(version).rpartition('.')
+    if not stamp.isdigit():
+        return None
+    return datetime.fromtimestamp(int(stamp), tz=timezone.utc)
+
+
+def bump_version(*namespaces):
+    """Invalide les espaces donnés: la prochaine lecture génère un nouveau jeton."""
+    cache.delete_many([VERSION_KEY.format(ns) for ns in namespaces])
+
+
+def make_etag(*parts):
+    raw = ":".join(str(p) for p in parts).encode()
+    return '"' + hashlib.sha1(raw).hexdigest()[:20] + '"'
+
+
+def etag_matches(request, etag):
+    """Compare l'ETag courant à If-None-Match (liste, '*', préfixe W/ tolérés)."""
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    if "*" in candidates:
+        return True
+    return any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def not_modified_since(request, last_modified):
+    """Vrai si If-Modified-Since couvre `last_modified` (ignoré si If-None-Match est présent)."""
+    if last_modified is None or request.META.get("HTTP_IF_NONE_MATCH"):
+        return False
+    since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE") or "")
+    return since is not None and int(last_modified.timestamp()) <= since
@@ -0,0 +1,272 @@
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, TimeField, Value, When
+from django.utils import timezone
+
+from .models import ConnexionLog, ConnexionLogDaily
+
+logger = logging.getLogger(__name__)
+
+
+def session_key(token):
+    """Empreinte du jeton émis par /login/: relie la déconnexion à sa connexion."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def client_ip(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip() or None
+    return request.META.get('REMOTE_ADDR') or None
+
+
+class ConnexionLogBuffer:
+    """
+    Écriture différée des logs de connexion: connexions et déconnexions sont
+    accumulées en mémoire (par process) puis écrites en un lot:
+
+    - connexions: un bulk_create;
+    - déconnexions: un UPDATE par lot (CASE sur session_key), puis la durée
+      calculée par la base: duree_connexion = date_deconnexion - date_connexion.
+
+    Vidé quand CONNEXION_LOG_BATCH_SIZE entrées sont en attente, quand la plus
+    ancienne a plus de CONNEXION_LOG_FLUSH_INTERVAL secondes (vérifié à chaque
+    ajout), avant les lectures des logs et à l'arrêt du process. Au pire, un
+    arrêt brutal perd le lot en cours.
+
+    Le tampon est propre au process: une déconnexion peut arriver avant que la
+    connexion (tamponnée par un autre worker) soit écrite. Une déconnexion sans
+    log correspondant est gardée et retentée à chaque écriture pendant
+    CONNEXION_LOG_LOGOUT_RETENTION secondes. Un lot dont l'écriture échoue est
+    remis en attente (erreur journalisée, la requête n'échoue pas).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._logins = []
+        self._logouts = {}  # session_key -> date de déconnexion
+        self._unmatched = {}  # session_key -> (date de déconnexion, abandon après (monotonic))
+        self._oldest = None
+
+    def __len__(self):
+        return len(self._logins) + len(self._logouts)
+
+    def record_login(self, user, token, ip_address=None, user_agent=None):
+        now = timezone.now()
+        with self._lock:
+            self._logins.append(ConnexionLog(
+                user_id=user.pk,
+                date_connexion=now,
+                heure_connexion=timezone.localtime(now).time(),
+                ip_address=ip_address,
+                user_agent=(user_agent or '')[:512] or None,
+                session_key=session_key(token),
+            ))
+            self._touch()
+        self._maybe_flush()
+
+    def record_logout(self, token):
+        with self._lock:
+            self._logouts.setdefault(session_key(token), timezone.now())
+            self._touch()
+        self._maybe_flush()
+
+    def _touch(self):
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    def _maybe_flush(self):
+        batch_size = getattr(settings, 'CONNEXION_LOG_BATCH_SIZE', 100)
+        interval = getattr(settings, 'CONNEXION_LOG_FLUSH_INTERVAL', 5)
+        oldest = self._oldest
+        if len(self) >= batch_size or (oldest is not None and time.monotonic() - oldest >= interval):
+            self.flush()
+
+    def flush(self):
+        """Écrit les entrées en attente; retourne (connexions, déconnexions) écrites."""
+        with self._lock:
+            logins, logouts, unmatched = self._logins, self._logouts, self._unmatched
+            self._logins, self._logouts, self._unmatched, self._oldest = [], {}, {}, None
+        if not logins and not logouts and not unmatched:
+            return 0, 0
+        now = time.monotonic()
+        unmatched = {key: entry for key, entry in unmatched.items() if entry[1] > now}  # rétention écoulée: abandon
+        retried = {key: moment for key, (moment, _deadline) in unmatched.items()}
+        try:
+            with transaction.atomic():
+                if logins:
+                    ConnexionLog.objects.bulk_create(logins, batch_size=500)
+                closed, missing = close_sessions({**retried, **logouts}) if logouts or retried else (0, set())
+        except Exception:
+            logger.exception("Écriture de %d connexions / %d déconnexions reportée", len(logins), len(logouts))
+            self._restore(logins, logouts, unmatched)
+            return 0, 0
+        self._keep_unmatched(missing, logouts, unmatched)
+        return len(logins), closed
+
+    def _restore(self, logins, logouts, unmatched):
+        # Lot annulé: pk éventuellement reçus avant l'annulation effacés, entrées remises en tête
+        for log in logins:
+            log.pk, log._state.adding = None, True
+        with self._lock:
+            self._logins = logins + self._logins
+            self._logouts = {**logouts, **self._logouts}
+            self._unmatched = {**unmatched, **self._unmatched}
+            self._touch()
+
+    def _keep_unmatched(self, missing, logouts, unmatched):
+        now = time.monotonic()
+        retention = getattr(settings, 'CONNEXION_LOG_LOGOUT_RETENTION', 3600)
+        kept = {}
+        for key in missing:
+            if key in logouts:
+                kept[key] = (logouts[key], now + retention)
+            else:
+                kept[key] = unmatched[key]
+        if kept:
+            with self._lock:
+                self._unmatched.update(kept)
+
+
+def close_sessions(logouts):
+    """
+    Ferme les sessions {session_key: date de déconnexion} encore ouvertes en
+    deux UPDATE, quel que soit leur nombre.
+    Retourne (sessions fermées, clés sans aucun log: connexion pas encore écrite).
+    """
+    whens = [When(session_key=key, then=Value(moment)) for key, moment in logouts.items()]
+    time_whens = [
+        When(session_key=key, then=Value(timezone.localtime(moment).time())) for key, moment in logouts.items()
+    ]
+    rows = list(
+        ConnexionLog.objects.filter(session_key__in=list(logouts)).values_list('id', 'session_key', 'date_deconnexion')
+    )
+    missing = set(logouts) - {key for _id, key, _closed in rows}
+    ids = [pk for pk, _key, closed in rows if closed is None]
+    if not ids:
+        return 0, missing
+    ConnexionLog.objects.filter(id__in=ids).update(
+        date_deconnexion=Case(*whens, output_field=DateTimeField()),
+        heure_deconnexion=Case(*time_whens, output_field=TimeField()),
+    )
+    ConnexionLog.objects.filter(id__in=ids).update(duree_connexion=F('date_deconnexion') - F('date_connexion'))
+    return len(ids), missing
+
+
+buffer = ConnexionLogBuffer()
+
+
+# ---------- RÉTENTION / ARCHIVAGE ----------
+ARCHIVE_FIELDS = (
+    'id', 'user_id', 'date_connexion', 'date_deconnexion', 'duree_connexion', 'ip_address', 'user_agent',
+)
+
+
+def archive_path(archive_dir, day):
+    """connexionlog-AAAA-MM-JJ.jsonl.gz (suffixe -1, -2... si le jour a déjà été archivé)."""
+    path = Path(archive_dir) / f"connexionlog-{day:%Y-%m-%d}.jsonl.gz"
+    n = 0
+    while path.exists():
+        n += 1
+        path = Path(archive_dir) / f"connexionlog-{day:%Y-%m-%d}-{n}.jsonl.gz"
+    return path
+
+
+def write_archive(path, rows):
+    """Écrit les lignes en JSON lines gzip (fichier temporaire puis renommage)."""
+    tmp = path.with_name(path.name + '.tmp')
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n')
+    os.replace(tmp, path)
+
+
+def daily_totals(rows):
+    """{user_id: {sessions, closed_sessions, total_duration, first_connexion, last_deconnexion}} pour un jour."""
+    totals = {}
+    for row in rows:
+        t = totals.setdefault(row['user_id'], {
+            'sessions': 0, 'closed_sessions': 0, 'total_duration': timedelta(),
+            'first_connexion': row['date_connexion'], 'last_deconnexion': None,
+        })
+        t['sessions'] += 1
+        if row['duree_connexion'] is not None:
+            t['closed_sessions'] += 1
+            t['total_duration'] += row['duree_connexion']
+        t['first_connexion'] = min(t['first_connexion'], row['date_connexion'])
+        if row['date_deconnexion'] and (t['last_deconnexion'] is None or row['date_deconnexion'] > t['last_deconnexion']):
+            t['last_deconnexion'] = row['date_deconnexion']
+    return totals
+
+
+def merge_daily(day, totals):
+    """Ajoute les totaux du jour aux agrégats existants (re-compactage d'un même jour)."""
+    existing = {d.user_id: d for d in ConnexionLogDaily.objects.filter(day=day, user_id__in=list(totals))}
+    created = []
+    for user_id, t in totals.items():
+        daily = existing.get(user_id)
+        if daily is None:
+            created.append(ConnexionLogDaily(user_id=user_id, day=day, **t))
+            continue
+        daily.sessions += t['sessions']
+        daily.closed_sessions += t['closed_sessions']
+        daily.total_duration += t['total_duration']
+        daily.first_connexion = min(daily.first_connexion, t['first_connexion'])
+        if t['last_deconnexion'] and (daily.last_deconnexion is None or t['last_deconnexion'] > daily.last_deconnexion):
+            daily.last_deconnexion = t['last_deconnexion']
+    ConnexionLogDaily.objects.bulk_create(created)
+    ConnexionLogDaily.objects.bulk_update(
+        list(existing.values()), ['sessions', 'closed_sessions', 'total_duration', 'first_connexion', 'last_deconnexion'],
+    )
+
+
+def compact_logs(cutoff, archive_dir, dry_run=False, stdout=None):
+    """
+    Compacte les logs antérieurs à `cutoff`, jour par jour (heure locale):
+    lignes archivées dans un fichier gzip, agrégées dans ConnexionLogDaily,
+    puis supprimées. Chaque jour est traité dans sa propre transaction, après
+    l'écriture de son archive: une interruption ne perd rien (au pire le jour
+    est ré-archivé sous un autre nom au passage suivant).
+    Retourne {'days': n, 'rows': n}.
+    """
+    buffer.flush()
+    old = ConnexionLog.objects.filter(date_connexion__lt=cutoff)
+    days = list(old.datetimes('date_connexion', 'day'))
+    stats = {'days': 0, 'rows': 0}
+    if not dry_run:
+        Path(archive_dir).mkdir(parents=True, exist_ok=True)
+    for start in days:
+        day_rows = old.filter(date_connexion__gte=start, date_connexion__lt=start + timedelta(days=1))
+        rows = list(day_rows.order_by('date_connexion', 'id').values(*ARCHIVE_FIELDS))
+        stats['days'] += 1
+        stats['rows'] += len(rows)
+        if dry_run or not rows:
+            continue
+        path = archive_path(archive_dir, start.date())
+        write_archive(path, rows)
+        with transaction.atomic():
+            merge_daily(start.date(), daily_totals(rows))
+            ConnexionLog.objects.filter(id__in=[r['id'] for r in rows]).delete()
+        if stdout is not None:
+            stdout.write(f"{start:%Y-%m-%d}: {len(rows)} log(s) -> {path.name}")
+    return stats
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        buffer.flush()
+    except Exception:
+        pass  # base déjà fermée: rien à faire à l'arrêt
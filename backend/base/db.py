@@ -0,0 +1,43 @@
+from django.conf import settings
+
+
+# Fichiers dont le mode de journal a déjà été vérifié dans ce process: NAME -> mode obtenu
+_journal_modes = {}
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Signal connection_created: applique SQLITE_PRAGMAS (busy_timeout, synchronous,
+    cache_size, mmap_size...) à chaque nouvelle connexion SQLite, puis
+    SQLITE_JOURNAL_MODE (ex. WAL) s'il est défini. Le mode de journal étant
+    enregistré dans le fichier, il n'est vérifié qu'une fois par fichier et par
+    process, et changé seulement s'il diffère.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    journal_mode = getattr(settings, 'SQLITE_JOURNAL_MODE', '').lower()
+    name = connection.settings_dict['NAME']
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        if not journal_mode or _journal_modes.get(name) == journal_mode:
+            return
+        cursor.execute("PRAGMA journal_mode")
+        current = cursor.fetchone()[0]
+        if current != journal_mode:
+            cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+            current = cursor.fetchone()[0]
+        _journal_modes[name] = current
+
+
+def sqlite_pragma_values(connection, names=None):
+    """Valeurs effectives des pragmas (diagnostic / commande loadtest_writes)."""
+    names = names or [*getattr(settings, 'SQLITE_PRAGMAS', {}), 'journal_mode']
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f"PRAGMA {name}")
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
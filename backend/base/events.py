@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+
+# Événement envoyé à un abonné qui a raté des messages (file pleine, journal tronqué):
+# le client se resynchronise via /api/changes/
+RESYNC = {'op': 'resync'}
+
+
+class Subscription:
+    """
+    File d'événements d'un client SSE, liée à la boucle asyncio qui la lit.
+    Les publications arrivent depuis n'importe quel thread (vues synchrones
+    exécutées hors de la boucle sous ASGI): call_soon_threadsafe.
+    """
+
+    def __init__(self, loop, size, models=None):
+        self.loop = loop
+        self.models = set(models) if models else None
+        self.queue = asyncio.Queue(size)
+
+    def push(self, events):
+        if self.models is not None:
+            events = [e for e in events if e.get('model') in self.models or e is RESYNC]
+        if not events:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, events)
+        except RuntimeError:
+            pass  # boucle fermée: client déjà parti
+
+    def _put(self, events):
+        try:
+            self.queue.put_nowait(events)
+        except asyncio.QueueFull:
+            # Client trop lent: on jette son retard et on lui demande de se resynchroniser
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait([RESYNC])
+
+    async def get(self, timeout):
+        """Prochain lot d'événements, ou None après `timeout` secondes sans rien."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBackend:
+    """Bus en mémoire: un seul processus (runserver, un worker uvicorn)."""
+
+    def __init__(self, queue_size=100, **options):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, models=None):
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size, models)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, events):
+        self.dispatch(events)
+
+    def dispatch(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(events)
+
+
+class FileBackend(LocalBackend):
+    """
+    Plusieurs workers sur une même machine (doublure locale d'un Redis pub/sub):
+    chaque publication est ajoutée en une écriture O_APPEND à un journal JSON
+    lines partagé; un thread par processus, démarré au premier abonné, lit les
+    nouvelles lignes et les distribue aux clients SSE de ce processus.
+    Le journal est remis à zéro au-delà de `max_bytes` (les lecteurs en retard
+    reçoivent RESYNC).
+    """
+
+    def __init__(self, path=None, poll_interval=0.5, max_bytes=1024 * 1024, **options):
+        super().__init__(**options)
+        self.path = path or os.path.join(settings.BASE_DIR, 'events.jsonl')
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._reader = None
+
+    def publish(self, events):
+        line = (json.dumps(events, separators=(',', ':')) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size > self.max_bytes:
+                os.ftruncate(fd, 0)
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def subscribe(self, models=None):
+        subscription = super().subscribe(models)
+        with self._lock:
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._tail, name='events-tail', daemon=True)
+                self._reader.start()
+        return subscription
+
+    def _tail(self):
+        offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        buffer = b''
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                continue
+            if size < offset:  # journal remis à zéro par un autre worker
+                offset, buffer = 0, b''
+                self.dispatch([RESYNC])
+            if size == offset or not self.subscriber_count():
+                offset = size
+                continue
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read(size - offset)
+            offset += len(chunk)
+            *lines, buffer = (buffer + chunk).split(b'\n')
+            for line in lines:
+                try:
+                    self.dispatch(json.loads(line))
+                except ValueError:
+                    continue
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend configuré par EVENTS_BACKEND (chemin de classe) et EVENTS_OPTIONS."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(getattr(settings, 'EVENTS_BACKEND', 'base.events.LocalBackend'))
+                _backend = backend_class(**getattr(settings, 'EVENTS_OPTIONS', {}))
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+class _PendingEvents:
+    """Événements d'une transaction, publiés en un lot après COMMIT."""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self):
+        get_backend().publish(compact(self.events))
+
+
+def compact(events):
+    """
+    Regroupe les événements par (modèle, opération): {"model", "op", "ids"}.
+    Au-delà de EVENTS_MAX_IDS ids, "ids" vaut null (le client recharge le modèle).
+    """
+    limit = getattr(settings, 'EVENTS_MAX_IDS', 100)
+    grouped = defaultdict(dict)  # ids dédoublonnés, ordre conservé
+    for model, op, pk in events:
+        grouped[(model, op)][pk] = None
+    return [
+        {'model': model, 'op': op, 'ids': list(ids) if len(ids) <= limit else None}
+        for (model, op), ids in grouped.items()
+    ]
+
+
+def publish_on_commit(model, op, ids):
+    """
+    Met en file des événements {model, op, ids} publiés au COMMIT (jamais pour
+    une transaction annulée). Une suppression en cascade de milliers de lignes
+    donne un seul message compact.
+    """
+    if not ids or not getattr(settings, 'EVENTS_ENABLED', True):
+        return
+    if not connection.in_atomic_block:
+        get_backend().publish(compact([(model, op, pk) for pk in ids]))
+        return
+    pending = next((entry[1] for entry in connection.run_on_commit if isinstance(entry[1], _PendingEvents)), None)
+    if pending is None:
+        pending = _PendingEvents()
+        transaction.on_commit(pending)
+    pending.events.extend((model, op, pk) for pk in ids)
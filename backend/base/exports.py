@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+# Colonnes exportées: (en-tête, lookup Formulaire.values_list). Les noms
+# d'atelier / d'équipement et les libellés des listes de choix sont joints
+# en SQL (pas d'objets ni de prefetch).
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('date_defaillance', 'date_defaillance'),
+    ('atelier', 'atelier__nom'),
+    ('equipement', 'equipement__nom'),
+    ('heure_debut', 'heure_debut'),
+    ('heure_fin', 'heure_fin'),
+    ('duree_heures', 'heuregen'),
+    ('methode_entretien', 'methode_entretien__label'),
+    ('nature_panne', 'nature_panne__label'),
+    ('cause_panne', 'cause_panne__label'),
+    ('indice_gravite', 'indice_gravite__label'),
+    ('piece_rechange', 'piece_rechange'),
+    ('travaux_effectues', 'travaux_effectues'),
+    ('etat_action_immediate', 'etat_action_immediate__label'),
+    ('pilote', 'pilote'),
+)
+EXPORT_HEADERS = [name for name, _lookup in EXPORT_COLUMNS]
+
+# Premiers caractères qu'Excel / LibreOffice interprètent comme une formule
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_rows(queryset, chunk_size=None):
+    """
+    Tuples des formulaires de `queryset` (du plus récent au plus ancien), lus
+    par lots de `chunk_size` via iterator(): la mémoire reste bornée à un lot
+    quel que soit le nombre de lignes.
+    """
+    lookups = [lookup for _name, lookup in EXPORT_COLUMNS]
+    duration = lookups.index('heuregen')
+    rows = (
+        queryset.order_by('-date_defaillance', '-id')
+        .values_list(*lookups)
+        .iterator(chunk_size=chunk_size or export_chunk_size())
+    )
+    for row in rows:
+        value = row[duration]
+        if isinstance(value, timedelta):
+            row = row[:duration] + (round(value.total_seconds() / 3600, 2),) + row[duration + 1:]
+        yield row
+
+
+def _batched(lines, size):
+    # Regroupe les lignes: moins de petites écritures sur la socket
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def escape_formula(value):
+    """
+    Neutralise une cellule texte lue comme une formule par le tableur (=1+1,
+    @SOMME(...)): préfixée d'une apostrophe. Les champs libres des formulaires
+    sont saisis sans authentification.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(rows, delimiter=None):
+    """
+    CSV (BOM UTF-8 pour Excel, séparateur EXPORT_CSV_DELIMITER) produit au fil
+    des lignes; les cellules texte sont protégées par escape_formula.
+    """
+    delimiter = delimiter or getattr(settings, 'EXPORT_CSV_DELIMITER', ';')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+
+    def lines():
+        writer.writerow(EXPORT_HEADERS)
+        yield '\ufeff' + _drain(buffer)
+        for row in rows:
+            writer.writerow([escape_formula(value) for value in row])
+            yield _drain(buffer)
+
+    return _batched(lines(), 500)
+
+
+def stream_ndjson(rows):
+    """Un objet JSON par ligne (application/x-ndjson)."""
+    def lines():
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_HEADERS, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    return _batched(lines(), 500)
+
+
+def _drain(buffer):
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
@@ -0,0 +1,180 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .lookups import resolve, resolve_iexact
+from .models import EtatActionImmediate, IndiceGravite
+from .text import normalize, prefix_range
+
+
+def parse_date_param(params, name):
+    raw = params.get(name)
+    if not raw:
+        return None
+    value = parse_date(raw)
+    if value is None:
+        raise ValidationError({name: "Date invalide (format attendu: YYYY-MM-DD)."})
+    return value
+
+
+def parse_id_list(params, name):
+    """Accepte ?atelier=3 ou ?atelier=3,4 (ou le paramètre répété)."""
+    raw = [v for chunk in params.getlist(name) for v in chunk.split(',') if v.strip()]
+    try:
+        return [int(v) for v in raw]
+    except ValueError:
+        raise ValidationError({name: "Identifiant(s) invalide(s)."})
+
+
+def filter_formulaires(queryset, params):
+    """
+    Filtres serveur des formulaires (liste, exports...):
+      - from / to : bornes incluses sur date_defaillance
+      - atelier, equipement : id ou liste d'ids séparés par des virgules
+      - indice_gravite (alias gravite) : valeur exacte
+      - etat_action_immediate : valeur exacte (insensible à la casse)
+    """
+    date_from = parse_date_param(params, 'from')
+    date_to = parse_date_param(params, 'to')
+    if date_from:
+        queryset = queryset.filter(date_defaillance__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date_defaillance__lte=date_to)
+
+    for name in ('atelier', 'equipement'):
+        ids = parse_id_list(params, name)
+        if len(ids) == 1:
+            queryset = queryset.filter(**{f"{name}_id": ids[0]})
+        elif ids:
+            queryset = queryset.filter(**{f"{name}_id__in": ids})
+
+    # Libellés traduits en ids par le cache des listes (filtre sur un entier, sans jointure)
+    gravite = params.get('indice_gravite') or params.get('gravite')
+    if gravite:
+        pk = resolve(IndiceGravite, gravite)
+        queryset = queryset.filter(indice_gravite_id=pk) if pk is not None else queryset.none()
+
+    etat = params.get('etat_action_immediate')
+    if etat:
+        queryset = queryset.filter(etat_action_immediate_id__in=resolve_iexact(EtatActionImmediate, etat))
+    return queryset
+
+
+def _day_start(d):
+    return timezone.make_aware(datetime.combine(d, time.min))
+
+
+def filter_connexion_logs(queryset, params):
+    """
+    Filtres des logs: user (id), from / to sur date_connexion.
+    Les dates sont converties en bornes datetime pour rester indexables.
+    """
+    date_from = parse_date_param(params, 'from')
+    date_to = parse_date_param(params, 'to')
+    if date_from:
+        queryset = queryset.filter(date_connexion__gte=_day_start(date_from))
+    if date_to:
+        queryset = queryset.filter(date_connexion__lt=_day_start(date_to + timedelta(days=1)))
+    ids = parse_id_list(params, 'user')
+    if ids:
+        queryset = queryset.filter(user_id__in=ids)
+    return queryset
+
+
+def filter_rollups(queryset, params):
+    """Filtres des agrégats: period (day|month), from / to sur period_start, atelier, equipement."""
+    queryset = queryset.filter(period=params.get('period') or 'month')
+    date_from = parse_date_param(params, 'from')
+    date_to = parse_date_param(params, 'to')
+    if date_from:
+        queryset = queryset.filter(period_start__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(period_start__lte=date_to)
+    model_fields = {f.name for f in queryset.model._meta.get_fields()}
+    for name in ('atelier', 'equipement'):
+        if name not in model_fields:
+            continue
+        ids = parse_id_list(params, name)
+        if ids:
+            queryset = queryset.filter(**{f"{name}_id__in": ids})
+    return queryset
+
+
+# ?ordering= des stocks -> tri keyset (dernier champ unique)
+STOCK_ORDERINGS = {
+    'reference': ('reference',),
+    '-reference': ('-reference',),
+    'element': ('element_norm', 'reference'),
+    '-element': ('-element_norm', '-reference'),
+    'quantite': ('quantite', 'reference'),
+    '-quantite': ('-quantite', '-reference'),
+}
+
+
+def stock_ordering(params):
+    ordering = params.get('ordering') or 'reference'
+    if ordering not in STOCK_ORDERINGS:
+        raise ValidationError({'ordering': f"Tri invalide (valeurs: {', '.join(STOCK_ORDERINGS)})."})
+    return STOCK_ORDERINGS[ordering]
+
+
+def filter_stocks(queryset, params):
+    """
+    Filtres des stocks:
+      - q : préfixe de la référence ou de l'élément (insensible à la casse et aux accents)
+      - low_stock=1 : quantite <= threshold (défaut DASHBOARD_LOW_STOCK_THRESHOLD)
+      - ordering : reference, element, quantite (préfixe '-' pour l'ordre inverse)
+    """
+    q = normalize((params.get('q') or '').strip())
+    if q:
+        queryset = queryset.filter(Q(**prefix_range('reference_norm', q)) | Q(**prefix_range('element_norm', q)))
+
+    if params.get('low_stock') in ('1', 'true', 'True'):
+        raw = params.get('threshold')
+        try:
+            threshold = int(raw) if raw else getattr(settings, 'DASHBOARD_LOW_STOCK_THRESHOLD', 2)
+        except ValueError:
+            raise ValidationError({'threshold': "Seuil invalide."})
+        queryset = queryset.filter(quantite__lte=threshold)
+    return queryset.order_by(*stock_ordering(params))
+
+
+def filter_stock_movements(queryset, params):
+    """Filtres du journal: stock (id ou liste), kind, from / to sur created_at."""
+    ids = parse_id_list(params, 'stock')
+    if ids:
+        queryset = queryset.filter(stock_id__in=ids)
+    if params.get('kind'):
+        queryset = queryset.filter(kind=params['kind'])
+    date_from = parse_date_param(params, 'from')
+    date_to = parse_date_param(params, 'to')
+    if date_from:
+        queryset = queryset.filter(created_at__gte=_day_start(date_from))
+    if date_to:
+        queryset = queryset.filter(created_at__lt=_day_start(date_to + timedelta(days=1)))
+    return queryset
+
+
+class FormulaireFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_formulaires(queryset, request.query_params)
+
+
+class ConnexionLogFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_connexion_logs(queryset, request.query_params)
+
+
+class RollupFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_rollups(queryset, request.query_params)
+
+
+class StockFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_stocks(queryset, request.query_params)
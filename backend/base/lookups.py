@@ -0,0 +1,138 @@
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from .models import CausePanne, EtatActionImmediate, IndiceGravite, MethodeEntretien, NaturePanne
+
+
+# Champ de Formulaire -> liste de choix (l'API expose le libellé)
+LOOKUP_FIELDS = {
+    'methode_entretien': MethodeEntretien,
+    'nature_panne': NaturePanne,
+    'cause_panne': CausePanne,
+    'indice_gravite': IndiceGravite,
+    'etat_action_immediate': EtatActionImmediate,
+}
+
+_lock = threading.Lock()
+_tables = {}  # modèle -> {id: libellé}, lignes validées uniquement
+
+
+class _Invalidate:
+    """Vide le cache des listes modifiées par une transaction, après COMMIT."""
+
+    def __init__(self):
+        self.models = set()
+
+    def __call__(self):
+        for model in self.models:
+            invalidate(model)
+
+
+def _pending():
+    return next((entry[1] for entry in connection.run_on_commit if isinstance(entry[1], _Invalidate)), None)
+
+
+def changed(model):
+    """
+    Appelé par les signaux des listes de choix. Tant que la transaction qui les
+    modifie est ouverte, les tables sont relues en base sans être mises en
+    cache (une annulation ne laisse pas d'id fantôme).
+    """
+    invalidate(model)
+    if connection.in_atomic_block:
+        pending = _pending()
+        if pending is None:
+            pending = _Invalidate()
+            transaction.on_commit(pending)
+        pending.models.add(model)
+
+
+def invalidate(model=None):
+    with _lock:
+        if model is None:
+            _tables.clear()
+        else:
+            _tables.pop(model, None)
+
+
+def table(model, refresh=False):
+    """{id: libellé} de la liste, lu une fois par process (quelques lignes)."""
+    rows = None if refresh else _tables.get(model)
+    if rows is None:
+        rows = dict(model.objects.values_list('id', 'label'))
+        pending = _pending()
+        if pending is None or model not in pending.models:
+            with _lock:
+                _tables[model] = rows
+    return rows
+
+
+def label(model, pk):
+    if pk is None:
+        return None
+    rows = table(model)
+    if pk not in rows:
+        rows = table(model, refresh=True)  # ajoutée par un autre worker
+    return rows.get(pk)
+
+
+def resolve(model, value, create=False):
+    """Id du libellé `value` (exact), créé si `create`; None si inconnu."""
+    for refresh in (False, True):
+        for pk, text in table(model, refresh=refresh).items():
+            if text == value:
+                return pk
+    if not create:
+        return None
+    try:
+        with transaction.atomic():
+            obj = model.objects.create(label=value)
+    except IntegrityError:  # créé en parallèle
+        obj = model.objects.get(label=value)
+    return obj.pk
+
+
+def resolve_iexact(model, value):
+    """Ids dont le libellé vaut `value` sans tenir compte de la casse."""
+    value = value.casefold()
+    return [pk for pk, text in table(model).items() if text.casefold() == value]
+
+
+def find(model, value):
+    """Id du libellé `value`: exact, sinon sans tenir compte de la casse; None si inconnu."""
+    pk = resolve(model, value)
+    if pk is None:
+        pk = next(iter(resolve_iexact(model, value)), None)
+    return pk
+
+
+def auto_create():
+    return getattr(settings, 'FORMULAIRE_CHOICES_AUTO_CREATE', False)
+
+
+def save_missing(choices):
+    """
+    Enregistre les libellés nouveaux ({champ: instance sans id}, rendus par la
+    validation si FORMULAIRE_CHOICES_AUTO_CREATE). À appeler dans la transaction
+    qui écrit le formulaire: un formulaire refusé ne laisse aucune valeur.
+    """
+    for field, model in LOOKUP_FIELDS.items():
+        choice = choices.get(field)
+        if choice is not None and choice.pk is None:
+            # Le même libellé (casse comprise) a pu être créé par un élément précédent du lot
+            choice.pk = find(model, choice.label) or resolve(model, choice.label, create=True)
+    return choices
+
+
+def instance_label(instance, field):
+    return label(LOOKUP_FIELDS[field], getattr(instance, f"{field}_id"))
+
+
+def with_labels(row, fields=LOOKUP_FIELDS):
+    """Remplace les ids des listes de choix d'une ligne values() par leurs libellés."""
+    for field in fields:
+        if field in row:
+            row[field] = label(LOOKUP_FIELDS[field], row[field])
+    return row
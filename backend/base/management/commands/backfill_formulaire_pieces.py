@@ -0,0 +1,90 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base.models import Formulaire, FormulairePiece
+from base.parts import StockMatcher, parse_pieces
+from base.stock import InsufficientStock, apply_movements
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée les lignes FormulairePiece des formulaires existants en analysant le texte "
+        "libre piece_rechange (les formulaires ayant déjà des pièces sont ignorés)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Analyse seulement, aucune écriture")
+        parser.add_argument(
+            '--decrement-stock', action='store_true',
+            help="Sortir aussi les pièces du stock (par défaut l'historique ne touche pas aux quantités); "
+                 "un formulaire dont une pièce manque en stock est laissé sans pièces",
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help="Taille des lots bulk_create")
+
+    def handle(self, *args, **options):
+        matcher = StockMatcher()
+        batch_size = options['batch_size']
+        stats = Counter()
+        unmatched = Counter()
+        batch = []
+
+        formulaires = (
+            Formulaire.objects.filter(pieces__isnull=True)
+            .exclude(piece_rechange='')
+            .order_by('id')
+            .values_list('id', 'piece_rechange')
+        )
+        for form_id, text in formulaires.iterator(chunk_size=batch_size):
+            stats['formulaires'] += 1
+            found, missing = parse_pieces(text, matcher)
+            unmatched.update(missing)
+            if not found:
+                continue
+            stats['lies'] += 1
+            batch.append((form_id, found))
+            if len(batch) >= batch_size:
+                self.flush(batch, options, stats)
+                batch = []
+        if batch:
+            self.flush(batch, options, stats)
+
+        prefix = "[simulation] " if options['dry_run'] else ""
+        self.stdout.write(
+            f"{prefix}{stats['formulaires']} formulaire(s) analysé(s), {stats['lies']} avec pièce(s) reconnue(s), "
+            f"{stats['pieces']} ligne(s) créée(s), {stats['stock_insuffisant']} formulaire(s) ignoré(s) (stock insuffisant)"
+        )
+        if unmatched:
+            self.stdout.write(f"Libellés non reconnus ({sum(unmatched.values())}), les plus fréquents:")
+            for label, count in unmatched.most_common(20):
+                self.stdout.write(f"  {count:>5}  {label}")
+        self.stdout.write(self.style.SUCCESS("Terminé"))
+
+    def flush(self, batch, options, stats):
+        if options['dry_run']:
+            stats['pieces'] += sum(len(found) for _id, found in batch)
+            return
+        if not options['decrement_stock']:
+            FormulairePiece.objects.bulk_create([
+                FormulairePiece(formulaire_id=form_id, stock_id=pk, quantite=q)
+                for form_id, found in batch for pk, q in found.items()
+            ])
+            stats['pieces'] += sum(len(found) for _id, found in batch)
+            return
+        # Pièces et sortie de stock ensemble, par formulaire: stock insuffisant => aucune pièce créée
+        for form_id, found in batch:
+            try:
+                with transaction.atomic():
+                    FormulairePiece.objects.bulk_create([
+                        FormulairePiece(formulaire_id=form_id, stock_id=pk, quantite=q) for pk, q in found.items()
+                    ])
+                    apply_movements(
+                        [{'stock': pk, 'delta': -q, 'motif': f"Formulaire #{form_id} (reprise)"}
+                         for pk, q in found.items()],
+                        formulaire_id=form_id,
+                    )
+            except InsufficientStock:
+                stats['stock_insuffisant'] += 1
+            else:
+                stats['pieces'] += len(found)
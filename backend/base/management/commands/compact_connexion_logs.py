@@ -0,0 +1,32 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.connexions import compact_logs
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive (gzip JSON lines, un fichier par jour) puis supprime les logs de connexion plus vieux "
+        "que la rétention, en gardant un agrégat journalier par compte (ConnexionLogDaily)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Rétention en jours (défaut: CONNEXION_LOG_RETENTION_DAYS)")
+        parser.add_argument('--archive-dir', default=None,
+                            help="Dossier des archives (défaut: CONNEXION_LOG_ARCHIVE_DIR)")
+        parser.add_argument('--dry-run', action='store_true', help="Compter sans rien écrire ni supprimer")
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else getattr(settings, 'CONNEXION_LOG_RETENTION_DAYS', 90)
+        archive_dir = options['archive_dir'] or getattr(settings, 'CONNEXION_LOG_ARCHIVE_DIR')
+        # Coupure à minuit (heure locale): un jour n'est jamais compacté à moitié
+        cutoff = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=days), time.min))
+        stats = compact_logs(cutoff, archive_dir, dry_run=options['dry_run'], stdout=self.stdout)
+        verb = "à compacter" if options['dry_run'] else "compactés"
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['rows']} log(s) sur {stats['days']} jour(s) {verb} (avant le {cutoff:%Y-%m-%d})"
+        ))
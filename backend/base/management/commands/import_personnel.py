@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.onboarding import PROFILE_MODELS, onboard_personnel, parse_rows
+
+
+class Command(BaseCommand):
+    help = "Importe des techniciens/admins depuis un fichier CSV ou JSON (création en lot)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier .csv ou .json")
+        parser.add_argument('--role', choices=list(PROFILE_MODELS), default='technicien',
+                            help="Rôle par défaut si la colonne 'role' est absente")
+        parser.add_argument('--format', choices=['csv', 'json'], default=None,
+                            help="Format (déduit de l'extension par défaut)")
+        parser.add_argument('--strict', action='store_true', help="Ne rien créer si une ligne est rejetée")
+        parser.add_argument('--dry-run', action='store_true', help="Valider sans rien créer")
+        parser.add_argument('--no-email', action='store_true', help="Ne pas mettre les emails d'identifiants en file")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"Fichier introuvable: {path}")
+        fmt = options['format'] or ('json' if path.suffix.lower() == '.json' else 'csv')
+        try:
+            rows = parse_rows(path.read_text(encoding='utf-8-sig'), fmt)
+            report = onboard_personnel(
+                rows,
+                default_role=options['role'],
+                strict=options['strict'],
+                dry_run=options['dry_run'],
+                send_emails=not options['no_email'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for item in report['created']:
+            self.stdout.write(f"+ ligne {item['row']}: {item['email']} ({item['role']}) {item.get('username', '')}")
+        for item in report['rejected']:
+            self.stdout.write(self.style.WARNING(
+                f"- ligne {item['row']}: {json.dumps(item['errors'], ensure_ascii=False)}"
+            ))
+        verb = "validées" if options['dry_run'] else "créées"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(report['created'])} ligne(s) {verb}, {len(report['rejected'])} rejetée(s)"
+        ))
@@ -0,0 +1,195 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+
+def _quantile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _setup_child():
+    # Processus "spawn" (Windows / macOS): Django doit être initialisé dans l'enfant
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _write_worker(payload, count):
+    """Crée `count` formulaires via l'API; retourne (latences OK, erreurs)."""
+    _setup_child()
+    from django.test import Client
+
+    client = Client(HTTP_HOST='localhost')
+    latencies, errors = [], Counter()
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                response = client.post('/api/formulaires/', payload, content_type='application/json')
+                error = None if response.status_code == 201 else f"HTTP {response.status_code}"
+            except Exception as e:  # "database is locked" & co
+                error = f"{type(e).__name__}: {str(e)[:80]}"
+            if error:
+                errors[error] += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+    finally:
+        connections.close_all()
+    return latencies, errors
+
+
+def _read_worker(stop_at):
+    """Lit /api/dashboard/summary/ en boucle jusqu'à `stop_at` (time.time())."""
+    _setup_child()
+    from django.test import Client
+
+    client = Client(HTTP_HOST='localhost')
+    latencies, errors = [], Counter()
+    try:
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                if client.get('/api/dashboard/summary/').status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors[f"lecture {type(e).__name__}: {str(e)[:80]}"] += 1
+    finally:
+        connections.close_all()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge local: N écrivains créent des formulaires via l'API pendant que "
+        "des lecteurs interrogent le tableau de bord, sur la base configurée (DB_ENGINE). "
+        "Les données créées sont supprimées à la fin (sauf --keep)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Écrivains (créent des formulaires)")
+        parser.add_argument('--readers', type=int, default=2, help="Lecteurs de /api/dashboard/summary/")
+        parser.add_argument('--writes', type=int, default=50, help="Formulaires créés par écrivain")
+        parser.add_argument(
+            '--mode', choices=['process', 'thread'], default='process',
+            help="process (défaut): un processus par client, comme des workers gunicorn; "
+                 "thread: même processus (limité par le GIL)",
+        )
+        parser.add_argument('--keep', action='store_true', help="Conserver les données créées")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        from base.db import sqlite_pragma_values
+        from base.models import Atelier, Equipement
+
+        tag = f"LOADTEST-{uuid.uuid4().hex[:8]}"
+        atelier = Atelier.objects.create(nom=tag)
+        equipement = Equipement.objects.create(nom=f"{tag}-EQ", atelier=atelier)
+        payload = {
+            'atelier': atelier.id, 'equipement': equipement.id,
+            'date_defaillance': date.today().isoformat(), 'heure_debut': '08:00', 'heure_fin': '09:30',
+            'methode_entretien': 'curatif', 'nature_panne': 'test de charge', 'cause_panne': 'usure',
+            'indice_gravite': '2', 'piece_rechange': '-', 'travaux_effectues': 'aucun',
+            'etat_action_immediate': 'Fait', 'pilote': tag,
+        }
+        # Les enfants ne doivent pas hériter d'une connexion ouverte
+        connections.close_all()
+
+        started = time.perf_counter()
+        if options['mode'] == 'process':
+            write_results, read_results = self.run_processes(payload, options)
+        else:
+            write_results, read_results = self.run_threads(payload, options)
+        wall = time.perf_counter() - started
+
+        write_latencies = [x for lat, _e in write_results for x in lat]
+        read_latencies = [x for lat, _e in read_results for x in lat]
+        errors = Counter()
+        for _lat, err in write_results + read_results:
+            errors.update(err)
+
+        db = settings.DATABASES['default']
+        report = {
+            'engine': db['ENGINE'].rsplit('.', 1)[-1],
+            'mode': options['mode'],
+            'conn_max_age': db.get('CONN_MAX_AGE'),
+            'transaction_mode': db.get('OPTIONS', {}).get('transaction_mode'),
+            'pragmas': sqlite_pragma_values(connection) if connection.vendor == 'sqlite' else None,
+            'writers': options['writers'],
+            'readers': options['readers'],
+            'seconds': round(wall, 3),
+            'writes_ok': len(write_latencies),
+            'writes_failed': sum(v for k, v in errors.items() if not k.startswith('lecture')),
+            'writes_per_second': round(len(write_latencies) / wall, 1) if wall else 0,
+            'write_ms': {
+                'p50': round(_quantile(write_latencies, 0.5) * 1000, 1),
+                'p95': round(_quantile(write_latencies, 0.95) * 1000, 1),
+                'max': round(max(write_latencies, default=0) * 1000, 1),
+            },
+            'reads_ok': len(read_latencies),
+            'read_ms_p95': round(_quantile(read_latencies, 0.95) * 1000, 1),
+            'errors': dict(errors),
+        }
+
+        if not options['keep']:
+            atelier.delete()  # cascade: équipement, formulaires (et leurs agrégats / index)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+            return
+        self.stdout.write(f"Base: {report['engine']} (CONN_MAX_AGE={report['conn_max_age']}, "
+                          f"transaction_mode={report['transaction_mode']}, mode={report['mode']})")
+        if report['pragmas']:
+            self.stdout.write("Pragmas: " + ", ".join(f"{k}={v}" for k, v in report['pragmas'].items()))
+        self.stdout.write(
+            f"{report['writes_ok']} écriture(s) en {report['seconds']}s "
+            f"= {report['writes_per_second']}/s (p50 {report['write_ms']['p50']} ms, "
+            f"p95 {report['write_ms']['p95']} ms, max {report['write_ms']['max']} ms)"
+        )
+        self.stdout.write(f"{report['reads_ok']} lecture(s) du tableau de bord, p95 {report['read_ms_p95']} ms")
+        if errors:
+            self.stdout.write(self.style.WARNING("Erreurs:"))
+            for error, count in errors.most_common():
+                self.stdout.write(f"  {count:>5}  {error}")
+        else:
+            self.stdout.write(self.style.SUCCESS("Aucune erreur (pas de 'database is locked')"))
+
+    def run_processes(self, payload, options):
+        writers, readers = options['writers'], options['readers']
+        with multiprocessing.Pool(writers + readers) as pool:
+            # Les lecteurs tournent jusqu'à la fin estimée des écritures (bornée)
+            reads = [pool.apply_async(_read_worker, (time.time() + 2 + options['writes'] * 0.05,)) for _ in range(readers)]
+            writes = [pool.apply_async(_write_worker, (payload, options['writes'])) for _ in range(writers)]
+            return [w.get() for w in writes], [r.get() for r in reads]
+
+    def run_threads(self, payload, options):
+        write_results, read_results = [], []
+        stop = {'at': time.time() + 3600}
+
+        def collect(target, results, *args):
+            results.append(target(*args))
+
+        writers = [threading.Thread(target=collect, args=(_write_worker, write_results, payload, options['writes']))
+                   for _ in range(options['writers'])]
+        readers = [threading.Thread(target=lambda: read_results.append(_read_worker(stop['at'])))
+                   for _ in range(options['readers'])]
+        for t in readers + writers:
+            t.start()
+        for t in writers:
+            t.join()
+        stop['at'] = 0
+        for t in readers:
+            t.join()
+        return write_results, read_results
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from base.sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les traces de suppression (Tombstone) plus vieilles que SYNC_TOMBSTONE_RETENTION_DAYS; "
+        "un client dont le curseur est plus ancien recharge ses listes complètes"
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Tombstones supprimés: {purge_tombstones()}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from base.rollups import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les agrégats de fiabilité (EquipementRollup, AtelierRollup) depuis les formulaires"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Taille des lots bulk_create")
+
+    def handle(self, *args, **options):
+        totals = rebuild_all(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Rollups reconstruits: {sum(totals.values())} lignes"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from base.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des formulaires (FTS5 ou index Python)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Taille des lots d'indexation")
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Index de recherche reconstruit: {total} formulaire(s)"))
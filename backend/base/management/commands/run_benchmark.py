@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.benchmark import compare, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure chaque route GET de base.urls via le client de test (latence, requêtes SQL, "
+        "taille de réponse) et écrit le résultat en JSON pour comparer deux commits. "
+        "Données: voir seed_benchmark_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5, help="Appels à chaud par URL (plus un à froid)")
+        parser.add_argument('--only', nargs='*', help="Ne mesurer que les routes dont le nom contient ces motifs")
+        parser.add_argument('--full-lists', action='store_true',
+                            help="Listes complètes non paginées (ancien comportement) au lieu de page_size=50")
+        parser.add_argument('--output', help="Fichier JSON de sortie (défaut: sortie standard)")
+        parser.add_argument('--compare', help="Résultat JSON précédent à comparer")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Hausse de p50 tolérée (0.2 = 20 %%)")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Code de sortie non nul si une régression est détectée")
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            iterations=options['iterations'],
+            only=options['only'],
+            full_lists=options['full_lists'],
+            stdout=self.stderr if not options['output'] else self.stdout,
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"{len(report['results'])} mesure(s) écrites dans {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+
+        for skipped in report['skipped']:
+            self.stderr.write(f"Ignorée: {skipped['name']} ({skipped['reason']})")
+
+        if not options['compare']:
+            return
+        with open(options['compare'], encoding='utf-8') as f:
+            previous = json.load(f)
+        regressions = compare(previous, report, options['threshold'])
+        out = self.stderr if not options['output'] else self.stdout
+        if not regressions:
+            out.write(self.style.SUCCESS(f"Aucune régression par rapport à {previous['meta'].get('commit') or options['compare']}"))
+            return
+        out.write(self.style.WARNING(f"{len(regressions)} régression(s):"))
+        for r in regressions:
+            out.write(
+                f"  {r['p50_before']:>9.2f} -> {r['p50_after']:>9.2f} ms ({r['change']:+.1f} %), "
+                f"requêtes {r['queries_before']} -> {r['queries_after']}  {r['url']}"
+            )
+        if options['fail_on_regression']:
+            raise CommandError("Régression de performance détectée")
@@ -0,0 +1,238 @@
+import random
+import time as _time
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from base.cache_utils import DASHBOARD_CACHE_NAMESPACE, bump_version
+from base.lookups import resolve
+from base.models import (
+    Admin, Atelier, CausePanne, ConnexUser, ConnexionLog, Equipement, EtatActionImmediate, Formulaire, IndiceGravite,
+    MethodeEntretien, NaturePanne, Stock, Technicien,
+)
+from base.rollups import rebuild_all
+from base.search import rebuild_index
+from base.text import normalize
+
+
+PREFIX = "BENCH"
+BENCH_PASSWORD = "bench"  # mot de passe commun des comptes générés (bench.admin, bench.tech00001...)
+
+# Mêmes listes que FormPage.jsx
+METHODES = ["Dépannage", "Réparation", "Amélioration", "Entretien préventif conditionnel", "Entretien systématique"]
+CAUSES = ["Manque d'entretien", "Surcharges", "Mauvaise manipulation", "Cause de conception inadéquate",
+          "Incident imprévisible", "Re-Works", "Durée de vie"]
+GRAVITES = [
+    "Intervention programmable dans le mois",
+    "Intervention programmable dans la semaine",
+    "Intervention nécessaire dans les 48 heures",
+    "Intervention nécessaire dans les heures qui suivent (risque de perte de production)",
+    "Intervention immédiate (Perte de production)",
+]
+NATURES_PANNE = ["Origine électrique", "Origine Mécanique", "Origine lubrification",
+                 "Origine pneumatique ou hydraulique", "Origine conception générale machine"]
+ETATS_IMMEDIAT = ["Non traité", "En cours", "Fait"]
+PIECES = ["Roulement", "Courroie", "Filtre", "Joint", "Moteur", "Capteur", "Vérin", "Fusible",
+          "Contacteur", "Pignon", "Chaîne", "Électrovanne", "Graisseur", "Accouplement"]
+TRAVAUX = ["Remplacement", "Réglage", "Nettoyage", "Graissage", "Resserrage", "Contrôle", "Soudure"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données synthétique et reproductible (--seed) pour les benchmarks: "
+        "ateliers, équipements, formulaires, logs de connexion, stock, par bulk_create en lots. "
+        "À lancer sur une base dédiée (ex. DB_NAME=/tmp/bench.sqlite3 python manage.py migrate)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ateliers', type=int, default=50)
+        parser.add_argument('--equipements', type=int, default=2000)
+        parser.add_argument('--formulaires', type=int, default=1_000_000)
+        parser.add_argument('--connexion-logs', type=int, default=100_000)
+        parser.add_argument('--stocks', type=int, default=10_000)
+        parser.add_argument('--techniciens', type=int, default=200)
+        parser.add_argument('--scale', type=float, default=1.0, help="Multiplie tous les volumes (ex. 0.01)")
+        parser.add_argument('--days', type=int, default=3 * 365, help="Profondeur de l'historique en jours")
+        parser.add_argument('--seed', type=int, default=42, help="Graine du générateur (données identiques)")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Taille des lots bulk_create")
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Ne pas reconstruire l'index de recherche ni les rollups")
+
+    def handle(self, *args, **options):
+        if Atelier.objects.filter(nom__startswith=f"{PREFIX}-").exists():
+            raise CommandError(
+                "Des données de benchmark existent déjà: utiliser une base dédiée "
+                "(DB_NAME=... python manage.py migrate) plutôt que de les empiler."
+            )
+        scale = options['scale']
+        counts = {
+            name: max(1, int(options[name] * scale))
+            for name in ('ateliers', 'equipements', 'formulaires', 'connexion_logs', 'stocks', 'techniciens')
+        }
+        counts['equipements'] = max(counts['equipements'], counts['ateliers'])
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = timezone.localdate()
+        self.days = options['days']
+
+        started = _time.perf_counter()
+        ateliers, equipements = self.step("Ateliers / équipements", self.seed_ateliers, counts)
+        stocks = self.step("Stock", self.seed_stocks, counts['stocks'])
+        users = self.step("Comptes", self.seed_users, counts['techniciens'])
+        self.step("Formulaires", self.seed_formulaires, counts['formulaires'], equipements, stocks, users)
+        self.step("Logs de connexion", self.seed_connexion_logs, counts['connexion_logs'], users)
+
+        if not options['skip_derived']:
+            self.step("Index de recherche", rebuild_index, batch_size=self.batch_size)
+            self.step("Rollups", rebuild_all, batch_size=self.batch_size)
+        # bulk_create n'émet pas post_save: invalider le tableau de bord à la main
+        bump_version(DASHBOARD_CACHE_NAMESPACE)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Données générées en {:.1f}s: {}".format(
+                _time.perf_counter() - started, ", ".join(f"{v} {k}" for k, v in counts.items()),
+            )
+        ))
+
+    def step(self, label, func, *args, **kwargs):
+        start = _time.perf_counter()
+        result = func(*args, **kwargs)
+        self.stdout.write(f"{label}: {_time.perf_counter() - start:.1f}s")
+        return result
+
+    def bulk(self, model, rows):
+        """Insère un flux d'objets par lots (mémoire bornée à un lot)."""
+        batch, total = [], 0
+        for obj in rows:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            total += len(batch)
+        return total
+
+    def ids(self, queryset):
+        return list(queryset.order_by('id').values_list('id', flat=True))
+
+    # ---------- RÉFÉRENTIELS ----------
+    def seed_ateliers(self, counts):
+        self.bulk(Atelier, (Atelier(nom=f"{PREFIX}-A{i:03d}") for i in range(1, counts['ateliers'] + 1)))
+        ateliers = self.ids(Atelier.objects.filter(nom__startswith=f"{PREFIX}-"))
+        self.bulk(Equipement, (
+            Equipement(nom=f"{PREFIX}-E{i:05d}", atelier_id=ateliers[i % len(ateliers)])
+            for i in range(counts['equipements'])
+        ))
+        equipements = list(
+            Equipement.objects.filter(nom__startswith=f"{PREFIX}-").order_by('id').values_list('id', 'atelier_id')
+        )
+        return ateliers, equipements
+
+    def seed_stocks(self, count):
+        def rows():
+            for i in range(1, count + 1):
+                reference = f"{PREFIX}-{i:06d}"
+                element = f"{self.rng.choice(PIECES)} {self.rng.randint(1, 400)}"
+                yield Stock(
+                    reference=reference, element=element, quantite=self.rng.randint(0, 50),
+                    # bulk_create ne passe pas par Stock.save()
+                    reference_norm=normalize(reference), element_norm=normalize(element),
+                )
+        self.bulk(Stock, rows())
+        return list(Stock.objects.filter(reference__startswith=f"{PREFIX}-").values_list('reference', flat=True))
+
+    def seed_users(self, count):
+        # bulk_create ne passe pas par save(): ConnexUser créés ici, un seul hachage pour tous
+        password = make_password(BENCH_PASSWORD)
+        birth = datetime(1985, 1, 1).date()
+        admin = Admin.objects.bulk_create([
+            Admin(nom="Admin", prenom="Bench", email="admin@bench.local", date_naissance=birth)
+        ])[0]
+        if admin.pk is None:
+            admin = Admin.objects.get(email="admin@bench.local")
+        self.bulk(Technicien, (
+            Technicien(nom=f"Tech{i:05d}", prenom="Bench", email=f"tech{i:05d}@bench.local", date_naissance=birth)
+            for i in range(1, count + 1)
+        ))
+        techniciens = self.ids(Technicien.objects.filter(email__endswith="@bench.local"))
+        users = [ConnexUser(username="bench.admin", password=password, role='admin', admin_id=admin.pk)]
+        users += [
+            ConnexUser(username=f"bench.tech{i:05d}", password=password, role='technicien', technicien_id=pk)
+            for i, pk in enumerate(techniciens, start=1)
+        ]
+        self.bulk(ConnexUser, users)
+        return self.ids(ConnexUser.objects.filter(username__startswith="bench."))
+
+    # ---------- HISTORIQUE ----------
+    def seed_formulaires(self, count, equipements, stocks, users):
+        rng = self.rng
+        # Quelques équipements concentrent la plupart des pannes (distribution de Pareto)
+        weights = [rng.paretovariate(1.2) for _ in equipements]
+        pilotes = [f"Tech{i:05d} Bench" for i in range(1, len(users))] or ["Bench"]
+        # Listes de choix: libellé -> id (créées par la migration 0017, complétées au besoin)
+        methodes, natures, causes, gravites, etats = (
+            {label: resolve(model, label, create=True) for label in labels}
+            for model, labels in (
+                (MethodeEntretien, METHODES), (NaturePanne, NATURES_PANNE), (CausePanne, CAUSES),
+                (IndiceGravite, GRAVITES), (EtatActionImmediate, ETATS_IMMEDIAT),
+            )
+        )
+
+        def rows():
+            remaining = count
+            while remaining > 0:
+                n = min(self.batch_size, remaining)
+                remaining -= n
+                for equipement_id, atelier_id in rng.choices(equipements, weights=weights, k=n):
+                    start = rng.randrange(24 * 60)
+                    minutes = min(12 * 60, max(5, int(rng.lognormvariate(4.2, 0.8))))
+                    end = (start + minutes) % (24 * 60)
+                    piece = "-"
+                    if stocks and rng.random() < 0.4:
+                        piece = f"{rng.randint(1, 4)} x {rng.choice(stocks)}"
+                    yield Formulaire(
+                        atelier_id=atelier_id,
+                        equipement_id=equipement_id,
+                        date_defaillance=self.today - timedelta(days=int(rng.triangular(0, self.days, 0))),
+                        heure_debut=time(start // 60, start % 60),
+                        heure_fin=time(end // 60, end % 60),
+                        methode_entretien_id=methodes[rng.choice(METHODES)],
+                        nature_panne_id=natures[rng.choice(NATURES_PANNE)],
+                        cause_panne_id=causes[rng.choice(CAUSES)],
+                        indice_gravite_id=gravites[rng.choices(GRAVITES, weights=[30, 25, 20, 15, 10])[0]],
+                        piece_rechange=piece,
+                        travaux_effectues=f"{rng.choice(TRAVAUX)} {rng.choice(PIECES).lower()}",
+                        etat_action_immediate_id=etats[rng.choices(ETATS_IMMEDIAT, weights=[10, 20, 70])[0]],
+                        pilote=rng.choice(pilotes),
+                    )
+        return self.bulk(Formulaire, rows())
+
+    def seed_connexion_logs(self, count, users):
+        rng = self.rng
+        now = timezone.now()
+        agents = ["Mozilla/5.0 (Windows NT 10.0; Win64; x64)", "Mozilla/5.0 (Linux; Android 13)"]
+
+        def rows():
+            for _ in range(count):
+                connected = now - timedelta(seconds=rng.randrange(self.days * 86400))
+                duration = timedelta(minutes=rng.randint(2, 8 * 60))
+                # Sessions récentes parfois encore ouvertes
+                disconnected = None if (now - connected < timedelta(hours=8) and rng.random() < 0.5) \
+                    else connected + duration
+                yield ConnexionLog(
+                    user_id=rng.choice(users),
+                    date_connexion=connected,
+                    date_deconnexion=disconnected,
+                    heure_deconnexion=disconnected.time() if disconnected else None,
+                    duree_connexion=duration if disconnected else None,
+                    ip_address=f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                    user_agent=rng.choice(agents),
+                )
+        return self.bulk(ConnexionLog, rows())
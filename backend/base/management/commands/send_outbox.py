@@ -0,0 +1,39 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.outbox import process_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Envoie les emails en file (EmailOutbox) par lots sur une connexion SMTP réutilisée"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Emails par lot / connexion")
+        parser.add_argument('--max-attempts', type=int, default=None, help="Essais avant statut 'failed'")
+        parser.add_argument('--loop', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--interval', type=float, default=5.0, help="Pause (s) quand la file est vide")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                stats = process_outbox(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+            except Exception:
+                # Base ou gabarit en erreur: le worker continue (lots réservés repris après EMAIL_OUTBOX_CLAIM_TIMEOUT)
+                if not options['loop']:
+                    raise
+                logger.exception("Lot d'emails non traité")
+                time.sleep(options['interval'])
+                continue
+            if any(stats.values()):
+                self.stdout.write(
+                    f"envoyés: {stats['sent']}, à réessayer: {stats['retry']}, en échec: {stats['failed']}"
+                )
+            if not options['loop']:
+                break
+            # Lot plein: on enchaîne; file vide: on attend
+            if sum(stats.values()) < options['batch_size']:
+                time.sleep(options['interval'])
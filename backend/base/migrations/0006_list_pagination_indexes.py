@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_alter_formulaire_indice_gravite'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='connexionlog',
+            index=models.Index(fields=['-date_connexion', '-id'], name='log_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connexionlog',
+            index=models.Index(fields=['user', '-date_connexion', '-id'], name='log_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['-date_defaillance', '-id'], name='form_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['atelier', '-date_defaillance', '-id'], name='form_atelier_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['equipement', '-date_defaillance', '-id'], name='form_equip_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['indice_gravite', '-date_defaillance', '-id'], name='form_gravite_date_idx'),
+        ),
+    ]
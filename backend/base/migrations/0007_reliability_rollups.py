@@ -0,0 +1,96 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:36
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+
+
+def fill_rollups(apps, schema_editor):
+    """
+    Agrégats des défaillances déjà saisies: même calcul que `rebuild_rollups`
+    (une requête groupée par scope et période), recopié ici avec les modèles
+    historiques pour ne pas dépendre du code courant de base.rollups.
+    """
+    Formulaire = apps.get_model('base', 'Formulaire')
+    scopes = (
+        (apps.get_model('base', 'EquipementRollup'), 'equipement'),
+        (apps.get_model('base', 'AtelierRollup'), 'atelier'),
+    )
+    for model, field in scopes:
+        for period, trunc in (('day', TruncDay), ('month', TruncMonth)):
+            rows = (
+                Formulaire.objects
+                .annotate(bucket=trunc('date_defaillance'))
+                .values(field, 'bucket')
+                .annotate(
+                    n=Count('id'),
+                    downtime=Sum('heuregen'),
+                    first=Min('date_defaillance'),
+                    last=Max('date_defaillance'),
+                    atelier_ref=Max('atelier'),
+                )
+                .order_by()
+            )
+            model.objects.bulk_create([
+                model(
+                    period=period,
+                    period_start=row['bucket'].date() if isinstance(row['bucket'], datetime.datetime) else row['bucket'],
+                    failures=row['n'],
+                    downtime=row['downtime'] or datetime.timedelta(),
+                    first_failure=row['first'],
+                    last_failure=row['last'],
+                    atelier_id=row['atelier_ref'],
+                    **({'equipement_id': row['equipement']} if field == 'equipement' else {}),
+                )
+                for row in rows.iterator(chunk_size=1000)
+            ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtelierRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Jour'), ('month', 'Mois')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('downtime', models.DurationField(default=datetime.timedelta)),
+                ('first_failure', models.DateField()),
+                ('last_failure', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('atelier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='base.atelier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'period_start'], name='atelier_rollup_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('atelier', 'period', 'period_start'), name='uniq_atelier_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EquipementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Jour'), ('month', 'Mois')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('downtime', models.DurationField(default=datetime.timedelta)),
+                ('first_failure', models.DateField()),
+                ('last_failure', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('atelier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='equipement_rollups', to='base.atelier')),
+                ('equipement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='base.equipement')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'period_start'], name='equip_rollup_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('equipement', 'period', 'period_start'), name='uniq_equip_rollup')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='kind',
+            field=models.CharField(choices=[('credentials', 'Identifiants'), ('password_reset', 'Réinitialisation du mot de passe'), ('stock_alert', 'Alerte stock'), ('failure_report', 'Rapport de défaillance')], max_length=30),
+        ),
+    ]
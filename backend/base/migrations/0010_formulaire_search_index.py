@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+
+FTS_TABLE = 'base_formulaire_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    """
+    Table FTS5 (SQLite uniquement) indexée par rowid = Formulaire.id, remplie
+    depuis les données existantes. Si FTS5 n'est pas compilé dans SQLite, la
+    recherche retombe sur l'index Python (FormulaireSearchTerm).
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "id, atelier_nom, equipement_nom, nature_panne, cause_panne, pilote, "
+                "methode_entretien, indice_gravite, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        except OperationalError:
+            return
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, id, atelier_nom, equipement_nom, nature_panne, "
+            "cause_panne, pilote, methode_entretien, indice_gravite) "
+            "SELECT f.id, f.id, a.nom, e.nom, f.nature_panne, f.cause_panne, f.pilote, "
+            "f.methode_entretien, f.indice_gravite "
+            "FROM base_formulaire f "
+            "JOIN base_atelier a ON a.id = f.atelier_id "
+            "JOIN base_equipement e ON e.id = f.equipement_id"
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_email_notification_kinds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormulaireSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('formulaire', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='base.formulaire')),
+            ],
+            options={
+                'verbose_name': 'Terme de recherche',
+                'verbose_name_plural': 'Termes de recherche',
+                'constraints': [models.UniqueConstraint(fields=('term', 'formulaire'), name='search_term_form_uniq')],
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
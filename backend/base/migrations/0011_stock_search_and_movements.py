@@ -0,0 +1,82 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+from base.text import normalize
+
+
+def fill_normalized_fields(apps, schema_editor):
+    Stock = apps.get_model('base', 'Stock')
+    stocks = list(Stock.objects.only('id', 'reference', 'element'))
+    for stock in stocks:
+        stock.reference_norm = normalize(stock.reference)
+        stock.element_norm = normalize(stock.element)
+    Stock.objects.bulk_update(stocks, ['reference_norm', 'element_norm'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_formulaire_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('entree', 'Entrée'), ('sortie', 'Sortie'), ('ajustement', 'Ajustement inventaire')], max_length=12)),
+                ('delta', models.IntegerField()),
+                ('quantite_apres', models.PositiveIntegerField()),
+                ('motif', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Mouvement de stock',
+                'verbose_name_plural': 'Mouvements de stock',
+            },
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='element_norm',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='reference_norm',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['reference_norm'], name='stock_reference_norm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['element_norm', 'reference'], name='stock_element_norm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['quantite', 'reference'], name='stock_quantite_ref_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='stock',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='base.stock'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='base.connexuser'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['stock', '-created_at', '-id'], name='stockmove_stock_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['-created_at', '-id'], name='stockmove_date_idx'),
+        ),
+        migrations.RunPython(fill_normalized_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_stock_search_and_movements'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='formulaire',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='base.formulaire'),
+        ),
+        migrations.CreateModel(
+            name='FormulairePiece',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite', models.PositiveIntegerField()),
+                ('formulaire', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pieces', to='base.formulaire')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='consommations', to='base.stock')),
+            ],
+            options={
+                'verbose_name': 'Pièce consommée',
+                'verbose_name_plural': 'Pièces consommées',
+                'indexes': [models.Index(fields=['stock', 'formulaire'], name='form_piece_stock_idx')],
+                'constraints': [models.UniqueConstraint(fields=('formulaire', 'stock'), name='form_piece_uniq'), models.CheckConstraint(condition=models.Q(('quantite__gt', 0)), name='form_piece_quantite_pos')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_formulaire_pieces'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['date_defaillance', 'heuregen'], name='form_date_downtime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['equipement', 'atelier', 'heuregen'], name='form_equip_downtime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['nature_panne', 'date_defaillance'], name='form_nature_date_idx'),
+        ),
+    ]
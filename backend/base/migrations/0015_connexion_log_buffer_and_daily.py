@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:18
+
+import base.models
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_sync_updated_at_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnexionLogDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('first_connexion', models.DateTimeField()),
+                ('last_deconnexion', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Connexions (agrégat journalier)',
+                'verbose_name_plural': 'Connexions (agrégats journaliers)',
+            },
+        ),
+        migrations.AddField(
+            model_name='connexionlog',
+            name='session_key',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='connexionlog',
+            name='heure_connexion',
+            field=models.TimeField(default=base.models.current_time),
+        ),
+        migrations.AddIndex(
+            model_name='connexionlog',
+            index=models.Index(fields=['session_key'], name='log_session_key_idx'),
+        ),
+        migrations.AddField(
+            model_name='connexionlogdaily',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='connexions_daily', to='base.connexuser'),
+        ),
+        migrations.AddIndex(
+            model_name='connexionlogdaily',
+            index=models.Index(fields=['day'], name='connexion_daily_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='connexionlogdaily',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='uniq_connexion_daily'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_connexion_log_buffer_and_daily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connexionlogdaily',
+            name='closed_sessions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,137 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Champ du formulaire -> (modèle de la liste, libellés de FormPage.jsx dans l'ordre d'affichage)
+CHOICES = {
+    'methode_entretien': ('MethodeEntretien', [
+        "Dépannage", "Réparation", "Amélioration", "Entretien préventif conditionnel", "Entretien systématique",
+    ]),
+    'nature_panne': ('NaturePanne', [
+        "Origine électrique", "Origine Mécanique", "Origine lubrification",
+        "Origine pneumatique ou hydraulique", "Origine conception générale machine",
+    ]),
+    'cause_panne': ('CausePanne', [
+        "Manque d'entretien", "Surcharges", "Mauvaise manipulation", "Cause de conception inadéquate",
+        "Incident imprévisible", "Re-Works", "Durée de vie",
+    ]),
+    'indice_gravite': ('IndiceGravite', [
+        "Intervention programmable dans le mois",
+        "Intervention programmable dans la semaine",
+        "Intervention nécessaire dans les 48 heures",
+        "Intervention nécessaire dans les heures qui suivent (risque de perte de production)",
+        "Intervention immédiate (Perte de production)",
+    ]),
+    'etat_action_immediate': ('EtatActionImmediate', ["Non traité", "En cours", "Fait"]),
+}
+VERBOSE_NAMES = {
+    'MethodeEntretien': ("Méthode d'entretien", "Méthodes d'entretien"),
+    'NaturePanne': ("Nature de panne", "Natures de panne"),
+    'CausePanne': ("Cause de panne", "Causes de panne"),
+    'IndiceGravite': ("Indice de gravité", "Indices de gravité"),
+    'EtatActionImmediate': ("État de l'action immédiate", "États de l'action immédiate"),
+}
+
+
+def fill_choices(apps, schema_editor):
+    """
+    Crée les listes (libellés de FormPage.jsx, puis les autres valeurs déjà
+    saisies) et renseigne les nouvelles clés: un UPDATE par valeur distincte.
+    Les valeurs vides restent à NULL.
+    """
+    Formulaire = apps.get_model('base', 'Formulaire')
+    for field, (model_name, labels) in CHOICES.items():
+        Choice = apps.get_model('base', model_name)
+        existing = {
+            value.strip() for value in
+            Formulaire.objects.order_by().values_list(field, flat=True).distinct() if value and value.strip()
+        }
+        Choice.objects.bulk_create([Choice(label=label) for label in labels + sorted(existing - set(labels))])
+        ids = dict(Choice.objects.values_list('label', 'id'))
+        for value in Formulaire.objects.order_by().values_list(field, flat=True).distinct():
+            if value and value.strip():
+                Formulaire.objects.filter(**{field: value}).update(**{f"{field}_ref": ids[value.strip()]})
+
+
+def restore_labels(apps, schema_editor):
+    Formulaire = apps.get_model('base', 'Formulaire')
+    for field, (model_name, _labels) in CHOICES.items():
+        Choice = apps.get_model('base', model_name)
+        for pk, label in Choice.objects.values_list('id', 'label'):
+            Formulaire.objects.filter(**{f"{field}_ref": pk}).update(**{field: label})
+
+
+def choice_model(name):
+    verbose_name, verbose_name_plural = VERBOSE_NAMES[name]
+    return migrations.CreateModel(
+        name=name,
+        fields=[
+            ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+            ('label', models.CharField(max_length=255, unique=True)),
+        ],
+        options={
+            'verbose_name': verbose_name,
+            'verbose_name_plural': verbose_name_plural,
+            'ordering': ['id'],
+            'abstract': False,
+        },
+    )
+
+
+def choice_key(model_name):
+    return models.ForeignKey(
+        null=True, on_delete=django.db.models.deletion.PROTECT, related_name='formulaires', to=f'base.{model_name.lower()}',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0016_connexion_daily_closed_sessions'),
+    ]
+
+    operations = [
+        *[choice_model(model_name) for model_name, _labels in CHOICES.values()],
+        # Nouvelles clés à côté des colonnes texte, remplies, puis renommées
+        *[
+            migrations.AddField(
+                model_name='formulaire', name=f"{field}_ref",
+                field=models.ForeignKey(
+                    null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+',
+                    to=f'base.{model_name.lower()}',
+                ),
+            )
+            for field, (model_name, _labels) in CHOICES.items()
+        ],
+        migrations.RunPython(fill_choices, restore_labels),
+        migrations.RemoveIndex(model_name='formulaire', name='form_gravite_date_idx'),
+        migrations.RemoveIndex(model_name='formulaire', name='form_nature_date_idx'),
+        # Défaut '' avant suppression: le retour arrière recrée les colonnes texte sur une table non vide
+        *[
+            migrations.AlterField(
+                model_name='formulaire', name=field,
+                field=models.TextField(default='') if field == 'etat_action_immediate'
+                else models.CharField(max_length=255, default=''),
+            )
+            for field in CHOICES
+        ],
+        *[migrations.RemoveField(model_name='formulaire', name=field) for field in CHOICES],
+        *[
+            migrations.RenameField(model_name='formulaire', old_name=f"{field}_ref", new_name=field)
+            for field in CHOICES
+        ],
+        *[
+            migrations.AlterField(model_name='formulaire', name=field, field=choice_key(model_name))
+            for field, (model_name, _labels) in CHOICES.items()
+        ],
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['indice_gravite', '-date_defaillance', '-id'], name='form_gravite_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaire',
+            index=models.Index(fields=['nature_panne', 'date_defaillance'], name='form_nature_date_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:30
+
+import base.models
+from django.db import migrations, models
+
+
+DOWNTIME_INDEXES = (
+    models.Index(fields=['date_defaillance', 'heuregen'], name='form_date_downtime_idx'),
+    models.Index(fields=['equipement', 'atelier', 'heuregen'], name='form_equip_downtime_idx'),
+)
+
+
+def restore_downtime(apps, schema_editor):
+    # Retour arrière: la colonne redevient une simple durée, remplie par la même expression
+    Formulaire = apps.get_model('base', 'Formulaire')
+    Formulaire.objects.update(heuregen=base.models.TimeSpan('heure_debut', 'heure_fin'))
+
+
+class Migration(migrations.Migration):
+    """
+    heuregen devient une colonne générée stockée (une colonne ordinaire ne
+    peut pas être convertie: suppression puis ajout). La base la calcule pour
+    toutes les lignes existantes à l'ajout: pas de backfill en Python.
+    """
+
+    dependencies = [
+        ('base', '0017_formulaire_choice_tables'),
+    ]
+
+    operations = [
+        *[migrations.RemoveIndex(model_name='formulaire', name=index.name) for index in DOWNTIME_INDEXES],
+        migrations.RunPython(migrations.RunPython.noop, restore_downtime),
+        migrations.RemoveField(model_name='formulaire', name='heuregen'),
+        migrations.AddField(
+            model_name='formulaire',
+            name='heuregen',
+            field=models.GeneratedField(
+                db_persist=True, expression=base.models.TimeSpan('heure_debut', 'heure_fin'),
+                output_field=models.DurationField(),
+            ),
+        ),
+        *[migrations.AddIndex(model_name='formulaire', index=index) for index in DOWNTIME_INDEXES],
+    ]
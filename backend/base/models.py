@@ -1,13 +1,14 @@
-from django.db import models
+from django.db import NotSupportedError, models
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
-from .email_utils import send_credentials_email
 import secrets
 import string
 from datetime import timedelta
 
+from .text import normalize
+
 
 class Technicien(models.Model):
     nom = models.CharField(max_length=100)
@@ -16,6 +17,7 @@ class Technicien(models.Model):
     date_naissance = models.DateField()
     date_embauche = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # synchronisation incrémentale (/api/changes/)
     
     def __str__(self):
         return f"{self.nom} {self.prenom}"
@@ -50,8 +52,8 @@ class Technicien(models.Model):
             temp_password=password  # Stocké temporairement pour pouvoir l'afficher
         )
         
-        # Envoyer l'email avec les identifiants
-        send_credentials_email(
+        # Mettre l'email d'identifiants en file (envoyé par la commande send_outbox)
+        EmailOutbox.enqueue_credentials(
             self.email, 
             self.nom, 
             self.prenom, 
@@ -75,6 +77,7 @@ class Admin(models.Model):
     date_naissance = models.DateField()
     date_embauche = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # synchronisation incrémentale (/api/changes/)
     
     def __str__(self):
         return f"{self.nom} {self.prenom}"
@@ -109,8 +112,8 @@ class Admin(models.Model):
             temp_password=password  # Stocké temporairement pour pouvoir l'afficher
         )
         
-        # Envoyer l'email avec les identifiants
-        send_credentials_email(
+        # Mettre l'email d'identifiants en file (envoyé par la commande send_outbox)
+        EmailOutbox.enqueue_credentials(
             self.email, 
             self.nom, 
             self.prenom, 
@@ -155,15 +158,21 @@ class ConnexUser(models.Model):
         return self.username
 
 
+def current_time():
+    return timezone.localtime().time()
+
+
 class ConnexionLog(models.Model):
     user = models.ForeignKey(ConnexUser, on_delete=models.CASCADE, related_name='connexions')
     date_connexion = models.DateTimeField(default=timezone.now)
-    heure_connexion = models.TimeField(auto_now_add=True)
+    # Heure de la connexion (et non de l'insertion: les logs sont écrits en lot, base.connexions)
+    heure_connexion = models.TimeField(default=current_time)
     date_deconnexion = models.DateTimeField(null=True, blank=True)
     heure_deconnexion = models.TimeField(null=True, blank=True)
     duree_connexion = models.DurationField(null=True, blank=True)  # Durée automatiquement calculée
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(null=True, blank=True)  # Informations sur le navigateur
+    session_key = models.CharField(max_length=32, blank=True, default='')  # empreinte du jeton (déconnexion)
     
     def __str__(self):
         return f"{self.user.username} - {self.date_connexion.strftime('%d/%m/%Y %H:%M')}"
@@ -187,10 +196,44 @@ class ConnexionLog(models.Model):
         ordering = ['-date_connexion']
         verbose_name = "Log de Connexion"
         verbose_name_plural = "Logs de Connexions"
+        indexes = [
+            # Pagination keyset (-date_connexion, -id) et filtre par utilisateur
+            models.Index(fields=['-date_connexion', '-id'], name='log_date_id_idx'),
+            models.Index(fields=['user', '-date_connexion', '-id'], name='log_user_date_idx'),
+            models.Index(fields=['session_key'], name='log_session_key_idx'),
+        ]
+
+
+class ConnexionLogDaily(models.Model):
+    """
+    Agrégat journalier par compte des logs compactés (compact_connexion_logs):
+    les lignes détaillées plus vieilles que la rétention sont archivées puis supprimées.
+    """
+    user = models.ForeignKey(ConnexUser, on_delete=models.CASCADE, related_name='connexions_daily')
+    day = models.DateField()
+    sessions = models.PositiveIntegerField(default=0)
+    closed_sessions = models.PositiveIntegerField(default=0)  # sessions ayant une durée
+    total_duration = models.DurationField(default=timedelta)  # sessions fermées uniquement
+    first_connexion = models.DateTimeField()
+    last_deconnexion = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='uniq_connexion_daily'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='connexion_daily_day_idx'),
+        ]
+        verbose_name = "Connexions (agrégat journalier)"
+        verbose_name_plural = "Connexions (agrégats journaliers)"
+
+    def __str__(self):
+        return f"{self.user_id} {self.day}: {self.sessions}"
 
 
 class Atelier(models.Model):
     nom = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # synchronisation incrémentale (/api/changes/)
 
     def __str__(self):
         return self.nom
@@ -200,52 +243,406 @@ class Atelier(models.Model):
 class Equipement(models.Model):
     nom = models.CharField(max_length=100)
     atelier = models.ForeignKey(Atelier, on_delete=models.CASCADE, related_name='equipements')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # synchronisation incrémentale (/api/changes/)
 
     def __str__(self):
         return self.nom
     
 
+# ------------------ LISTES DE CHOIX DES FORMULAIRES ------------------
+class FormulaireChoice(models.Model):
+    """
+    Valeur d'une liste de choix des formulaires: le formulaire garde un petit
+    entier, l'API lit et écrit le libellé (base.lookups).
+    """
+    id = models.SmallAutoField(primary_key=True)
+    label = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['id']
+
+    def __str__(self):
+        return self.label
+
+
+class MethodeEntretien(FormulaireChoice):
+    class Meta(FormulaireChoice.Meta):
+        verbose_name = "Méthode d'entretien"
+        verbose_name_plural = "Méthodes d'entretien"
+
+
+class NaturePanne(FormulaireChoice):
+    class Meta(FormulaireChoice.Meta):
+        verbose_name = "Nature de panne"
+        verbose_name_plural = "Natures de panne"
+
+
+class CausePanne(FormulaireChoice):
+    class Meta(FormulaireChoice.Meta):
+        verbose_name = "Cause de panne"
+        verbose_name_plural = "Causes de panne"
+
+
+class IndiceGravite(FormulaireChoice):
+    class Meta(FormulaireChoice.Meta):
+        verbose_name = "Indice de gravité"
+        verbose_name_plural = "Indices de gravité"
+
+
+class EtatActionImmediate(FormulaireChoice):
+    class Meta(FormulaireChoice.Meta):
+        verbose_name = "État de l'action immédiate"
+        verbose_name_plural = "États de l'action immédiate"
+
+
+class TimeSpan(models.Func):
+    """
+    Durée (à la minute) entre deux heures du même formulaire, passage de minuit
+    compris: fin < début => +24 h. SQL natif déterministe, utilisable dans une
+    colonne générée (SQLite, PostgreSQL).
+    """
+    arity = 2
+    output_field = models.DurationField()
+
+    def _compile(self, compiler):
+        (start, start_params), (end, end_params) = (compiler.compile(e) for e in self.get_source_expressions())
+        return start, tuple(start_params), end, tuple(end_params)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # TimeField stocké en texte 'HH:MM[:SS]', DurationField en microsecondes
+        start, start_params, end, end_params = self._compile(compiler)
+        minutes = "(CAST(substr({0}, 1, 2) AS INTEGER) * 60 + CAST(substr({0}, 4, 2) AS INTEGER))"
+        sql = f"((({minutes.format(end)} - {minutes.format(start)} + 1440) %% 1440) * 60000000)"
+        return sql, end_params * 2 + start_params * 2
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        start, start_params, end, end_params = self._compile(compiler)
+        minutes = "(EXTRACT(HOUR FROM {0}) * 60 + EXTRACT(MINUTE FROM {0}))"
+        sql = f"make_interval(mins => mod(({minutes.format(end)} - {minutes.format(start)})::integer + 1440, 1440))"
+        return sql, end_params * 2 + start_params * 2
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"TimeSpan n'est pas implémenté pour {connection.vendor}.")
+
+
 class Formulaire(models.Model):
     atelier = models.ForeignKey('Atelier', on_delete=models.CASCADE, related_name='formulaires')
     equipement = models.ForeignKey('Equipement', on_delete=models.CASCADE, related_name='formulaires')
     date_defaillance = models.DateField()
     heure_debut = models.TimeField()
     heure_fin = models.TimeField()
-    heuregen = models.DurationField(editable=False, null=True, blank=True)  # Champ calculé
-    methode_entretien = models.CharField(max_length=255)
-    nature_panne = models.CharField(max_length=255)
-    cause_panne = models.CharField(max_length=255)
-    indice_gravite = models.CharField(max_length=255)
+    # Durée d'arrêt calculée et stockée par la base: renseignée aussi par bulk_create,
+    # update() ou un import direct en SQL (lue après écriture: refresh_from_db)
+    heuregen = models.GeneratedField(
+        expression=TimeSpan('heure_debut', 'heure_fin'), output_field=models.DurationField(), db_persist=True,
+    )
+    # Listes de choix: clés vers de petites tables (null: valeur vide des anciennes saisies)
+    methode_entretien = models.ForeignKey(MethodeEntretien, on_delete=models.PROTECT, null=True, related_name='formulaires')
+    nature_panne = models.ForeignKey(NaturePanne, on_delete=models.PROTECT, null=True, related_name='formulaires')
+    cause_panne = models.ForeignKey(CausePanne, on_delete=models.PROTECT, null=True, related_name='formulaires')
+    indice_gravite = models.ForeignKey(IndiceGravite, on_delete=models.PROTECT, null=True, related_name='formulaires')
     piece_rechange = models.TextField()
     travaux_effectues = models.TextField() 
-    etat_action_immediate = models.TextField()
+    etat_action_immediate = models.ForeignKey(
+        EtatActionImmediate, on_delete=models.PROTECT, null=True, related_name='formulaires',
+    )
     pilote = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # synchronisation incrémentale (/api/changes/)
 
     def save(self, *args, **kwargs):
-        # Calculer la durée en heures et l'enregistrer dans heuregen
-        if self.heure_debut and self.heure_fin:
-            start = timedelta(hours=self.heure_debut.hour, minutes=self.heure_debut.minute)
-            end = timedelta(hours=self.heure_fin.hour, minutes=self.heure_fin.minute)
-
-            # Si l'heure de fin est inférieure à l'heure de début, ajouter 24 heures à l'heure de fin
-            if end < start:
-                end += timedelta(days=1)
-
-            self.heuregen = end - start
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if not adding:
+            # Recalculée par la base: relue au prochain accès (l'INSERT la renvoie déjà via RETURNING)
+            self.__dict__.pop('heuregen', None)
 
     def __str__(self):
         return f"Formulaire for {self.atelier} - {self.equipement}"
 
+    class Meta:
+        indexes = [
+            # Pagination keyset (-date_defaillance, -id) + filtres de la liste
+            models.Index(fields=['-date_defaillance', '-id'], name='form_date_id_idx'),
+            models.Index(fields=['atelier', '-date_defaillance', '-id'], name='form_atelier_date_idx'),
+            models.Index(fields=['equipement', '-date_defaillance', '-id'], name='form_equip_date_idx'),
+            models.Index(fields=['indice_gravite', '-date_defaillance', '-id'], name='form_gravite_date_idx'),
+            # Index couvrants du tableau de bord / des séries: agrégats par période,
+            # top équipements et natures lus dans l'index sans toucher la table
+            models.Index(fields=['date_defaillance', 'heuregen'], name='form_date_downtime_idx'),
+            models.Index(fields=['equipement', 'atelier', 'heuregen'], name='form_equip_downtime_idx'),
+            models.Index(fields=['nature_panne', 'date_defaillance'], name='form_nature_date_idx'),
+        ]
+
 
 class Stock(models.Model):
     reference = models.CharField(max_length=255, unique=True)
     element = models.CharField(max_length=255)
     quantite = models.PositiveIntegerField()
+    # Formes normalisées (minuscules, sans accents) pour la recherche par préfixe indexée
+    reference_norm = models.CharField(max_length=255, editable=False, default='')
+    element_norm = models.CharField(max_length=255, editable=False, default='')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # synchronisation incrémentale (/api/changes/)
+
+    def normalize_fields(self):
+        # Aussi appelé par les écritures en lot (bulk_create / bulk_update)
+        self.reference_norm = normalize(self.reference)
+        self.element_norm = normalize(self.element)
+
+    def save(self, *args, **kwargs):
+        self.normalize_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'reference', 'element'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'reference_norm', 'element_norm'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.reference} - {self.element} ({self.quantite})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['reference_norm'], name='stock_reference_norm_idx'),
+            models.Index(fields=['element_norm', 'reference'], name='stock_element_norm_idx'),
+            # Stock bas: quantite <= seuil, trié par quantité puis référence
+            models.Index(fields=['quantite', 'reference'], name='stock_quantite_ref_idx'),
+        ]
+
+
+class StockMovement(models.Model):
+    """
+    Journal des mouvements de stock. Chaque mouvement est appliqué par un
+    UPDATE atomique (F('quantite') + delta) et enregistre la quantité obtenue.
+    """
+    KIND_IN = 'entree'
+    KIND_OUT = 'sortie'
+    KIND_ADJUST = 'ajustement'
+    KIND_CHOICES = [
+        (KIND_IN, 'Entrée'),
+        (KIND_OUT, 'Sortie'),
+        (KIND_ADJUST, 'Ajustement inventaire'),
+    ]
+
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='movements')
+    formulaire = models.ForeignKey('Formulaire', on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    delta = models.IntegerField()  # positif = entrée, négatif = sortie
+    quantite_apres = models.PositiveIntegerField()
+    motif = models.CharField(max_length=255, blank=True, default='')
+    user = models.ForeignKey(ConnexUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock', '-created_at', '-id'], name='stockmove_stock_date_idx'),
+            models.Index(fields=['-created_at', '-id'], name='stockmove_date_idx'),
+        ]
+        verbose_name = "Mouvement de stock"
+        verbose_name_plural = "Mouvements de stock"
+
+    def __str__(self):
+        return f"{self.stock_id} {self.delta:+d} -> {self.quantite_apres}"
+
+
+class FormulairePiece(models.Model):
+    """
+    Pièce consommée par une intervention (ligne structurée de piece_rechange).
+    La création d'un formulaire avec ses pièces décrémente le stock dans la
+    même transaction (base.stock.apply_movements).
+    """
+    formulaire = models.ForeignKey('Formulaire', on_delete=models.CASCADE, related_name='pieces')
+    stock = models.ForeignKey(Stock, on_delete=models.PROTECT, related_name='consommations')
+    quantite = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['formulaire', 'stock'], name='form_piece_uniq'),
+            models.CheckConstraint(condition=models.Q(quantite__gt=0), name='form_piece_quantite_pos'),
+        ]
+        indexes = [
+            # Rapport de consommation: regroupement par pièce
+            models.Index(fields=['stock', 'formulaire'], name='form_piece_stock_idx'),
+        ]
+        verbose_name = "Pièce consommée"
+        verbose_name_plural = "Pièces consommées"
+
+    def __str__(self):
+        return f"{self.formulaire_id}: {self.stock_id} x{self.quantite}"
+
+
+class FormulaireSearchTerm(models.Model):
+    """
+    Index inversé portable (terme -> formulaire) utilisé par base.search
+    quand FTS5 n'est pas disponible. Maintenu par les signaux Formulaire et
+    reconstruit par la commande `rebuild_search_index`.
+    """
+    term = models.CharField(max_length=64)
+    formulaire = models.ForeignKey('Formulaire', on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)  # poids du champ x occurrences
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'formulaire'], name='search_term_form_uniq'),
+        ]
+        verbose_name = "Terme de recherche"
+        verbose_name_plural = "Termes de recherche"
+
+    def __str__(self):
+        return f"{self.term} -> {self.formulaire_id}"
+
+
+class Tombstone(models.Model):
+    """
+    Trace d'une suppression (Formulaire, Stock, Atelier...) pour /api/changes/:
+    un client qui synchronise depuis un curseur apprend quels ids retirer.
+    Écrite par les signaux post_delete; purgée après SYNC_TOMBSTONE_RETENTION_DAYS.
+    """
+    model = models.CharField(max_length=32)
+    object_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'model'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} ({self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class EmailOutbox(models.Model):
+    """
+    File d'envoi des emails (outbox en base). Les vues et modèles ne font
+    qu'insérer une ligne; la commande `send_outbox` envoie par lots sur une
+    seule connexion SMTP avec reprise et backoff exponentiel.
+    """
+    KIND_CREDENTIALS = 'credentials'
+    KIND_PASSWORD_RESET = 'password_reset'
+    KIND_STOCK_ALERT = 'stock_alert'
+    KIND_FAILURE_REPORT = 'failure_report'
+    KIND_CHOICES = [
+        (KIND_CREDENTIALS, 'Identifiants'),
+        (KIND_PASSWORD_RESET, 'Réinitialisation du mot de passe'),
+        (KIND_STOCK_ALERT, 'Alerte stock'),
+        (KIND_FAILURE_REPORT, 'Rapport de défaillance'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_SENDING, 'En cours'),
+        (STATUS_SENT, 'Envoyé'),
+        (STATUS_FAILED, 'Échec'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    to_email = models.EmailField()
+    context = models.JSONField(default=dict)  # données du gabarit (vidées des secrets après envoi)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    claim_token = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+        verbose_name = "Email en file"
+        verbose_name_plural = "Emails en file"
+
+    def __str__(self):
+        return f"{self.kind} -> {self.to_email} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, kind, to_email, **context):
+        return cls.objects.create(kind=kind, to_email=to_email, context=context)
+
+    @classmethod
+    def enqueue_credentials(cls, user_email, nom, prenom, username, password, role):
+        return cls.enqueue(
+            cls.KIND_CREDENTIALS, user_email,
+            nom=nom, prenom=prenom, username=username, password=password, role=role,
+        )
+
+    @classmethod
+    def enqueue_password_reset(cls, user_email, nom, prenom, username, password, role):
+        return cls.enqueue(
+            cls.KIND_PASSWORD_RESET, user_email,
+            nom=nom, prenom=prenom, username=username, password=password, role=role,
+        )
+
+    @classmethod
+    def enqueue_for_admins(cls, kind, **context):
+        """Une ligne par admin ayant un email (alertes stock, rapports de défaillance)."""
+        emails = Admin.objects.exclude(email='').values_list('email', flat=True).distinct()
+        return cls.objects.bulk_create([cls(kind=kind, to_email=e, context=context) for e in emails])
+
+
+class _RollupBase(models.Model):
+    """
+    Agrégat matérialisé des formulaires sur une période (jour ou mois).
+    Maintenu par base.rollups (signaux Formulaire) et reconstruit par
+    la commande `rebuild_rollups`.
+    """
+    PERIOD_DAY = 'day'
+    PERIOD_MONTH = 'month'
+    PERIOD_CHOICES = [
+        (PERIOD_DAY, 'Jour'),
+        (PERIOD_MONTH, 'Mois'),
+    ]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    failures = models.PositiveIntegerField(default=0)
+    downtime = models.DurationField(default=timedelta)  # somme des heuregen
+    first_failure = models.DateField()
+    last_failure = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def mttr(self):
+        return self.downtime / self.failures if self.failures else None
+
+
+class EquipementRollup(_RollupBase):
+    equipement = models.ForeignKey(Equipement, on_delete=models.CASCADE, related_name='rollups')
+    atelier = models.ForeignKey(Atelier, on_delete=models.CASCADE, related_name='equipement_rollups')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['equipement', 'period', 'period_start'], name='uniq_equip_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='equip_rollup_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.equipement_id} {self.period} {self.period_start}: {self.failures}"
+
+
+class AtelierRollup(_RollupBase):
+    atelier = models.ForeignKey(Atelier, on_delete=models.CASCADE, related_name='rollups')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['atelier', 'period', 'period_start'], name='uniq_atelier_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='atelier_rollup_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.atelier_id} {self.period} {self.period_start}: {self.failures}"
+
 
 # Create your models here.
 
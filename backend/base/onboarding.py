@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+import secrets
+import string
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from .cache_utils import bump_version
+from .models import Technicien, Admin, ConnexUser, EmailOutbox
+from .signals import DASHBOARD_CACHE_NAMESPACE
+
+
+PROFILE_MODELS = {
+    'technicien': Technicien,
+    'admin': Admin,
+}
+
+
+class PersonnelRowSerializer(serializers.Serializer):
+    """
+    Validation d'une ligne d'import. L'unicité des emails n'est pas vérifiée
+    ici (un UniqueValidator ferait une requête par ligne): elle est contrôlée
+    pour tout le lot en une requête dans onboard_personnel.
+    """
+    nom = serializers.CharField(max_length=100)
+    prenom = serializers.CharField(max_length=100)
+    email = serializers.EmailField()
+    date_naissance = serializers.DateField(input_formats=["%Y-%m-%d", "%d/%m/%Y"])
+    date_embauche = serializers.DateField(required=False, allow_null=True, input_formats=["%Y-%m-%d", "%d/%m/%Y"])
+    role = serializers.ChoiceField(choices=list(PROFILE_MODELS), required=False)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict) and data.get('date_embauche') in ("",):
+            data = {**data, 'date_embauche': None}
+        return super().to_internal_value(data)
+
+
+def parse_rows(content, fmt):
+    """Lit un lot CSV (en-têtes = noms de champs, ',' ou ';') ou JSON (liste ou {"rows": [...]})."""
+    if fmt == 'json':
+        data = json.loads(content) if isinstance(content, str) else content
+        if isinstance(data, dict):
+            data = data.get('rows', [])
+        if not isinstance(data, list):
+            raise ValueError("Le JSON doit être une liste de personnes.")
+        return data
+    sample = content[:2048]
+    delimiter = ';' if sample.count(';') > sample.count(',') else ','
+    reader = csv.DictReader(io.StringIO(content), delimiter=delimiter)
+    return [{(k or '').strip(): (v or '').strip() for k, v in row.items()} for row in reader]
+
+
+def generate_temp_password(length=8):
+    characters = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(characters) for _ in range(length))
+
+
+def resolve_usernames(bases):
+    """
+    Attribue un nom d'utilisateur unique à chaque base 'prenom.nom' du lot
+    (même schéma que create_connex_user: base, base1, base2...) avec UNE
+    requête sur les préfixes au lieu d'un exists() par essai.
+    """
+    unique_bases = set(bases)
+    query = Q()
+    for base in unique_bases:
+        query |= Q(username__startswith=base)
+    taken = set(ConnexUser.objects.filter(query).values_list('username', flat=True)) if unique_bases else set()
+
+    usernames = []
+    for base in bases:
+        candidate, counter = base, 1
+        while candidate in taken:
+            candidate = f"{base}{counter}"
+            counter += 1
+        taken.add(candidate)
+        usernames.append(candidate)
+    return usernames
+
+
+def hash_passwords(passwords):
+    """Hache en parallèle (pbkdf2 relâche le GIL): le coût du lot n'est plus linéaire."""
+    workers = getattr(settings, 'ONBOARDING_HASH_WORKERS', 4)
+    if len(passwords) <= 1 or workers <= 1:
+        return [make_password(p) for p in passwords]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords))
+
+
+def onboard_personnel(rows, default_role='technicien', strict=False, dry_run=False, send_emails=True):
+    """
+    Crée en lot des techniciens/admins et leurs ConnexUser.
+
+    - validation par ligne, doublons d'email (lot + base) en une requête par modèle
+    - noms d'utilisateur résolus pour tout le lot en une requête
+    - bulk_create Technicien/Admin, ConnexUser et EmailOutbox dans une transaction
+    - strict=True: aucune création si une ligne est rejetée
+
+    Retourne {"created": [...], "rejected": [...]}.
+    """
+    max_rows = getattr(settings, 'ONBOARDING_MAX_ROWS', 1000)
+    if len(rows) > max_rows:
+        raise ValueError(f"Lot trop volumineux ({len(rows)} lignes, max {max_rows}).")
+
+    rejected, valid = [], []
+    for index, raw in enumerate(rows, start=1):
+        serializer = PersonnelRowSerializer(data=raw)
+        if not serializer.is_valid():
+            rejected.append({"row": index, "data": raw, "errors": serializer.errors})
+            continue
+        data = dict(serializer.validated_data)
+        data['role'] = data.get('role') or default_role
+        valid.append((index, raw, data))
+
+    # Doublons d'email (unicité par modèle de profil): dans le lot puis en base, une requête par modèle
+    existing = set()
+    for role, model in PROFILE_MODELS.items():
+        emails = [data['email'] for _i, _r, data in valid if data['role'] == role]
+        if emails:
+            existing |= {(role, e) for e in model.objects.filter(email__in=emails).values_list('email', flat=True)}
+    seen, accepted = set(), []
+    for index, raw, data in valid:
+        key = (data['role'], data['email'])
+        if key in existing:
+            rejected.append({"row": index, "data": raw, "errors": {"email": ["Email déjà utilisé."]}})
+        elif key in seen:
+            rejected.append({"row": index, "data": raw, "errors": {"email": ["Email en double dans le lot."]}})
+        else:
+            seen.add(key)
+            accepted.append((index, data))
+
+    rejected.sort(key=lambda r: r['row'])
+    if dry_run:
+        return {
+            "created": [{"row": i, "role": d['role'], "email": d['email']} for i, d in accepted],
+            "rejected": rejected,
+            "dry_run": True,
+        }
+    if (strict and rejected) or not accepted:
+        return {"created": [], "rejected": rejected}
+
+    usernames = resolve_usernames([f"{d['prenom'].lower()}.{d['nom'].lower()}" for _i, d in accepted])
+    passwords = [generate_temp_password() for _ in accepted]
+    hashes = hash_passwords(passwords)
+
+    created = []
+    with transaction.atomic():
+        profiles = {}
+        for role, model in PROFILE_MODELS.items():
+            items = [(pos, d) for pos, (_i, d) in enumerate(accepted) if d['role'] == role]
+            if not items:
+                continue
+            # bulk_create ne passe pas par save(): pas de ConnexUser/email automatique
+            objs = model.objects.bulk_create([
+                model(**{k: v for k, v in d.items() if k != 'role'}) for _pos, d in items
+            ])
+            if any(o.pk is None for o in objs):
+                by_email = dict(model.objects.filter(email__in=[d['email'] for _p, d in items]).values_list('email', 'pk'))
+                for o in objs:
+                    o.pk = by_email[o.email]
+            profiles.update({pos: obj for (pos, _d), obj in zip(items, objs)})
+
+        users = []
+        for pos, (_i, d) in enumerate(accepted):
+            users.append(ConnexUser(
+                username=usernames[pos],
+                password=hashes[pos],
+                role=d['role'],
+                temp_password=passwords[pos],
+                **{d['role']: profiles[pos]},
+            ))
+        ConnexUser.objects.bulk_create(users)
+
+        if send_emails:
+            EmailOutbox.objects.bulk_create([
+                EmailOutbox(
+                    kind=EmailOutbox.KIND_CREDENTIALS,
+                    to_email=d['email'],
+                    context={'nom': d['nom'], 'prenom': d['prenom'], 'username': usernames[pos],
+                             'password': passwords[pos], 'role': d['role']},
+                )
+                for pos, (_i, d) in enumerate(accepted)
+            ])
+
+    # bulk_create n'émet pas post_save: invalider le tableau de bord à la main
+    bump_version(DASHBOARD_CACHE_NAMESPACE)
+
+    for pos, (index, d) in enumerate(accepted):
+        created.append({
+            "row": index,
+            "id": profiles[pos].pk,
+            "role": d['role'],
+            "email": d['email'],
+            "username": usernames[pos],
+        })
+    return {"created": created, "rejected": rejected}
@@ -0,0 +1,121 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .email_utils import build_message
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Constructeur de message: (ligne outbox, connexion) -> EmailMessage; le type
+# choisit les gabarits emails/<kind>.html/.txt (voir email_utils.NOTIFICATIONS)
+def build_row_message(row, connection):
+    return build_message(row.kind, row.to_email, row.context, connection=connection)
+
+# Clés du contexte effacées une fois l'email parti ou abandonné (statut 'failed')
+SECRET_KEYS = ('password',)
+
+
+def strip_secrets(context):
+    return {k: v for k, v in context.items() if k not in SECRET_KEYS}
+
+
+def backoff(attempts):
+    """Délai avant la tentative suivante: base * 2^(tentatives-1), plafonné."""
+    base = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_SECONDS', 60)
+    cap = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(cap, base * 2 ** max(0, attempts - 1)))
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Réserve jusqu'à `batch_size` emails dus (UPDATE conditionnel sur le statut)
+    pour qu'un autre worker ne les prenne pas. Les lignes restées 'sending'
+    au-delà de EMAIL_OUTBOX_CLAIM_TIMEOUT (worker tombé) sont reprises.
+    """
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT', 600))
+    due = Q(status=EmailOutbox.STATUS_PENDING, next_attempt_at__lte=now) | Q(
+        status=EmailOutbox.STATUS_SENDING, claimed_at__lt=stale
+    )
+    ids = list(
+        EmailOutbox.objects.filter(due).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    EmailOutbox.objects.filter(due, id__in=ids).update(
+        status=EmailOutbox.STATUS_SENDING, claimed_at=now, claim_token=token
+    )
+    return list(EmailOutbox.objects.filter(claim_token=token, status=EmailOutbox.STATUS_SENDING).order_by('id'))
+
+
+def process_outbox(batch_size=50, max_attempts=None):
+    """
+    Envoie un lot d'emails sur UNE connexion (SMTP ou autre EMAIL_BACKEND).
+    Retourne {'sent': n, 'retry': n, 'failed': n}.
+    """
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    rows = claim_batch(batch_size)
+    stats = {'sent': 0, 'retry': 0, 'failed': 0}
+    if not rows:
+        return stats
+
+    connection = get_connection(fail_silently=False)
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            # Serveur injoignable: un essai échoué pour chaque email réservé (backoff commun)
+            logger.warning(f"Connexion d'envoi impossible ({len(rows)} emails reportés): {e}")
+            for row in rows:
+                record_failure(row, e, max_attempts, stats)
+            return stats
+        for row in rows:
+            try:
+                connection.send_messages([build_row_message(row, connection)])
+            except Exception as e:
+                record_failure(row, e, max_attempts, stats)
+                logger.warning(f"Envoi {row.kind} à {row.to_email} échoué (essai {row.attempts}): {e}")
+            else:
+                row.attempts += 1
+                row.status = EmailOutbox.STATUS_SENT
+                row.sent_at = timezone.now()
+                row.last_error = ''
+                row.context = strip_secrets(row.context)
+                row.claim_token = ''
+                stats['sent'] += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        EmailOutbox.objects.bulk_update(
+            rows,
+            ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'context', 'claim_token'],
+        )
+    return stats
+
+
+def record_failure(row, error, max_attempts, stats):
+    """
+    Essai échoué: nouvelle tentative après backoff(), ou statut 'failed' au-delà
+    de max_attempts (plus jamais envoyé: les secrets du contexte sont effacés).
+    """
+    row.attempts += 1
+    row.last_error = f"{type(error).__name__}: {error}"[:2000]
+    row.claim_token = ''
+    if row.attempts >= max_attempts:
+        row.status = EmailOutbox.STATUS_FAILED
+        row.context = strip_secrets(row.context)
+        stats['failed'] += 1
+    else:
+        row.status = EmailOutbox.STATUS_PENDING
+        row.next_attempt_at = timezone.now() + backoff(row.attempts)
+        stats['retry'] += 1
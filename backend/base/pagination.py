@@ -0,0 +1,143 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur (keyset) sur un tri stable, ex. (-date_defaillance, -id).
+
+    Le curseur encode les valeurs de tri de la dernière ligne renvoyée; la page
+    suivante est obtenue par un WHERE lexicographique sur ces valeurs, donc le
+    coût d'une page profonde reste O(page_size) tant qu'un index couvre le tri.
+
+    La vue déclare son tri via `keyset_ordering` (le dernier champ doit être
+    unique, typiquement l'id). Champs de tri non nullables uniquement.
+
+    Compatibilité (dépréciée): tant que LIST_PAGINATION_OPT_IN est actif, une
+    requête sans `cursor` ni `page_size` renvoie la liste complète comme avant,
+    avec les en-têtes `Deprecation` et `Link` (première page) pour migrer le client.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    default_ordering = ('id',)
+    invalid_cursor_message = 'Curseur invalide.'
+
+    def get_ordering(self, view):
+        ordering = getattr(view, 'keyset_ordering', None) or self.default_ordering
+        return [(f.lstrip('-'), f.startswith('-')) for f in ordering]
+
+    def get_page_size(self, request):
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw:
+            try:
+                size = int(raw)
+            except ValueError:
+                size = 0
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    def is_requested(self, request):
+        params = request.query_params
+        if self.cursor_query_param in params or self.page_size_query_param in params:
+            return True
+        return not getattr(settings, 'LIST_PAGINATION_OPT_IN', True)
+
+    def encode_cursor(self, values):
+        raw = json.dumps(values, separators=(',', ':'), default=str).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token, model, ordering):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, _desc), value in zip(ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def keyset_filter(self, ordering, values):
+        """
+        (a, b, c) < (x, y, z) développé en OR de préfixes égaux; la borne sur le
+        premier champ est répétée seule pour que le moteur parte d'un range scan.
+        """
+        first, first_desc = ordering[0]
+        bound = Q(**{f"{first}__{'lte' if first_desc else 'gte'}": values[0]})
+        after = Q()
+        for i, (name, desc) in enumerate(ordering):
+            prefix = {ordering[j][0]: values[j] for j in range(i)}
+            after |= Q(**prefix, **{f"{name}__{'lt' if desc else 'gt'}": values[i]})
+        return bound & after
+
+    def deprecation_headers(self, request):
+        first = replace_query_param(request.build_absolute_uri(), self.page_size_query_param, self.page_size)
+        return {'Deprecation': 'true', 'Link': f'<{first}>; rel="first"'}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            if view is not None and getattr(view, 'headers', None) is not None:
+                view.headers.update(self.deprecation_headers(request))
+            return None
+
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        ordering = self.get_ordering(view)
+        self.ordering = ordering
+
+        queryset = queryset.order_by(*[('-' if desc else '') + name for name, desc in ordering])
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            values = self.decode_cursor(token, queryset.model, ordering)
+            queryset = queryset.filter(self.keyset_filter(ordering, values))
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        page = rows[:self.page_size_value]
+        self.next_values = (
+            [getattr(page[-1], name) for name, _desc in ordering] if self.has_next else None
+        )
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size_value)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_values))
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'page_size': self.page_size_value,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'page_size': {'type': 'integer'},
+                'results': schema,
+            },
+        }
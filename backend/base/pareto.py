@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .lookups import LOOKUP_FIELDS, label
+from .models import Formulaire
+
+
+# Dimension -> champs values() (id, nom); les listes de choix sont libellées par base.lookups
+PARETO_DIMENSIONS = {
+    'nature_panne': ('nature_panne',),
+    'cause_panne': ('cause_panne',),
+    'equipement': ('equipement', 'equipement__nom'),
+    'atelier': ('atelier', 'atelier__nom'),
+}
+PARETO_METRICS = ('downtime', 'failures')
+
+
+def _hours(duration):
+    return round(duration.total_seconds() / 3600, 2) if duration else 0
+
+
+def _value(row, metric):
+    return row['downtime'].total_seconds() if metric == 'downtime' else row['failures']
+
+
+def pareto(dimension, formulaires=None, metric='downtime', limit=None):
+    """
+    Classement des `dimension` par arrêt cumulé (heuregen) ou nombre de
+    défaillances, en une requête groupée; parts et pourcentages cumulés
+    calculés en une passe. `vital_few`: catégories nécessaires pour
+    atteindre PARETO_THRESHOLD % du total. Au-delà de `limit`, les suivantes
+    sont regroupées dans `others`.
+    """
+    qs = formulaires if formulaires is not None else Formulaire.objects.all()
+    keys = PARETO_DIMENSIONS[dimension]
+    other = 'failures' if metric == 'downtime' else 'downtime'
+    rows = list(
+        qs.order_by().values(*keys)
+        .annotate(failures=Count('id'), downtime=Sum('heuregen'))
+        .order_by(f'-{metric}', f'-{other}', keys[0])
+    )
+    for row in rows:
+        row['downtime'] = row['downtime'] or timedelta()
+    total = sum(_value(row, metric) for row in rows)
+    threshold = getattr(settings, 'PARETO_THRESHOLD', 80)
+
+    results, cumulative, vital_few = [], 0, 0
+    for row in rows:
+        before = cumulative
+        cumulative += _value(row, metric)
+        if total and before * 100 < threshold * total:
+            vital_few += 1
+        pk = row[keys[0]]
+        results.append({
+            'id': pk,
+            'nom': row[keys[1]] if len(keys) > 1 else label(LOOKUP_FIELDS[dimension], pk),
+            'failures': row['failures'],
+            'downtime_hours': _hours(row['downtime']),
+            'share': round(_value(row, metric) * 100 / total, 2) if total else 0,
+            'cumulative': round(cumulative * 100 / total, 2) if total else 0,
+        })
+
+    others = None
+    if limit is not None and len(results) > limit:
+        rest = rows[limit:]
+        others = {
+            'count': len(rest),
+            'failures': sum(row['failures'] for row in rest),
+            'downtime_hours': _hours(sum((row['downtime'] for row in rest), timedelta())),
+            'share': round(sum(_value(row, metric) for row in rest) * 100 / total, 2) if total else 0,
+        }
+        results = results[:limit]
+
+    return {
+        'dimension': dimension,
+        'metric': metric,
+        'threshold': threshold,
+        'total': {
+            'failures': sum(row['failures'] for row in rows),
+            'downtime_hours': _hours(sum((row['downtime'] for row in rows), timedelta())),
+        },
+        'vital_few': vital_few,
+        'results': results,
+        'others': others,
+    }
@@ -0,0 +1,10 @@
+from rest_framework.parsers import BaseParser
+
+
+class CSVTextParser(BaseParser):
+    """Corps text/csv renvoyé tel quel (str) pour un parsing ligne à ligne par la vue."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        return stream.read().decode(encoding).lstrip('\ufeff')
@@ -0,0 +1,122 @@
+import re
+from collections import Counter, defaultdict
+
+from django.db.models import Count, Sum
+
+from .models import FormulairePiece, Stock
+from .text import normalize
+
+
+# ---------- RAPPORT DE CONSOMMATION ----------
+REPORT_GROUPS = {
+    'equipement': ('formulaire__equipement', 'formulaire__equipement__nom'),
+    'atelier': ('formulaire__atelier', 'formulaire__atelier__nom'),
+    'stock': (),
+}
+
+
+def consumption_report(formulaires=None, group='equipement'):
+    """
+    Pièces consommées par équipement (ou atelier, ou au total par pièce),
+    calculées par une requête groupée sur FormulairePiece.
+    `formulaires` (ex. filtré par filter_formulaires) restreint les interventions.
+    """
+    qs = FormulairePiece.objects.all()
+    if formulaires is not None and formulaires.query.has_filters():
+        qs = qs.filter(formulaire__in=formulaires.order_by().values('id'))
+    keys = REPORT_GROUPS[group]
+    rows = (
+        qs.values(*keys, 'stock', 'stock__reference', 'stock__element')
+        .annotate(quantite=Sum('quantite'), interventions=Count('formulaire', distinct=True))
+        .order_by(*keys, '-quantite', 'stock__reference')
+    )
+
+    def piece(row):
+        return {
+            'stock': row['stock'],
+            'reference': row['stock__reference'],
+            'element': row['stock__element'],
+            'quantite': row['quantite'],
+            'interventions': row['interventions'],
+        }
+
+    if not keys:
+        return sorted((piece(r) for r in rows), key=lambda p: (-p['quantite'], p['reference']))
+
+    id_key, name_key = keys
+    groups = {}
+    for row in rows:
+        item = groups.setdefault(row[id_key], {'id': row[id_key], 'nom': row[name_key], 'total': 0, 'pieces': []})
+        item['total'] += row['quantite']
+        item['pieces'].append(piece(row))
+    return sorted(groups.values(), key=lambda g: -g['total'])
+
+
+# ---------- ANALYSE DU TEXTE LIBRE piece_rechange ----------
+_SPLIT_RE = re.compile(r'[,;\n+]|\s+et\s+', re.IGNORECASE)
+_QUANTITY_RES = (
+    # "2 x roulement", "2 pièces roulement", "2 roulement"
+    re.compile(r'^(?P<q>\d{1,4})\s*(?:x|×|\*|pcs?\.?|pi[eè]ces?|u\.?)?\s+(?P<name>.+)$', re.IGNORECASE),
+    # "roulement x2", "roulement * 2"
+    re.compile(r'^(?P<name>.+?)\s*(?:x|×|\*)\s*(?P<q>\d{1,4})$', re.IGNORECASE),
+    # "roulement (2)", "roulement : 2"
+    re.compile(r'^(?P<name>.+?)\s*(?:\(\s*(?P<q>\d{1,4})\s*\)|:\s*(?P<q2>\d{1,4}))$'),
+)
+_EMPTY_VALUES = {'', '-', '--', 'aucun', 'aucune', 'neant', 'rien', 'na', 'n/a', 'sans', '0'}
+
+
+def split_quantity(chunk):
+    """'2 x Roulement' -> ('Roulement', 2); sans quantité explicite -> (chunk, 1)."""
+    chunk = chunk.strip()
+    for regex in _QUANTITY_RES:
+        m = regex.match(chunk)
+        if m:
+            q = m.group('q') or m.groupdict().get('q2')
+            return m.group('name').strip(), int(q)
+    return chunk, 1
+
+
+class StockMatcher:
+    """
+    Associe un libellé libre à un Stock: référence exacte, puis élément exact
+    (s'il est unique), puis référence contenue dans le libellé. Les stocks
+    sont chargés une seule fois.
+    """
+
+    def __init__(self, stocks=None):
+        stocks = list(stocks if stocks is not None else Stock.objects.values_list('pk', 'reference_norm', 'element_norm'))
+        self.by_reference = {ref: pk for pk, ref, _el in stocks if ref}
+        elements = Counter(el for _pk, _ref, el in stocks if el)
+        self.by_element = {el: pk for pk, _ref, el in stocks if el and elements[el] == 1}
+        # Les références longues d'abord: "rlt-0012" avant "rlt-001"
+        self.references = sorted(self.by_reference, key=len, reverse=True)
+
+    def match(self, name):
+        key = normalize(name).strip()
+        if key in self.by_reference:
+            return self.by_reference[key]
+        if key in self.by_element:
+            return self.by_element[key]
+        for ref in self.references:
+            if re.search(rf'(?<!\w){re.escape(ref)}(?!\w)', key):
+                return self.by_reference[ref]
+        return None
+
+
+def parse_pieces(text, matcher):
+    """
+    Découpe piece_rechange ("2 x RLT-001, courroie; filtre (3)") en
+    ({stock_id: quantité}, [libellés non reconnus]).
+    """
+    found, unmatched = defaultdict(int), []
+    for chunk in _SPLIT_RE.split(text or ''):
+        chunk = chunk.strip().strip('.')
+        if normalize(chunk) in _EMPTY_VALUES:
+            continue
+        name, quantity = split_quantity(chunk)
+        pk = matcher.match(name)
+        if pk is None:
+            unmatched.append(chunk)
+        elif quantity > 0:
+            found[pk] += quantity
+    return dict(found), unmatched
@@ -0,0 +1,208 @@
+import cProfile
+import contextvars
+import re
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+
+# ---------- REGISTRE DES MÉTRIQUES ----------
+QUANTILES = (0.5, 0.95, 0.99)
+METRICS = {
+    # nom prometheus -> (clé de l'échantillon, aide)
+    'base_request_duration_seconds': ('wall', "Durée totale de la requête"),
+    'base_request_db_queries': ('queries', "Nombre de requêtes SQL par requête HTTP"),
+    'base_request_db_seconds': ('db', "Temps passé en base par requête HTTP"),
+    'base_request_serializer_seconds': ('serializer', "Temps passé dans les serializers DRF"),
+}
+
+
+class _RouteStats:
+    __slots__ = ('samples', 'count', 'sums')
+
+    def __init__(self, window):
+        self.samples = {key: deque(maxlen=window) for key, _help in METRICS.values()}
+        self.count = 0
+        self.sums = {key: 0.0 for key, _help in METRICS.values()}
+
+
+class MetricsRegistry:
+    """
+    Histogrammes glissants en mémoire par (route, méthode): les quantiles sont
+    calculés sur les `window` derniers échantillons, les sommes/compteurs sont
+    cumulés depuis le démarrage du process.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, method, sample):
+        with self._lock:
+            stats = self._routes.get((route, method))
+            if stats is None:
+                stats = self._routes[(route, method)] = _RouteStats(self.window)
+            stats.count += 1
+            for key, value in sample.items():
+                stats.samples[key].append(value)
+                stats.sums[key] += value
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                label: (stats.count, dict(stats.sums), {k: sorted(v) for k, v in stats.samples.items()})
+                for label, stats in self._routes.items()
+            }
+
+    @staticmethod
+    def quantile(sorted_values, q):
+        if not sorted_values:
+            return 0.0
+        idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+        return sorted_values[idx]
+
+    def to_prometheus(self):
+        """Exposition au format texte Prometheus (type summary)."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, (key, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for (route, method), (count, sums, samples) in sorted(snapshot.items()):
+                labels = f'route="{_escape(route)}",method="{method}"'
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {self.quantile(samples[key], q):.6f}')
+                lines.append(f"{name}_sum{{{labels}}} {sums[key]:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry(getattr(settings, 'REQUEST_PROFILING_WINDOW', 1000))
+
+
+# ---------- TEMPS SERIALIZER ----------
+# Accumulateur de la requête courante: [secondes, profondeur d'imbrication]
+_serializer_timer = contextvars.ContextVar('base_serializer_timer', default=None)
+_patched = False
+
+
+def _install_serializer_timer():
+    """
+    Enveloppe BaseSerializer.data pour mesurer le temps de sérialisation.
+    Seul l'appel le plus externe est compté (les .data imbriqués, ex.
+    AtelierSerializer.get_equipements, sont inclus dans leur parent).
+    """
+    global _patched
+    if _patched:
+        return
+    original = serializers.BaseSerializer.data
+
+    def timed_data(self):
+        timer = _serializer_timer.get()
+        if timer is None:
+            return original.fget(self)
+        timer[1] += 1
+        start = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            timer[1] -= 1
+            if timer[1] == 0:
+                timer[0] += time.perf_counter() - start
+
+    serializers.BaseSerializer.data = property(timed_data)
+    _patched = True
+
+
+# ---------- MIDDLEWARE ----------
+class RequestProfilingMiddleware:
+    """
+    Profilage opt-in des requêtes (REQUEST_PROFILING_ENABLED = True).
+
+    Pour chaque route résolue: temps total, nombre de requêtes SQL et temps SQL
+    (connection.execute_wrapper), temps serializer. Exposé sur /api/metrics/.
+
+    Si REQUEST_PROFILING_CPROFILE_DIR est défini, chaque requête est profilée
+    avec cProfile et le profil est écrit quand elle dépasse
+    REQUEST_PROFILING_SLOW_MS millisecondes.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'REQUEST_PROFILING_SLOW_MS', 500)
+        profile_dir = getattr(settings, 'REQUEST_PROFILING_CPROFILE_DIR', None)
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        if self.profile_dir:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+        _install_serializer_timer()
+
+    def __call__(self, request):
+        db = {'queries': 0, 'time': 0.0}
+
+        def db_wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db['queries'] += 1
+                db['time'] += time.perf_counter() - start
+
+        timer = [0.0, 0]
+        token = _serializer_timer.set(timer)
+        profiler = cProfile.Profile() if self.profile_dir else None
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(db_wrapper))
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            _serializer_timer.reset(token)
+        wall = time.perf_counter() - start
+
+        route = self.route_label(request)
+        registry.record(route, request.method, {
+            'wall': wall,
+            'queries': db['queries'],
+            'db': db['time'],
+            'serializer': timer[0],
+        })
+        if profiler and wall * 1000 >= self.slow_ms:
+            self.dump_profile(profiler, route, request.method, wall)
+        return response
+
+    @staticmethod
+    def route_label(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+        return match.view_name or match.route or 'unresolved'
+
+    def dump_profile(self, profiler, route, method, wall):
+        safe_route = re.sub(r'[^A-Za-z0-9_.-]+', '_', route).strip('_') or 'root'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{method}_{safe_route}_{int(wall * 1000)}ms.prof"
+        profiler.dump_stats(str(self.profile_dir / name))
@@ -0,0 +1,115 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache_utils import (
+    REFERENCE_CACHE_NAMESPACE, bump_version, cache_is_shared, etag_matches, get_version,
+    make_etag, not_modified_since, version_timestamp,
+)
+
+
+PAYLOAD_KEY = "base:reference:{namespace}:{version}:{name}:{part}"
+
+# Viewsets servis depuis le cache, par espace: rechargés après chaque écriture
+_viewsets = {}
+# Une fonction de rafraîchissement par espace (repérée dans les callbacks en attente)
+_refreshers = {}
+
+
+def reference_ttl():
+    return getattr(settings, 'REFERENCE_CACHE_TTL', 3600)
+
+
+def version_ttl():
+    """
+    Durée de vie du jeton de version. Un cache non partagé (LocMem) ne voit pas
+    les écritures des autres workers: la version y est bornée par
+    CACHE_VERSION_TTL, comme celle du tableau de bord.
+    """
+    if cache_is_shared():
+        return reference_ttl()
+    return min(reference_ttl(), getattr(settings, 'CACHE_VERSION_TTL', 300))
+
+
+def payload_key(namespace, version, name, part='list'):
+    return PAYLOAD_KEY.format(namespace=namespace, version=version, name=name, part=part)
+
+
+class VersionedCacheMixin:
+    """
+    Lectures (list / retrieve) d'un ModelViewSet servies depuis le cache.
+
+    Le payload sérialisé est stocké sous la version de `cache_namespace`:
+    une écriture change la version (signaux post_save / post_delete, voir
+    refresh_on_commit) et la liste est réécrite aussitôt (write-through).
+    ETag et Last-Modified sont dérivés de la version; If-None-Match et
+    If-Modified-Since renvoient 304 sans requête ni sérialisation.
+    Les requêtes avec d'autres query params que ?format= ne sont pas cachées.
+    """
+    cache_namespace = REFERENCE_CACHE_NAMESPACE
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _viewsets.setdefault(cls.cache_namespace, []).append(cls)
+
+    @classmethod
+    def cache_name(cls):
+        return cls.queryset.model._meta.model_name
+
+    @classmethod
+    def build_list_payload(cls):
+        # Sérialiseurs sans contexte de requête: utilisable hors requête (write-through)
+        return cls.serializer_class(cls.queryset.all(), many=True).data
+
+    def cached_response(self, request, part, build):
+        if set(request.query_params) - {'format'}:
+            return Response(build())
+        version = get_version(self.cache_namespace, version_ttl())
+        modified = version_timestamp(version)
+        etag = make_etag(self.cache_namespace, version, self.cache_name(), part)
+        if etag_matches(request, etag) or not_modified_since(request, modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = payload_key(self.cache_namespace, version, self.cache_name(), part)
+            payload = cache.get(key)
+            if payload is None:
+                payload = build()
+                cache.set(key, payload, reference_ttl())
+            response = Response(payload)
+        response['ETag'] = etag
+        if modified is not None:
+            response['Last-Modified'] = http_date(modified.timestamp())
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, 'list', lambda: super(VersionedCacheMixin, self).list(request, *args, **kwargs).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        part = f"detail:{kwargs.get(self.lookup_url_kwarg or self.lookup_field)}"
+        return self.cached_response(request, part, lambda: super(VersionedCacheMixin, self).retrieve(request, *args, **kwargs).data)
+
+
+def refresh(namespace=REFERENCE_CACHE_NAMESPACE):
+    """Nouvelle version de l'espace + listes recalculées et stockées sous celle-ci."""
+    bump_version(namespace)
+    version = get_version(namespace, version_ttl())
+    for viewset in _viewsets.get(namespace, ()):
+        cache.set(payload_key(namespace, version, viewset.cache_name()), viewset.build_list_payload(), reference_ttl())
+
+
+def refresh_on_commit(namespace=REFERENCE_CACHE_NAMESPACE):
+    """
+    Rafraîchit après COMMIT: changer la version avant, c'est laisser une lecture
+    concurrente mettre en cache l'ancien état sous la nouvelle version.
+    Un seul rafraîchissement par transaction (ex. atelier supprimé avec ses équipements).
+    """
+    refresher = _refreshers.setdefault(namespace, partial(refresh, namespace))
+    if connection.in_atomic_block and any(entry[1] is refresher for entry in connection.run_on_commit):
+        return
+    transaction.on_commit(refresher)
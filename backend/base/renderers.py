@@ -0,0 +1,31 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class _StreamRenderer(BaseRenderer):
+    """
+    Renderer de négociation pour les vues qui renvoient un StreamingHttpResponse
+    (?format=csv / ndjson ou en-tête Accept). Seules les réponses d'erreur
+    (dict DRF) passent par render(): elles sont sérialisées en JSON et
+    renvoyées en application/json (pas sous le type du flux négocié).
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = f'application/json; charset={self.charset}'
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class CSVStreamRenderer(_StreamRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONStreamRenderer(_StreamRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
@@ -0,0 +1,200 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+
+from .models import Formulaire, EquipementRollup, AtelierRollup
+
+
+PERIODS = {
+    EquipementRollup.PERIOD_DAY: TruncDay,
+    EquipementRollup.PERIOD_MONTH: TruncMonth,
+}
+
+# (modèle de rollup, champ de regroupement)
+SCOPES = (
+    (EquipementRollup, 'equipement'),
+    (AtelierRollup, 'atelier'),
+)
+
+
+def period_bounds(period, d):
+    """Début inclus / fin exclue de la période contenant `d`."""
+    if period == EquipementRollup.PERIOD_MONTH:
+        start = d.replace(day=1)
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        return start, end
+    return d, d + timedelta(days=1)
+
+
+def _as_date(value):
+    return value.date() if hasattr(value, 'date') and callable(value.date) else value
+
+
+def affected_keys(atelier_id, equipement_id, date_defaillance):
+    """Clés (scope, id, période, début) touchées par une ligne de formulaire."""
+    date_defaillance = Formulaire._meta.get_field('date_defaillance').to_python(date_defaillance)
+    keys = set()
+    for period in PERIODS:
+        start, _end = period_bounds(period, date_defaillance)
+        keys.add(('equipement', equipement_id, period, start))
+        keys.add(('atelier', atelier_id, period, start))
+    return keys
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_refresh():
+    """
+    Regroupe les refresh_buckets() du bloc (ex. suppression en lot: un signal
+    post_delete par ligne) en un seul recalcul des clés distinctes à la sortie.
+    """
+    outer = getattr(_deferred, 'keys', None) is None
+    if outer:
+        _deferred.keys = set()
+    try:
+        yield
+        if outer and _deferred.keys:
+            keys, _deferred.keys = _deferred.keys, None
+            refresh_buckets(keys)
+    finally:
+        if outer:
+            _deferred.keys = None
+
+
+def refresh_buckets(keys):
+    """
+    Recalcule uniquement les agrégats listés depuis les lignes de leur période
+    (range scan sur les index (equipement|atelier, date_defaillance)).
+    Un agrégat devenu vide est supprimé.
+    """
+    pending = getattr(_deferred, 'keys', None)
+    if pending is not None:
+        pending.update(keys)
+        return
+    models_by_scope = {field: model for model, field in SCOPES}
+    for scope, obj_id, period, start in keys:
+        model = models_by_scope[scope]
+        _start, end = period_bounds(period, start)
+        agg = Formulaire.objects.filter(
+            **{f"{scope}_id": obj_id},
+            date_defaillance__gte=start,
+            date_defaillance__lt=end,
+        ).aggregate(
+            failures=Count('id'),
+            downtime=Sum('heuregen'),
+            first_failure=Min('date_defaillance'),
+            last_failure=Max('date_defaillance'),
+            atelier_ref=Max('atelier'),
+        )
+        lookup = {f"{scope}_id": obj_id, 'period': period, 'period_start': start}
+        if not agg['failures']:
+            model.objects.filter(**lookup).delete()
+            continue
+        defaults = {
+            'failures': agg['failures'],
+            'downtime': agg['downtime'] or timedelta(),
+            'first_failure': agg['first_failure'],
+            'last_failure': agg['last_failure'],
+        }
+        if model is EquipementRollup:
+            defaults['atelier_id'] = agg['atelier_ref']
+        model.objects.update_or_create(defaults=defaults, **lookup)
+
+
+def rebuild_all(batch_size=1000, stdout=None):
+    """
+    Reconstruit tous les agrégats: une requête groupée par (scope, période),
+    lue en flux et insérée par lots avec bulk_create.
+    """
+    totals = {}
+    with transaction.atomic():
+        for model, field in SCOPES:
+            model.objects.all().delete()
+            for period, trunc in PERIODS.items():
+                rows = (
+                    Formulaire.objects
+                    .annotate(bucket=trunc('date_defaillance'))
+                    .values(field, 'bucket')
+                    .annotate(
+                        n=Count('id'),
+                        downtime=Sum('heuregen'),
+                        first=Min('date_defaillance'),
+                        last=Max('date_defaillance'),
+                        atelier_ref=Max('atelier'),
+                    )
+                    .order_by()
+                )
+                batch, created = [], 0
+                for row in rows.iterator(chunk_size=batch_size):
+                    obj = model(
+                        period=period,
+                        period_start=_as_date(row['bucket']),
+                        failures=row['n'],
+                        downtime=row['downtime'] or timedelta(),
+                        first_failure=row['first'],
+                        last_failure=row['last'],
+                        atelier_id=row['atelier_ref'],
+                        **({'equipement_id': row['equipement']} if field == 'equipement' else {}),
+                    )
+                    batch.append(obj)
+                    if len(batch) >= batch_size:
+                        model.objects.bulk_create(batch)
+                        created += len(batch)
+                        batch = []
+                if batch:
+                    model.objects.bulk_create(batch)
+                    created += len(batch)
+                totals[(model.__name__, period)] = created
+                if stdout is not None:
+                    stdout.write(f"{model.__name__} [{period}]: {created}")
+    return totals
+
+
+def reliability(scope, date_from, date_to, period=EquipementRollup.PERIOD_MONTH, ids=None):
+    """
+    KPIs de fiabilité par équipement ou atelier sur [date_from, date_to] lus
+    dans les agrégats (un range scan sur (period, period_start)).
+    - MTTR = arrêt total / nb défaillances
+    - MTBF = écart moyen entre défaillances successives
+             = (dernière - première) / (n - 1)
+    Avec period='month', les bornes sont arrondies au mois.
+    """
+    model = EquipementRollup if scope == 'equipement' else AtelierRollup
+    group = ['equipement', 'equipement__nom', 'atelier', 'atelier__nom'] if scope == 'equipement' else ['atelier', 'atelier__nom']
+    start, _end = period_bounds(period, date_from)
+    qs = model.objects.filter(period=period, period_start__gte=start, period_start__lte=date_to)
+    if ids:
+        qs = qs.filter(**{f"{scope}_id__in": ids})
+    rows = (
+        qs.values(*group)
+        .annotate(
+            failures=Sum('failures'),
+            downtime=Sum('downtime'),
+            first=Min('first_failure'),
+            last=Max('last_failure'),
+        )
+        .order_by('-failures')
+    )
+    results = []
+    for row in rows:
+        n = row['failures'] or 0
+        downtime = row['downtime'] or timedelta()
+        item = {
+            'id': row[scope],
+            'nom': row[f"{scope}__nom"],
+            'failures': n,
+            'downtime_hours': round(downtime.total_seconds() / 3600, 2),
+            'mttr_hours': round(downtime.total_seconds() / 3600 / n, 2) if n else None,
+            'mtbf_hours': round((row['last'] - row['first']).days * 24 / (n - 1), 2) if n > 1 else None,
+        }
+        if scope == 'equipement':
+            item['atelier'] = row['atelier']
+            item['atelier_nom'] = row['atelier__nom']
+        results.append(item)
+    return results
@@ -0,0 +1,217 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+from .lookups import with_labels
+from .models import Formulaire, FormulaireSearchTerm
+from .text import prefix_range, tokenize as _tokenize
+
+
+FTS_TABLE = 'base_formulaire_fts'
+MAX_TERM_LENGTH = 64
+
+# Champs indexés (lookup Formulaire.values) -> poids dans le classement.
+# Même périmètre que l'ancienne recherche de FormList.jsx. Les listes de choix
+# sont indexées par libellé (with_labels).
+SEARCH_FIELDS = {
+    'id': 1,
+    'atelier__nom': 2,
+    'equipement__nom': 3,
+    'nature_panne': 4,
+    'cause_panne': 3,
+    'pilote': 2,
+    'methode_entretien': 1,
+    'indice_gravite': 1,
+}
+FTS_COLUMNS = [name.replace('__', '_') for name in SEARCH_FIELDS]
+
+
+def tokenize(text):
+    return _tokenize(text, MAX_TERM_LENGTH)
+
+
+# ---------- CHOIX DU MOTEUR ----------
+_fts_tables = {}  # base de données -> table FTS5 présente (vérifié une fois par process)
+
+
+def fts_available():
+    """Vrai si la table virtuelle FTS5 existe (créée par la migration 0010 sur SQLite)."""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts_tables[name] = cursor.fetchone() is not None
+    return _fts_tables[name]
+
+
+def backend():
+    """'fts5' ou 'python' selon FORMULAIRE_SEARCH_BACKEND ('auto' par défaut)."""
+    choice = getattr(settings, 'FORMULAIRE_SEARCH_BACKEND', 'auto')
+    if choice == 'auto':
+        return 'fts5' if fts_available() else 'python'
+    return choice
+
+
+# ---------- INDEXATION ----------
+def _documents(ids=None):
+    qs = Formulaire.objects.order_by('id').values(*SEARCH_FIELDS)
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+    return qs
+
+
+def _fts_index(rows):
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+            f"VALUES (%s{', %s' * len(FTS_COLUMNS)})",
+            [[row['id']] + [str(row[f] or '') for f in SEARCH_FIELDS] for row in rows],
+        )
+
+
+def _fts_remove(ids):
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[i] for i in ids])
+
+
+def _python_terms(rows):
+    terms = []
+    for row in rows:
+        weights = Counter()
+        for field, weight in SEARCH_FIELDS.items():
+            for token in tokenize(row[field]):
+                weights[token] += weight
+        terms.extend(
+            FormulaireSearchTerm(term=term, formulaire_id=row['id'], weight=w)
+            for term, w in weights.items()
+        )
+    return terms
+
+
+def index_formulaires(ids):
+    """(Ré)indexe les formulaires listés; les ids disparus sont retirés de l'index."""
+    ids = list(ids)
+    if not ids:
+        return
+    rows = [with_labels(row) for row in _documents(ids)]
+    with transaction.atomic():
+        if backend() == 'fts5':
+            _fts_remove(ids)
+            _fts_index(rows)
+        else:
+            FormulaireSearchTerm.objects.filter(formulaire_id__in=ids).delete()
+            FormulaireSearchTerm.objects.bulk_create(_python_terms(rows), batch_size=1000)
+
+
+def remove_formulaires(ids):
+    # Index Python: supprimé en cascade avec le formulaire
+    if backend() == 'fts5':
+        _fts_remove(list(ids))
+
+
+def rebuild_index(batch_size=1000, stdout=None):
+    """Vide puis reconstruit l'index du moteur actif, lu en flux par lots."""
+    engine = backend()
+    total = 0
+    with transaction.atomic():
+        if engine == 'fts5':
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        else:
+            FormulaireSearchTerm.objects.all().delete()
+        batch = []
+        for row in _documents().iterator(chunk_size=batch_size):
+            batch.append(with_labels(row))
+            if len(batch) >= batch_size:
+                total += _flush(engine, batch)
+                batch = []
+        if batch:
+            total += _flush(engine, batch)
+    if engine == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    if stdout is not None:
+        stdout.write(f"Moteur {engine}: {total} formulaire(s) indexé(s)")
+    return total
+
+
+def _flush(engine, rows):
+    if engine == 'fts5':
+        _fts_index(rows)
+    else:
+        FormulaireSearchTerm.objects.bulk_create(_python_terms(rows))
+    return len(rows)
+
+
+# ---------- RECHERCHE ----------
+def _restriction(queryset):
+    """Sous-requête des ids filtrés, ou None si le queryset n'a aucun filtre."""
+    if queryset is None or not queryset.query.has_filters():
+        return None
+    return queryset.order_by().values('id')
+
+
+def _fts_search(tokens, queryset, offset, limit):
+    # Chaque terme en préfixe, ET implicite: "broy"* "moteur"*
+    match = ' '.join(f'"{t}"*' for t in tokens)
+    where = f"{FTS_TABLE} MATCH %s"
+    params = [match]
+    restriction = _restriction(queryset)
+    if restriction is not None:
+        sub_sql, sub_params = restriction.query.sql_with_params()
+        where += f" AND rowid IN ({sub_sql})"
+        params += list(sub_params)
+    weights = ', '.join(str(float(w)) for w in SEARCH_FIELDS.values())
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {where}", params)
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} "
+            f"WHERE {where} ORDER BY score, rowid DESC LIMIT %s OFFSET %s",
+            params + [limit, offset],
+        )
+        # bm25: plus petit = plus pertinent; on expose un score positif croissant
+        hits = [(rowid, round(-score, 4)) for rowid, score in cursor.fetchall()]
+    return total, hits
+
+
+def _python_search(tokens, queryset, offset, limit):
+    # Préfixe en range scan sur l'index (term, formulaire)
+    conditions = [Q(**prefix_range('term', t)) for t in tokens]
+    qs = FormulaireSearchTerm.objects.filter(reduce(or_, conditions))
+    restriction = _restriction(queryset)
+    if restriction is not None:
+        qs = qs.filter(formulaire_id__in=restriction)
+    matched = {
+        f"m{i}": Max(Case(When(cond, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        for i, cond in enumerate(conditions)
+    }
+    grouped = (
+        qs.values('formulaire_id')
+        .annotate(score=Sum('weight'), **matched)
+        .filter(**{name: 1 for name in matched})
+        .order_by('-score', '-formulaire_id')
+    )
+    total = grouped.count()
+    hits = [(row['formulaire_id'], float(row['score'])) for row in grouped[offset:offset + limit]]
+    return total, hits
+
+
+def search(q, queryset=None, offset=0, limit=20):
+    """
+    Recherche plein texte classée sur les formulaires.
+    `queryset` (ex. filtré par filter_formulaires) restreint les résultats.
+    Retourne (nombre total de résultats, [(id, score), ...] de la page).
+    """
+    tokens = list(dict.fromkeys(tokenize(q)))
+    if not tokens:
+        return 0, []
+    if backend() == 'fts5':
+        return _fts_search(tokens, queryset, offset, limit)
+    return _python_search(tokens, queryset, offset, limit)
@@ -1,6 +1,15 @@
 from rest_framework import serializers
-from .models import Technicien, Admin, ConnexUser, ConnexionLog,Formulaire,Stock,Atelier,Equipement
+from .models import (
+    Technicien, Admin, ConnexUser, ConnexionLog,Formulaire,FormulairePiece,Stock,StockMovement,Atelier,Equipement, EquipementRollup, AtelierRollup,
+    MethodeEntretien, NaturePanne, CausePanne, IndiceGravite, EtatActionImmediate,
+)
 from django.contrib.auth.hashers import make_password
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .stock import InsufficientStock, consume_pieces
+from . import lookups
 
 
 class _BasePersonSerializer(serializers.ModelSerializer):
@@ -111,34 +120,223 @@ class AtelierSerializer(serializers.ModelSerializer):
         fields = ("id", "nom", "equipements") 
 
     def get_equipements(self, obj):
-        qs = obj.equipements.all().order_by("id")
+        # Lit le cache de prefetch s'il existe (Prefetch ordonné par id côté viewset),
+        # sinon une requête par atelier comme avant.
+        if 'equipements' in getattr(obj, '_prefetched_objects_cache', {}):
+            qs = obj.equipements.all()
+        else:
+            qs = obj.equipements.all().order_by("id")
         return EquipementSerializer(qs, many=True).data
 
 
+class AtelierLiteSerializer(serializers.ModelSerializer):
+    """Atelier sans la liste des équipements (mode ?atelier_details=lite)."""
+    class Meta:
+        model = Atelier
+        fields = ("id", "nom")
+
+
 class EquipementSerializer(serializers.ModelSerializer):
     class Meta:
         model = Equipement
         fields = "__all__"
 
 
+class FormulairePieceSerializer(serializers.ModelSerializer):
+    stock = serializers.IntegerField(source='stock_id')  # existence vérifiée pour tout le lot dans FormulaireSerializer
+    reference = serializers.CharField(source='stock.reference', read_only=True)
+    element = serializers.CharField(source='stock.element', read_only=True)
+
+    class Meta:
+        model = FormulairePiece
+        fields = ['stock', 'reference', 'element', 'quantite']
+        extra_kwargs = {'quantite': {'min_value': 1}}
+
+
+class ChoiceLabelField(serializers.RelatedField):
+    """
+    Liste de choix des formulaires (base.lookups): libellé en lecture comme en
+    écriture, petit entier en base. Sans requête: les listes sont en cache et
+    la lecture se fait sur la clé (<champ>_id). Libellés comparés sans tenir
+    compte de la casse; un libellé inconnu est refusé, ou si
+    FORMULAIRE_CHOICES_AUTO_CREATE rendu sans id et enregistré avec le
+    formulaire (lookups.save_missing), jamais pendant la validation.
+    """
+    default_error_messages = {
+        'invalid': "Libellé attendu (texte non vide).",
+        'unknown': "Valeur inconnue: {value}.",
+    }
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        kwargs.setdefault('queryset', model.objects.all())
+        super().__init__(**kwargs)
+
+    def use_pk_only_optimization(self):
+        return True
+
+    def to_representation(self, value):
+        return lookups.label(self.model, value.pk)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data.strip():
+            self.fail('invalid')
+        value = data.strip()
+        pk = lookups.find(self.model, value)
+        if pk is None:
+            if not lookups.auto_create():
+                self.fail('unknown', value=value)
+            return self.model(label=value)
+        return self.model(pk=pk, label=lookups.label(self.model, pk))
+
+
 class FormulaireSerializer(serializers.ModelSerializer):
    
     atelier = serializers.PrimaryKeyRelatedField(queryset=Atelier.objects.all())
     equipement = serializers.PrimaryKeyRelatedField(queryset=Equipement.objects.all())
 
+    # Listes de choix: l'API garde les libellés
+    methode_entretien = ChoiceLabelField(MethodeEntretien)
+    nature_panne = ChoiceLabelField(NaturePanne)
+    cause_panne = ChoiceLabelField(CausePanne)
+    indice_gravite = ChoiceLabelField(IndiceGravite)
+    etat_action_immediate = ChoiceLabelField(EtatActionImmediate)
+
    
     atelier_details = AtelierSerializer(source="atelier", read_only=True)
     equipement_details = EquipementSerializer(source="equipement", read_only=True)
 
+    # Pièces consommées (création uniquement): décrémentent le stock dans la même transaction
+    pieces = FormulairePieceSerializer(many=True, required=False)
+
     class Meta:
         model = Formulaire
         fields = "__all__"
         # Si tu veux n'exposer que certains champs, remplace "__all__"
         # par la liste explicite + 'atelier_details' et 'equipement_details'.
 
+    def validate_pieces(self, pieces):
+        if self.instance is not None:
+            raise serializers.ValidationError("Les pièces ne sont modifiables qu'à la création (utiliser les mouvements de stock).")
+        ids = {p['stock_id'] for p in pieces}
+        known = set(Stock.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if ids - known:
+            raise serializers.ValidationError(f"Stock introuvable: {', '.join(map(str, sorted(ids - known)))}.")
+        return [{'stock': p['stock_id'], 'quantite': p['quantite']} for p in pieces]
+
+    def create(self, validated_data):
+        pieces = validated_data.pop('pieces', [])
+        user = validated_data.pop('consumed_by', None)
+        with transaction.atomic():
+            lookups.save_missing(validated_data)
+            formulaire = super().create(validated_data)
+            if pieces:
+                try:
+                    consume_pieces(formulaire, pieces, user=user)
+                except InsufficientStock as e:
+                    # Annule aussi la création du formulaire
+                    raise serializers.ValidationError({'pieces': e.shortages})
+        return formulaire
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            lookups.save_missing(validated_data)
+            return super().update(instance, validated_data)
+
+    @staticmethod
+    def details_mode(request):
+        """'full' (défaut, avec équipements de l'atelier) ou 'lite' (id + nom)."""
+        if request is None:
+            return 'full'
+        return 'lite' if request.query_params.get('atelier_details') == 'lite' else 'full'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.details_mode(self.context.get('request')) == 'lite':
+            fields['atelier_details'] = AtelierLiteSerializer(source="atelier", read_only=True)
+        return fields
+
 class StockSerializer(serializers.ModelSerializer):
     class Meta:
         model = Stock
-        fields = '__all__'
+        exclude = ('reference_norm', 'element_norm')
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    reference = serializers.CharField(source='stock.reference', read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'stock', 'reference', 'kind', 'delta', 'quantite_apres', 'motif', 'user', 'username', 'created_at']
+
+
+class StockMovementInputSerializer(serializers.Serializer):
+    """Un mouvement demandé: stock (id) ou reference, delta non nul (+ entrée, - sortie)."""
+    stock = serializers.IntegerField(required=False)
+    reference = serializers.CharField(required=False)
+    delta = serializers.IntegerField()
+    motif = serializers.CharField(required=False, allow_blank=True, max_length=255, default='')
 
+    def validate(self, data):
+        if data['delta'] == 0:
+            raise serializers.ValidationError({'delta': "Le mouvement doit être non nul."})
+        if 'stock' not in data and not data.get('reference'):
+            raise serializers.ValidationError("Indiquer stock (id) ou reference.")
+        return data
 
+
+class StockMovementBatchSerializer(serializers.Serializer):
+    """
+    Lot de mouvements. Les références sont résolues en une requête; un stock
+    inconnu invalide tout le lot.
+    """
+    movements = StockMovementInputSerializer(many=True, allow_empty=False)
+
+    def validate_movements(self, items):
+        max_items = getattr(settings, 'STOCK_MOVEMENTS_MAX_BATCH', 500)
+        if len(items) > max_items:
+            raise serializers.ValidationError(f"Lot trop volumineux (max {max_items}).")
+        ids = {i['stock'] for i in items if 'stock' in i}
+        refs = {i['reference'] for i in items if 'stock' not in i}
+        found = Stock.objects.filter(Q(pk__in=ids) | Q(reference__in=refs)).values_list('pk', 'reference')
+        by_ref = {ref: pk for pk, ref in found}
+        known = set(by_ref.values())
+        errors, resolved = [], []
+        for item in items:
+            pk = item['stock'] if 'stock' in item else by_ref.get(item['reference'])
+            if pk is None or pk not in known:
+                errors.append({'stock': item.get('stock', item.get('reference')), 'error': "Stock introuvable."})
+                continue
+            resolved.append({'stock': pk, 'delta': item['delta'], 'motif': item.get('motif', '')})
+        if errors:
+            raise serializers.ValidationError(errors)
+        return resolved
+
+
+class _RollupSerializer(serializers.ModelSerializer):
+    downtime_hours = serializers.SerializerMethodField()
+    mttr_hours = serializers.SerializerMethodField()
+
+    def get_downtime_hours(self, obj):
+        return round(obj.downtime.total_seconds() / 3600, 2)
+
+    def get_mttr_hours(self, obj):
+        mttr = obj.mttr
+        return round(mttr.total_seconds() / 3600, 2) if mttr is not None else None
+
+
+class EquipementRollupSerializer(_RollupSerializer):
+    class Meta:
+        model = EquipementRollup
+        fields = ('id', 'equipement', 'atelier', 'period', 'period_start', 'failures', 'downtime',
+                  'downtime_hours', 'mttr_hours', 'first_failure', 'last_failure', 'updated_at')
+        read_only_fields = fields
+
+
+class AtelierRollupSerializer(_RollupSerializer):
+    class Meta:
+        model = AtelierRollup
+        fields = ('id', 'atelier', 'period', 'period_start', 'failures', 'downtime',
+                  'downtime_hours', 'mttr_hours', 'first_failure', 'last_failure', 'updated_at')
+        read_only_fields = fields
@@ -0,0 +1,211 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, DateTimeField, ExpressionWrapper, F, FloatField, Min, Q, Sum, Value, Window
+from django.db.models.functions import Ceil, Coalesce, RowNumber, TruncDate
+from django.utils import timezone
+
+from .models import ConnexionLog, ConnexionLogDaily, ConnexUser
+
+
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+def _seconds(duration):
+    return round(duration.total_seconds(), 1) if duration is not None else None
+
+
+def session_max_age():
+    """Durée max d'une session: au-delà, le jeton a expiré (session non fermée = abandonnée)."""
+    return timedelta(seconds=getattr(settings, 'CONNEX_TOKEN_MAX_AGE', 12 * 3600))
+
+
+def day_bounds(date_from, date_to):
+    """[début de date_from, début du lendemain de date_to[ en heure locale."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def cached(name, params, builder, live):
+    """
+    Résultat mis en cache par tranche de temps: les plages qui incluent
+    aujourd'hui (`live`) changent de clé toutes les SESSION_ANALYTICS_BUCKET
+    secondes; les plages passées sont gardées SESSION_ANALYTICS_PAST_TTL.
+    """
+    if live:
+        bucket = getattr(settings, 'SESSION_ANALYTICS_BUCKET', 60)
+        slot, ttl = int(timezone.now().timestamp() // bucket), bucket
+    else:
+        slot, ttl = 'past', getattr(settings, 'SESSION_ANALYTICS_PAST_TTL', 3600)
+    key = "base:sessions:{}:{}:{}".format(name, ":".join(str(p) for p in params), slot)
+    payload = cache.get(key)
+    if payload is None:
+        payload = builder()
+        cache.set(key, payload, ttl)
+    return payload
+
+
+# ---------- SESSIONS ACTIVES ----------
+def active_now(now):
+    """Comptes ayant une session ouverte dont le jeton n'a pas expiré (deux requêtes)."""
+    per_user = {
+        row['user']: row
+        for row in ConnexionLog.objects.filter(
+            date_deconnexion__isnull=True, date_connexion__gt=now - session_max_age(),
+        ).order_by().values('user').annotate(sessions=Count('id'), since=Min('date_connexion'))
+    }
+    users = ConnexUser.objects.filter(id__in=list(per_user)).select_related('admin', 'technicien').order_by('username')
+    return {
+        'at': now,
+        'active_users': len(per_user),
+        'sessions': sum(row['sessions'] for row in per_user.values()),
+        'users': [
+            {
+                'id': u.id, 'username': u.username, 'full_name': u.get_full_name(), 'role': u.role,
+                'sessions': per_user[u.id]['sessions'], 'since': per_user[u.id]['since'],
+            }
+            for u in users
+        ],
+    }
+
+
+# ---------- SESSIONS PAR JOUR ----------
+def sessions_per_day(date_from, date_to):
+    """
+    Sessions, comptes distincts et durée moyenne par jour (heure locale), en
+    deux requêtes groupées: logs détaillés + agrégats des jours compactés
+    (ConnexionLogDaily). Les jours sans connexion sont présents à zéro.
+    """
+    start, end = day_bounds(date_from, date_to)
+    live = (
+        ConnexionLog.objects.filter(date_connexion__gte=start, date_connexion__lt=end)
+        .annotate(day=TruncDate('date_connexion')).order_by().values('day')
+        .annotate(
+            sessions=Count('id'), users=Count('user', distinct=True),
+            closed=Count('duree_connexion'), total=Sum('duree_connexion'),
+        )
+    )
+    compacted = (
+        ConnexionLogDaily.objects.filter(day__gte=date_from, day__lte=date_to).order_by().values('day')
+        .annotate(
+            sessions=Sum('sessions'), users=Count('user'),
+            closed=Sum('closed_sessions'), total=Sum('total_duration'),
+        )
+    )
+    days = {}
+    for row in (*live, *compacted):
+        d = days.setdefault(row['day'], {'sessions': 0, 'users': 0, 'closed': 0, 'total': timedelta()})
+        for field in ('sessions', 'users', 'closed'):
+            d[field] += row[field] or 0
+        d['total'] += row['total'] or timedelta()
+    results = []
+    day = date_from
+    while day <= date_to:
+        d = days.get(day, {'sessions': 0, 'users': 0, 'closed': 0, 'total': timedelta()})
+        results.append({
+            'day': day,
+            'sessions': d['sessions'],
+            'users': d['users'],
+            'closed_sessions': d['closed'],
+            'avg_seconds': _seconds(d['total'] / d['closed']) if d['closed'] else None,
+        })
+        day += timedelta(days=1)
+    return results
+
+
+# ---------- DURÉES ----------
+def duration_stats(start, end, percentiles=DEFAULT_PERCENTILES):
+    """
+    Moyenne, percentiles (rang le plus proche) et maximum des durées des
+    sessions fermées commencées dans [start, end[, en une requête:
+    ROW_NUMBER() / COUNT() / AVG() OVER (ORDER BY durée), filtrée sur les
+    rangs voulus (ceil(p * n / 100)): seules ces quelques lignes sont lues.
+    Les jours compactés n'ont plus le détail: seuls les logs conservés comptent.
+    """
+    ranks = {p: ExpressionWrapper(Ceil(F('n') * p / 100.0), output_field=FloatField()) for p in percentiles}
+    wanted = Q(rn=F('n'))
+    for p, rank in ranks.items():
+        wanted |= Q(rn=rank)
+    rows = list(
+        ConnexionLog.objects.filter(
+            date_connexion__gte=start, date_connexion__lt=end, duree_connexion__isnull=False,
+        ).annotate(
+            rn=Window(RowNumber(), order_by=[F('duree_connexion').asc(), F('id').asc()]),
+            n=Window(Count('id')),
+            avg=Window(Avg('duree_connexion')),
+        ).filter(wanted).order_by().values_list('rn', 'n', 'avg', 'duree_connexion')
+    )
+    if not rows:
+        return {'count': 0, 'avg_seconds': None, 'max_seconds': None, 'percentiles': {f"p{p}": None for p in percentiles}}
+    by_rank = {rn: duration for rn, _n, _avg, duration in rows}
+    _rn, n, avg, _d = rows[0]
+    return {
+        'count': n,
+        'avg_seconds': _seconds(avg),
+        'max_seconds': _seconds(by_rank[n]),
+        'percentiles': {f"p{p}": _seconds(by_rank.get(max(1, -(-n * p // 100)))) for p in percentiles},
+    }
+
+
+# ---------- CONCURRENCE ----------
+def session_events(start, end):
+    """
+    Connexions (+1) et déconnexions (-1) des sessions qui chevauchent
+    [start, end[, triées par la base (UNION ALL ... ORDER BY date, delta: une
+    fin précède un début simultané). Une session non fermée se termine à
+    l'expiration de son jeton.
+    """
+    max_age = session_max_age()
+    sessions = ConnexionLog.objects.filter(
+        date_connexion__lt=end, date_connexion__gte=start - max_age,
+    ).filter(Q(date_deconnexion__isnull=True) | Q(date_deconnexion__gt=start)).order_by()
+    ends = Coalesce(
+        'date_deconnexion', ExpressionWrapper(F('date_connexion') + Value(max_age), output_field=DateTimeField()),
+    )
+    connects = sessions.annotate(t=F('date_connexion'), delta=Value(1)).values_list('t', 'delta')
+    disconnects = sessions.annotate(t=ends, delta=Value(-1)).values_list('t', 'delta')
+    return connects.union(disconnects, all=True).order_by('t', 'delta')
+
+
+def sweep_peaks(events, start, end, step=timedelta(hours=1)):
+    """
+    Balayage en une passe d'événements (date, +1/-1) triés: pic de sessions
+    simultanées de chaque tranche de `step` de [start, end[. Le niveau en
+    entrée de tranche compte (sessions commencées avant et toujours ouvertes).
+    """
+    count = max(1, -(-(end - start) // step))
+    peaks = [0] * count
+    level = 0
+    current = -1  # tranche courante (les précédentes sont terminées); -1: avant start
+    for moment, delta in events:
+        if moment >= end:
+            break
+        if moment >= start:
+            bucket = int((moment - start) // step)
+            while current < bucket:
+                current += 1
+                # Événement pile sur la borne: le niveau d'entrée est celui d'après (intervalles [début, fin[)
+                if current < bucket or moment > start + bucket * step:
+                    peaks[current] = max(peaks[current], level)
+        level += delta
+        if current >= 0:
+            peaks[current] = max(peaks[current], level)
+    while current < count - 1:
+        current += 1
+        peaks[current] = max(peaks[current], level)
+    return peaks
+
+
+def peak_concurrency(start, end, now, step=timedelta(hours=1)):
+    """Pic de sessions simultanées par heure de [start, min(end, now)[, et le pic global."""
+    stop = max(start + step, min(end, now))
+    peaks = sweep_peaks(session_events(start, stop).iterator(), start, stop, step)
+    hours = [
+        {'hour': timezone.localtime(start + i * step), 'peak': peak}
+        for i, peak in enumerate(peaks)
+    ]
+    top = max(hours, key=lambda h: h['peak'])
+    return {'peak': top['peak'], 'peak_hour': top['hour'] if top['peak'] else None, 'hours': hours}
@@ -1,16 +1,203 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import ConnexionLog
-from datetime import timedelta
+from django.conf import settings
+from .models import Technicien, Admin, ConnexUser, Formulaire, Stock, Atelier, Equipement, EmailOutbox
+from .cache_utils import DASHBOARD_CACHE_NAMESPACE, bump_version
+from .reference_cache import refresh_on_commit as refresh_reference_cache
+from .rollups import affected_keys, refresh_buckets
+from .search import index_formulaires, remove_formulaires
+from .stock import notify_low_stock
+from .sync import SYNC_MODELS, record_tombstone
+from .events import publish_on_commit
+from .lookups import LOOKUP_FIELDS, changed as lookup_changed, instance_label
+from .tokens import remember_credentials, revoke_user_tokens, user_cache
 
-@receiver(post_save, sender=ConnexionLog)
-def calculate_duree_connexion(sender, instance, **kwargs):
-    if instance.date_deconnexion and instance.heure_deconnexion:
-        # Calculer la durée de connexion
-        start = timedelta(hours=instance.heure_connexion.hour, minutes=instance.heure_connexion.minute)
-        end = timedelta(hours=instance.heure_deconnexion.hour, minutes=instance.heure_deconnexion.minute)
-        instance.duree_connexion = end - start
-        instance.save()
+DASHBOARD_MODELS = (Technicien, Admin, ConnexUser, Formulaire, Stock, Atelier, Equipement)
 
+# ConnexionLog: pas de signal. La durée est calculée par ConnexionLog.save() /
+# deconnecter(), ou par la base pour les déconnexions écrites en lot (base.connexions).
 
-#comme j'ai dit dans models.py cette fonction est implementée dans le modèle mais il n'est pas utilisé juste s'il aurait une amélioration future
\ No newline at end of file
+
+def invalidate_dashboard(sender, **kwargs):
+    # Toute écriture sur un modèle affiché par /dashboard/summary/ change l'ETag
+    bump_version(DASHBOARD_CACHE_NAMESPACE)
+
+
+for _model in DASHBOARD_MODELS:
+    post_save.connect(invalidate_dashboard, sender=_model, dispatch_uid=f"dashboard-{_model.__name__}-save")
+    post_delete.connect(invalidate_dashboard, sender=_model, dispatch_uid=f"dashboard-{_model.__name__}-delete")
+
+
+# ---------- SYNCHRONISATION INCRÉMENTALE (/api/changes/) ----------
+def remember_deletion(sender, instance, **kwargs):
+    # updated_at couvre créations et modifications; les suppressions laissent une trace
+    record_tombstone(instance)
+
+
+for _model in SYNC_MODELS:
+    post_delete.connect(remember_deletion, sender=_model, dispatch_uid=f"sync-{_model.__name__}-delete")
+
+
+# ---------- ÉVÉNEMENTS TEMPS RÉEL (/api/events/) ----------
+EVENT_MODELS = (Formulaire, Stock, Atelier, Equipement, Technicien, Admin, ConnexUser)
+
+
+def publish_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        publish_on_commit(sender._meta.model_name, 'save', [instance.pk])
+
+
+def publish_delete(sender, instance, **kwargs):
+    publish_on_commit(sender._meta.model_name, 'delete', [instance.pk])
+
+
+for _model in EVENT_MODELS:
+    post_save.connect(publish_save, sender=_model, dispatch_uid=f"events-{_model.__name__}-save")
+    post_delete.connect(publish_delete, sender=_model, dispatch_uid=f"events-{_model.__name__}-delete")
+
+
+# ---------- RÉFÉRENTIELS (ateliers / équipements) ----------
+@receiver(post_save, sender=Atelier)
+@receiver(post_save, sender=Equipement)
+@receiver(post_delete, sender=Atelier)
+@receiver(post_delete, sender=Equipement)
+def invalidate_reference_cache(sender, **kwargs):
+    # Nouvelle version + listes réécrites en cache après commit (base.reference_cache)
+    refresh_reference_cache()
+
+
+# ---------- LISTES DE CHOIX DES FORMULAIRES (base.lookups) ----------
+def invalidate_lookups(sender, **kwargs):
+    # Cache des libellés vidé (après commit si transaction); le tableau de bord les affiche
+    lookup_changed(sender)
+    bump_version(DASHBOARD_CACHE_NAMESPACE)
+
+
+for _model in LOOKUP_FIELDS.values():
+    post_save.connect(invalidate_lookups, sender=_model, dispatch_uid=f"lookups-{_model.__name__}-save")
+    post_delete.connect(invalidate_lookups, sender=_model, dispatch_uid=f"lookups-{_model.__name__}-delete")
+
+
+# ---------- ROLLUPS FIABILITÉ (EquipementRollup / AtelierRollup) ----------
+# Les écritures en masse (bulk_create, update()) ne passent pas par ces
+# signaux: lancer `python manage.py rebuild_rollups` après un import.
+@receiver(pre_save, sender=Formulaire)
+def remember_rollup_keys(sender, instance, **kwargs):
+    instance._previous_rollup_keys = set()
+    if instance.pk:
+        old = (
+            Formulaire.objects.filter(pk=instance.pk)
+            .values('atelier_id', 'equipement_id', 'date_defaillance')
+            .first()
+        )
+        if old:
+            instance._previous_rollup_keys = affected_keys(
+                old['atelier_id'], old['equipement_id'], old['date_defaillance']
+            )
+
+
+@receiver(post_save, sender=Formulaire)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = affected_keys(instance.atelier_id, instance.equipement_id, instance.date_defaillance)
+    refresh_buckets(keys | getattr(instance, '_previous_rollup_keys', set()))
+
+
+@receiver(post_delete, sender=Formulaire)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    refresh_buckets(affected_keys(instance.atelier_id, instance.equipement_id, instance.date_defaillance))
+
+
+# ---------- INDEX DE RECHERCHE (FTS5 / FormulaireSearchTerm) ----------
+# Comme pour les rollups, les écritures en masse doivent appeler
+# index_formulaires() ou `python manage.py rebuild_search_index`.
+@receiver(post_save, sender=Formulaire)
+def index_formulaire_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_formulaires([instance.pk])
+
+
+@receiver(post_delete, sender=Formulaire)
+def unindex_formulaire_on_delete(sender, instance, **kwargs):
+    remove_formulaires([instance.pk])
+
+
+@receiver(post_save, sender=Atelier)
+@receiver(post_save, sender=Equipement)
+def reindex_on_rename(sender, instance, created, raw=False, **kwargs):
+    # Le nom de l'atelier / équipement fait partie du texte indexé
+    if created or raw:
+        return
+    field = 'atelier' if sender is Atelier else 'equipement'
+    index_formulaires(Formulaire.objects.filter(**{field: instance}).values_list('id', flat=True))
+
+
+# ---------- CACHE DES COMPTES / RÉVOCATION DES JETONS ----------
+@receiver(post_save, sender=ConnexUser)
+def invalidate_connex_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.id)
+    remember_credentials(instance)
+
+
+@receiver(post_delete, sender=ConnexUser)
+def forget_connex_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.id)
+    revoke_user_tokens(instance.id)
+
+
+@receiver(post_save, sender=Admin)
+@receiver(post_save, sender=Technicien)
+@receiver(post_delete, sender=Admin)
+@receiver(post_delete, sender=Technicien)
+def invalidate_connex_profiles(sender, **kwargs):
+    # Profils rarement modifiés: on vide tout plutôt que de chercher le compte lié
+    user_cache.invalidate()
+
+
+# ---------- NOTIFICATIONS ADMINS (opt-in, via l'outbox) ----------
+@receiver(pre_save, sender=Stock)
+def remember_stock_quantity(sender, instance, **kwargs):
+    if not getattr(settings, 'EMAIL_NOTIFY_STOCK_ALERTS', False):
+        return
+    instance._previous_quantite = (
+        Stock.objects.filter(pk=instance.pk).values_list('quantite', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Stock)
+def notify_stock_alert(sender, instance, raw=False, **kwargs):
+    # Les mouvements (base.stock.apply_movements) passent par update() et notifient eux-mêmes
+    if not raw:
+        notify_low_stock(instance, getattr(instance, '_previous_quantite', None))
+
+
+@receiver(post_save, sender=Formulaire)
+def notify_failure_report(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    enqueue_failure_report(instance)
+
+
+def enqueue_failure_report(instance):
+    """Rapport de défaillance aux admins (opt-in); aussi appelé par les créations en lot."""
+    if not getattr(settings, 'EMAIL_NOTIFY_FAILURE_REPORTS', False):
+        return
+    EmailOutbox.enqueue_for_admins(
+        EmailOutbox.KIND_FAILURE_REPORT,
+        atelier=str(instance.atelier.nom), equipement=str(instance.equipement.nom),
+        date_defaillance=str(instance.date_defaillance),
+        rows=[
+            ["Date", str(instance.date_defaillance)],
+            ["Horaire", f"{instance.heure_debut:%H:%M} – {instance.heure_fin:%H:%M}"],
+            ["Nature de la panne", instance_label(instance, 'nature_panne')],
+            ["Cause", instance_label(instance, 'cause_panne')],
+            ["Indice de gravité", instance_label(instance, 'indice_gravite')],
+            ["Méthode d'entretien", instance_label(instance, 'methode_entretien')],
+            ["Pièces de rechange", instance.piece_rechange],
+            ["Travaux effectués", instance.travaux_effectues],
+            ["Action immédiate", instance_label(instance, 'etat_action_immediate')],
+            ["Pilote", instance.pilote],
+        ],
+    )
@@ -0,0 +1,164 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .cache_utils import DASHBOARD_CACHE_NAMESPACE, bump_version
+from .events import publish_on_commit
+from .models import Stock, StockMovement, EmailOutbox, FormulairePiece
+
+
+class InsufficientStock(Exception):
+    """Au moins une sortie dépasse la quantité disponible: rien n'a été appliqué."""
+
+    def __init__(self, shortages):
+        super().__init__("Stock insuffisant")
+        self.shortages = shortages
+
+
+def low_stock_threshold():
+    return getattr(settings, 'DASHBOARD_LOW_STOCK_THRESHOLD', 2)
+
+
+def notify_low_stock(stock, previous):
+    """Met une alerte en file pour les admins quand `stock` franchit le seuil (opt-in)."""
+    if not getattr(settings, 'EMAIL_NOTIFY_STOCK_ALERTS', False):
+        return
+    threshold = low_stock_threshold()
+    # Alerte uniquement au franchissement du seuil (pas à chaque écriture sous le seuil)
+    if stock.quantite <= threshold and (previous is None or previous > threshold):
+        EmailOutbox.enqueue_for_admins(
+            EmailOutbox.KIND_STOCK_ALERT,
+            reference=stock.reference, element=stock.element,
+            quantite=stock.quantite, threshold=threshold,
+        )
+
+
+def apply_movements(items, user=None, **ledger_fields):
+    """
+    Applique un lot de mouvements [{"stock": id, "delta": n, "motif": "..."}]
+    en UN seul UPDATE conditionnel:
+
+        UPDATE stock SET quantite = quantite + CASE id WHEN .. THEN delta .. END
+        WHERE (id = a AND quantite >= sortie_a) OR (id = b) ...
+
+    Le contrôle de disponibilité est fait par la base au moment de l'écriture
+    (pas de lecture-modification-écriture): deux techniciens qui consomment
+    la même pièce ne peuvent pas s'écraser. Si une sortie est impossible, la
+    transaction est annulée et InsufficientStock liste les manques.
+
+    Chaque mouvement est journalisé (StockMovement) avec la quantité obtenue;
+    `ledger_fields` est recopié sur chaque ligne du journal.
+    Retourne (mouvements créés, {stock_id: quantité finale}).
+    """
+    totals = defaultdict(int)
+    for item in items:
+        totals[item['stock']] += item['delta']
+    changed = {pk: delta for pk, delta in totals.items() if delta}
+
+    with transaction.atomic():
+        if changed:
+            # Verrou des lignes dans un ordre fixe (PostgreSQL: pas d'interblocage
+            # entre deux lots qui touchent les mêmes pièces; sans effet sous SQLite)
+            list(Stock.objects.select_for_update().filter(pk__in=changed).order_by('pk').values_list('pk', flat=True))
+            condition = reduce(or_, [
+                Q(pk=pk, quantite__gte=-delta) if delta < 0 else Q(pk=pk)
+                for pk, delta in changed.items()
+            ])
+            updated = Stock.objects.filter(condition).update(
+                quantite=F('quantite') + Case(
+                    *[When(pk=pk, then=Value(delta)) for pk, delta in changed.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                updated_at=timezone.now(),  # update() ne renseigne pas auto_now
+            )
+            if updated != len(changed):
+                available = dict(Stock.objects.filter(pk__in=changed).values_list('pk', 'quantite'))
+                raise InsufficientStock([
+                    {'stock': pk, 'disponible': available.get(pk, 0), 'demande': -delta}
+                    for pk, delta in changed.items()
+                    if delta < 0 and available.get(pk, 0) < -delta
+                ])
+
+        stocks = Stock.objects.in_bulk(list(totals))
+        # Journal: quantités intermédiaires reconstituées depuis la quantité finale,
+        # entrées avant sorties pour un même stock (jamais de valeur négative)
+        running = {pk: stocks[pk].quantite - total for pk, total in totals.items()}
+        movements = []
+        for item in sorted(items, key=lambda i: i['delta'] < 0):
+            running[item['stock']] += item['delta']
+            movements.append(StockMovement(
+                stock_id=item['stock'],
+                kind=StockMovement.KIND_IN if item['delta'] > 0 else StockMovement.KIND_OUT,
+                delta=item['delta'],
+                quantite_apres=running[item['stock']],
+                motif=item.get('motif', ''),
+                user=user,
+                **ledger_fields,
+            ))
+        StockMovement.objects.bulk_create(movements)
+
+        for pk, delta in changed.items():
+            notify_low_stock(stocks[pk], stocks[pk].quantite - delta)
+        publish_on_commit('stock', 'save', list(changed))
+
+    # update() n'émet pas post_save: invalider le tableau de bord à la main
+    if changed:
+        bump_version(DASHBOARD_CACHE_NAMESPACE)
+    return movements, {pk: stock.quantite for pk, stock in stocks.items()}
+
+
+def record_adjustment(stock, previous, user=None, motif='Ajustement inventaire'):
+    """Journalise une correction d'inventaire (quantité saisie via PUT/PATCH ou création)."""
+    delta = stock.quantite - (previous or 0)
+    if not delta:
+        return None
+    return StockMovement.objects.create(
+        stock=stock,
+        kind=StockMovement.KIND_ADJUST,
+        delta=delta,
+        quantite_apres=stock.quantite,
+        motif=motif,
+        user=user,
+    )
+
+
+def record_adjustments(changes, user=None):
+    """Version en lot de record_adjustment: [(stock, quantité précédente, motif)] en un bulk_create."""
+    return StockMovement.objects.bulk_create([
+        StockMovement(
+            stock=stock,
+            kind=StockMovement.KIND_ADJUST,
+            delta=stock.quantite - (previous or 0),
+            quantite_apres=stock.quantite,
+            motif=motif,
+            user=user,
+        )
+        for stock, previous, motif in changes
+        if stock.quantite != (previous or 0)
+    ])
+
+
+def consume_pieces(formulaire, pieces, user=None):
+    """
+    Enregistre les pièces [{"stock": id, "quantite": n}] d'un formulaire et
+    les sort du stock dans la transaction courante (tout ou rien).
+    Lève InsufficientStock si une pièce manque.
+    """
+    totals = defaultdict(int)
+    for piece in pieces:
+        totals[piece['stock']] += piece['quantite']
+    with transaction.atomic():
+        FormulairePiece.objects.bulk_create([
+            FormulairePiece(formulaire=formulaire, stock_id=pk, quantite=q) for pk, q in totals.items()
+        ])
+        return apply_movements(
+            [{'stock': pk, 'delta': -q, 'motif': f"Formulaire #{formulaire.pk}"} for pk, q in totals.items()],
+            user=user,
+            formulaire=formulaire,
+        )
@@ -0,0 +1,90 @@
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Admin, Atelier, Equipement, Formulaire, Stock, Technicien, Tombstone
+
+
+# Modèles exposés par /api/changes/ (updated_at + Tombstone à la suppression)
+SYNC_MODELS = (Formulaire, Stock, Atelier, Equipement, Technicien, Admin)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def sync_name(model):
+    return model._meta.model_name
+
+
+def max_changes():
+    return getattr(settings, 'SYNC_MAX_CHANGES', 1000)
+
+
+def cursor_overlap():
+    return timedelta(seconds=getattr(settings, 'SYNC_CURSOR_OVERLAP', 5))
+
+
+def tombstone_retention():
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def encode_cursor(moment):
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        moment = datetime.fromisoformat(base64.urlsafe_b64decode((token + '=' * (-len(token) % 4)).encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    if timezone.is_naive(moment):
+        raise InvalidCursor(token)
+    return moment
+
+
+def record_tombstone(instance):
+    Tombstone.objects.create(model=sync_name(type(instance)), object_id=instance.pk)
+
+
+def changes_since(since, sources, now=None):
+    """
+    Lignes modifiées / supprimées depuis `since` pour chaque source
+    {nom: (queryset, fonction de sérialisation)}.
+
+    Le filtre part de `since - SYNC_CURSOR_OVERLAP`: une transaction commencée
+    avant le curseur précédent mais validée après reste visible (les lignes en
+    double sont idempotentes côté client). Coût: un range scan sur l'index
+    updated_at par modèle + un sur Tombstone, proportionnel aux changements.
+
+    Retourne None quand le client doit tout recharger (curseur plus vieux que
+    la rétention des tombstones, ou plus de SYNC_MAX_CHANGES lignes pour un modèle).
+    """
+    now = now or timezone.now()
+    if since < now - tombstone_retention():
+        return None
+    start = since - cursor_overlap()
+    limit = max_changes()
+    changed, deleted = {}, {name: [] for name in sources}
+    for name, (queryset, serialize) in sources.items():
+        rows = list(queryset.filter(updated_at__gte=start).order_by('updated_at', 'pk')[:limit + 1])
+        if len(rows) > limit:
+            return None
+        changed[name] = serialize(rows) if rows else []
+    tombstones = (
+        Tombstone.objects.filter(deleted_at__gte=start, model__in=list(sources))
+        .order_by('deleted_at').values_list('model', 'object_id')
+    )
+    for name, object_id in tombstones:
+        if object_id not in deleted[name]:
+            deleted[name].append(object_id)
+    return {'changed': changed, 'deleted': deleted}
+
+
+def purge_tombstones(now=None):
+    """Supprime les tombstones plus vieux que la rétention; retourne le nombre supprimé."""
+    now = now or timezone.now()
+    count, _ = Tombstone.objects.filter(deleted_at__lt=now - tombstone_retention()).delete()
+    return count
@@ -1,3 +1,1429 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import re
+import smtplib
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.apps import apps as global_apps
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .benchmark import compare, run_benchmark
+from .models import (
+    Admin, Atelier, AtelierRollup, CausePanne, ConnexUser, ConnexionLog, ConnexionLogDaily, EmailOutbox, Equipement,
+    EquipementRollup, EtatActionImmediate, Formulaire, FormulairePiece, IndiceGravite, MethodeEntretien, NaturePanne,
+    Stock, StockMovement, Technicien, Tombstone,
+)
+from .connexions import buffer as connexion_log_buffer, session_key
+from .db import sqlite_pragma_values
+from .email_utils import LOGO_CID, build_credentials_message, build_message, load_logo
+from .events import FileBackend, compact
+from .outbox import process_outbox
+from .parts import StockMatcher, parse_pieces, split_quantity
+from .profiling import registry as metrics_registry
+from .reference_cache import version_ttl
+from .rollups import rebuild_all
+from .session_stats import sweep_peaks
+from .stock import InsufficientStock, apply_movements
+from .sync import encode_cursor, purge_tombstones
+from .tokens import InvalidToken, issue_token, verify_token
+
+
+# "SCAN base_formulaire" (sans USING ... INDEX) = parcours complet de la table
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def query_plan(sql):
+    """Lignes 'detail' de EXPLAIN QUERY PLAN pour une requête capturée."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def failure(atelier, equipement, day, start=time(8, 0), end=time(9, 0), **fields):
+    """Formulaire minimal non enregistré (les listes de choix restent vides sauf `fields`)."""
+    return Formulaire(
+        atelier=atelier, equipement=equipement, date_defaillance=day, heure_debut=start, heure_fin=end,
+        **{'piece_rechange': "-", 'travaux_effectues': "-", 'pilote': "test", **fields},
+    )
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN: SQLite uniquement")
+class QueryPlanTests(TestCase):
+    """
+    Garde-fou des index: chaque endpoint chaud est appelé via le client de test,
+    ses requêtes SELECT sont capturées et leur plan ne doit contenir aucun
+    parcours complet des tables listées (ni tri temporaire pour les listes keyset).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.create(nom="Broyage")
+        cls.equipement = Equipement.objects.create(nom="Broyeur 1", atelier=cls.atelier)
+        today = date.today()
+        # Listes de choix créées par la migration 0017
+        cls.gravite = IndiceGravite.objects.get(label="Intervention nécessaire dans les 48 heures")
+        for i in range(5):
+            Formulaire.objects.create(
+                atelier=cls.atelier, equipement=cls.equipement,
+                date_defaillance=today - timedelta(days=i),
+                heure_debut=time(8, 0), heure_fin=time(9, 30),
+                methode_entretien=MethodeEntretien.objects.get(label="Dépannage"),
+                nature_panne=NaturePanne.objects.get(label="Origine Mécanique"),
+                cause_panne=CausePanne.objects.get(label="Durée de vie"),
+                indice_gravite=cls.gravite, piece_rechange="-", travaux_effectues="-",
+                etat_action_immediate=EtatActionImmediate.objects.get(label="Fait"), pilote="test",
+            )
+        admin = Admin.objects.create(
+            nom="Plan", prenom="Test", email="plan@example.com", date_naissance=date(1990, 1, 1),
+        )
+        cls.user = ConnexUser.objects.filter(admin=admin).first() or ConnexUser.objects.create(
+            username="plan.test", password="-", role="admin", admin=admin,
+        )
+        ConnexionLog.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertIndexedPlan(self, url, tables, sorted_by_index=False, full_scan_ok=None, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200, url)
+        checked = 0
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            # Requêtes dont la table principale est surveillée (pas les prefetch voisins)
+            if not sql.lstrip().upper().startswith('SELECT') or not any(f'FROM "{t}"' in sql for t in tables):
+                continue
+            if full_scan_ok and full_scan_ok(sql):
+                continue
+            plan = query_plan(sql)
+            checked += 1
+            for detail in plan:
+                m = FULL_SCAN_RE.match(detail)
+                self.assertFalse(
+                    m and m.group(1) in tables,
+                    f"{url}: parcours complet de {m and m.group(1)}\n{sql}\n" + "\n".join(plan),
+                )
+                if sorted_by_index:
+                    self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', detail, f"{url}: tri hors index\n{sql}")
+        self.assertTrue(checked, f"{url}: aucune requête sur {', '.join(tables)}")
+
+    def test_formulaire_list(self):
+        self.assertIndexedPlan('/api/formulaires/', ['base_formulaire'], sorted_by_index=True)
+
+    def test_formulaire_list_filters(self):
+        today = date.today()
+        for params in (
+            f"atelier={self.atelier.id}&from={today - timedelta(days=30)}&to={today}",
+            f"equipement={self.equipement.id}",
+            urlencode({'indice_gravite': self.gravite.label}),
+            f"from={today - timedelta(days=7)}",
+        ):
+            with self.subTest(params=params):
+                self.assertIndexedPlan(f'/api/formulaires/?{params}', ['base_formulaire'], sorted_by_index=True)
+
+    def test_anomalies_timeseries(self):
+        for params in ("timeframe=month", "timeframe=year&group_by=atelier"):
+            with self.subTest(params=params):
+                self.assertIndexedPlan(f'/api/api/anomalies/?{params}', ['base_formulaire'])
+
+    def test_dashboard_summary(self):
+        # Totaux toutes dates: un agrégat sans WHERE lit chaque ligne une fois (voulu);
+        # listes et classements doivent rester servis par les index
+        self.assertIndexedPlan(
+            '/api/dashboard/summary/', ['base_formulaire'],
+            full_scan_ok=lambda sql: not re.search(r' (WHERE|GROUP BY|ORDER BY) ', sql),
+        )
+
+    def test_dashboard_totals(self):
+        # Totaux lus sur les formulaires: justes même après une écriture qui contourne les signaux
+        Formulaire.objects.bulk_create([failure(self.atelier, self.equipement, date(2020, 1, 1), time(8), time(10))])
+        Formulaire.objects.filter(date_defaillance=date(2020, 1, 1)).update(heure_fin=time(9))
+        body = self.client.get('/api/dashboard/summary/').json()
+        self.assertEqual(body['counts']['forms'], 6)
+        self.assertEqual(body['downtime_hours']['total'], 8.5)
+        self.assertEqual(body['failures']['last_30_days'], 5)
+
+    def test_connexion_logs_per_user(self):
+        self.assertIndexedPlan(
+            f'/api/connexionlogs/?user={self.user.id}', ['base_connexionlog'], sorted_by_index=True,
+            HTTP_AUTHORIZATION=f"Session {issue_token(self.user)}",
+        )
+
+    def test_atelier_equipements_prefetch(self):
+        self.assertIndexedPlan('/api/ateliers/', ['base_equipement'])
+
+    def test_sync_changes(self):
+        since = encode_cursor(timezone.now() - timedelta(minutes=5))
+        self.assertIndexedPlan(
+            f'/api/changes/?since={since}', ['base_formulaire', 'base_stock', 'base_tombstone'], sorted_by_index=True,
+        )
+
+
+class BenchmarkSmokeTests(TestCase):
+    """seed_benchmark_data + run_benchmark sur un petit volume: aucune route GET en erreur 5xx."""
+
+    def test_seed_and_run(self):
+        call_command(
+            'seed_benchmark_data', ateliers=2, equipements=6, formulaires=300, connexion_logs=50,
+            stocks=20, techniciens=3, stdout=StringIO(),
+        )
+        self.assertEqual(Formulaire.objects.count(), 300)
+        self.assertFalse(Formulaire.objects.filter(heuregen__isnull=True).exists())
+
+        report = run_benchmark(iterations=1)
+        self.assertTrue(report['meta']['authenticated'])
+        names = {r['name'] for r in report['results']}
+        self.assertTrue({'formulaire-list', 'dashboard-summary', 'anomalies-timeseries'} <= names)
+        for result in report['results']:
+            self.assertLess(result['status'], 500, result['url'])
+        self.assertEqual(compare(report, report), [])
+
+
+class AnomaliesTimeseriesTests(TestCase):
+    """/api/anomalies/: une requête groupée, intervalles vides complétés, séries par dimension."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a1 = Atelier.objects.create(nom="Broyage")
+        cls.a2 = Atelier.objects.create(nom="Cuisson")
+        e1 = Equipement.objects.create(nom="Broyeur", atelier=cls.a1)
+        e2 = Equipement.objects.create(nom="Four", atelier=cls.a2)
+        monday = date(2024, 3, 4)
+        Formulaire.objects.bulk_create([
+            failure(cls.a1, e1, monday), failure(cls.a1, e1, monday + timedelta(days=2)),
+            failure(cls.a2, e2, monday + timedelta(days=6)), failure(cls.a2, e2, monday + timedelta(days=14)),
+            failure(cls.a1, e1, monday + timedelta(days=21)),  # hors plage
+        ])
+
+    def test_weekly_by_atelier(self):
+        with self.assertNumQueries(1):
+            body = self.client.get(
+                '/api/api/anomalies/?from=2024-03-05&to=2024-03-20&granularity=week&group_by=atelier'
+            ).json()
+        self.assertEqual(body['buckets'], ['2024-03-04', '2024-03-11', '2024-03-18'])
+        self.assertEqual(body['data'], [2, 0, 1])  # le lundi 4 est avant from: non compté
+        self.assertEqual(
+            [(s['label'], s['data']) for s in body['series']],
+            [("Cuisson", [1, 0, 1]), ("Broyage", [1, 0, 0])],  # série la plus chargée en premier
+        )
+
+    def test_invalid_params(self):
+        for params in ("from=2024-03-10&to=2024-03-01", "from=hier", "granularity=hour&from=2024-03-01",
+                       "group_by=pilote"):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(f'/api/api/anomalies/?{params}').status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    """Listes paginées par curseur: pages sans doublon ni trou, tri stable sur les dates égales."""
+
+    @classmethod
+    def setUpTestData(cls):
+        atelier = Atelier.objects.create(nom="Broyage")
+        equipement = Equipement.objects.create(nom="Broyeur", atelier=atelier)
+        day = date(2024, 3, 10)
+        Formulaire.objects.bulk_create([
+            failure(atelier, equipement, day - timedelta(days=offset)) for offset in (0, 0, 1, 1, 1, 2, 3)
+        ])
+
+    def test_pages_follow_ordering(self):
+        expected = list(Formulaire.objects.order_by('-date_defaillance', '-id').values_list('id', flat=True))
+        full = self.client.get('/api/formulaires/')
+        self.assertEqual([f['id'] for f in full.json()], expected)  # liste complète, dépréciée
+        self.assertEqual(full['Deprecation'], 'true')
+        self.assertIn('page_size=50>; rel="first"', full['Link'])
+
+        seen, url = [], '/api/formulaires/?page_size=3'
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body['results']), 3)
+            seen += [f['id'] for f in body['results']]
+            url = body['next']
+        self.assertEqual(seen, expected)
+        self.assertFalse(self.client.get('/api/formulaires/?page_size=3').has_header('Deprecation'))
+
+    @override_settings(LIST_PAGINATION_OPT_IN=False)
+    def test_paginated_by_default(self):
+        body = self.client.get('/api/formulaires/').json()
+        self.assertEqual((len(body['results']), body['next']), (7, None))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/formulaires/?cursor=pas-un-curseur').status_code, 404)
+
+
+class DashboardSummaryTests(TestCase):
+    """/api/dashboard/summary/: KPIs agrégés, ETag invalidé par les écritures."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.create(nom="Broyage")
+        cls.equipement = Equipement.objects.create(nom="Broyeur", atelier=cls.atelier)
+        Stock.objects.create(reference="R-0", element="Roulement", quantite=0)
+        Stock.objects.create(reference="R-1", element="Courroie", quantite=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_kpis_and_etag(self):
+        today = timezone.localdate()
+        failure(self.atelier, self.equipement, today, end=time(10, 0)).save()
+        failure(self.atelier, self.equipement, today - timedelta(days=10)).save()
+        response = self.client.get('/api/dashboard/summary/')
+        body = response.json()
+        self.assertEqual(body['failures']['today'], 1)
+        self.assertEqual(body['failures']['last_30_days'], 2)
+        self.assertEqual(body['downtime_hours']['today'], 2.0)
+        self.assertEqual((body['stock_alerts']['rupture_count'], body['stock_alerts']['critical_count']), (1, 1))
+        self.assertEqual(body['top_equipements'][0]['failures'], 2)
+
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/dashboard/summary/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        failure(self.atelier, self.equipement, today).save()
+        response = self.client.get('/api/dashboard/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['failures']['today'], 2)
+
+
+class ReliabilityRollupTests(TestCase):
+    """Rollups tenus à jour par les écritures de formulaires; KPIs /reliability/ (MTTR, MTBF)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.create(nom="Broyage")
+        cls.equipement = Equipement.objects.create(nom="Broyeur", atelier=cls.atelier)
+
+    def rollups(self):
+        return sorted(EquipementRollup.objects.filter(period='month').values_list('period_start', 'failures', 'downtime'))
+
+    def test_incremental_and_rebuild(self):
+        first = failure(self.atelier, self.equipement, date(2024, 3, 1), end=time(10, 0))
+        first.save()
+        failure(self.atelier, self.equipement, date(2024, 3, 11)).save()
+        self.assertEqual(self.rollups(), [(date(2024, 3, 1), 2, timedelta(hours=3))])
+
+        first.date_defaillance = date(2024, 4, 2)  # change de mois: les deux agrégats sont recalculés
+        first.save()
+        self.assertEqual(self.rollups(), [(date(2024, 3, 1), 1, timedelta(hours=1)),
+                                          (date(2024, 4, 1), 1, timedelta(hours=2))])
+        first.delete()
+        self.assertEqual(self.rollups(), [(date(2024, 3, 1), 1, timedelta(hours=1))])
+
+        # Reconstruction complète (commande, migration 0007): mêmes agrégats
+        failure(self.atelier, self.equipement, date(2024, 3, 21), end=time(11, 0)).save()
+        incremental = self.rollups()
+        rebuild_all()
+        self.assertEqual(self.rollups(), incremental)
+        EquipementRollup.objects.all().delete()
+        AtelierRollup.objects.all().delete()
+        import_module('base.migrations.0007_reliability_rollups').fill_rollups(global_apps, None)
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(AtelierRollup.objects.filter(period='day').count(), 2)
+
+    def test_reliability_kpis(self):
+        for day, end in ((date(2024, 3, 1), time(9, 0)), (date(2024, 3, 11), time(11, 0))):
+            failure(self.atelier, self.equipement, day, end=end).save()
+        body = self.client.get('/api/reliability/?scope=equipement&period=day&from=2024-03-01&to=2024-03-31').json()
+        self.assertEqual(body['results'], [{
+            'id': self.equipement.id, 'nom': "Broyeur", 'failures': 2, 'downtime_hours': 4.0,
+            'mttr_hours': 2.0, 'mtbf_hours': 240.0, 'atelier': self.atelier.id, 'atelier_nom': "Broyage",
+        }])
+        self.assertEqual(self.client.get('/api/reliability/?scope=pilote').status_code, 400)
+
+
+class SerializerQueryCountTests(TestCase):
+    """Ateliers et formulaires avec détails imbriqués: nombre de requêtes indépendant du nombre de lignes."""
+
+    def add_ateliers(self, n):
+        for _ in range(n):
+            atelier = Atelier.objects.create(nom=f"Atelier {Atelier.objects.count()}")
+            equipements = [Equipement.objects.create(nom=f"E{i}", atelier=atelier) for i in range(2)]
+            failure(atelier, equipements[0], date(2024, 3, 1)).save()
+
+    def count_queries(self, url):
+        cache.clear()  # /ateliers/ est servi depuis le cache de référence
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_constant_queries(self):
+        urls = ('/api/ateliers/', '/api/formulaires/?page_size=100&atelier_details=full')
+        self.add_ateliers(2)
+        before = [self.count_queries(url) for url in urls]
+        self.add_ateliers(3)
+        self.assertEqual([self.count_queries(url) for url in urls], before)
+        ateliers = self.client.get(urls[0]).json()
+        self.assertEqual({tuple(e['nom'] for e in a['equipements']) for a in ateliers}, {("E0", "E1")})
+
+
+@override_settings(REQUEST_PROFILING_ENABLED=True)
+class RequestProfilingTests(TestCase):
+    """RequestProfilingMiddleware: durée et requêtes SQL par route, exposées sur /api/metrics/."""
+
+    def setUp(self):
+        metrics_registry.reset()
+        self.admin = ConnexUser.objects.create(username="metrics.admin", password="x", role='admin')
+
+    def tearDown(self):
+        metrics_registry.reset()
+
+    def test_metrics(self):
+        Atelier.objects.create(nom="Broyage")
+        for _ in range(2):
+            self.client.get('/api/ateliers/?page_size=10')
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION=f"Session {issue_token(self.admin)}")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('base_request_duration_seconds_count{route="atelier-list",method="GET"} 2', text)
+        queries = re.search(r'base_request_db_queries_sum\{route="atelier-list",method="GET"\} ([\d.]+)', text)
+        self.assertGreater(float(queries.group(1)), 0)
+
+        tech = ConnexUser.objects.create(username="metrics.tech", password="x", role='technicien')
+        self.assertEqual(
+            self.client.get('/api/metrics/', HTTP_AUTHORIZATION=f"Session {issue_token(tech)}").status_code, 403,
+        )
+
+
+@override_settings(ONBOARDING_HASH_WORKERS=1, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PersonnelOnboardingTests(TestCase):
+    """Création en lot de personnel: lignes rejetées, doublons, mode strict, commande d'import."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = ConnexUser.objects.create(username="onboard.admin", password="x", role='admin')
+        Technicien.objects.create(nom="Ali", prenom="Sami", email="pris@example.com", date_naissance=date(1990, 1, 1))
+
+    def post(self, body, query=''):
+        return self.client.post(
+            f'/api/personnel/bulk/{query}', body, content_type='application/json',
+            HTTP_AUTHORIZATION=f"Session {issue_token(self.admin)}",
+        )
+
+    def test_bulk_create(self):
+        rows = [
+            {"nom": "Ben", "prenom": "Omar", "email": "omar@example.com", "date_naissance": "01/02/1991"},
+            {"nom": "Ben", "prenom": "Omar", "email": "omar2@example.com", "date_naissance": "1992-03-04",
+             "role": "admin"},
+            {"nom": "Dup", "prenom": "Lot", "email": "omar@example.com", "date_naissance": "1990-01-01"},
+            {"nom": "Ali", "prenom": "Sami", "email": "pris@example.com", "date_naissance": "1990-01-01"},
+            {"nom": "Sans", "prenom": "Date", "email": "date@example.com"},
+        ]
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual([(c['row'], c['role'], c['username']) for c in report['created']],
+                         [(1, 'technicien', 'omar.ben'), (2, 'admin', 'omar.ben1')])
+        self.assertEqual([r['row'] for r in report['rejected']], [3, 4, 5])
+        self.assertEqual(ConnexUser.objects.get(username='omar.ben1').admin.email, "omar2@example.com")
+        self.assertEqual(
+            sorted(EmailOutbox.objects.filter(kind=EmailOutbox.KIND_CREDENTIALS).values_list('to_email', flat=True)),
+            ["omar2@example.com", "omar@example.com", "pris@example.com"],  # pris@: save() du setUp
+        )
+
+    def test_strict_and_dry_run(self):
+        rows = [
+            {"nom": "Ok", "prenom": "Un", "email": "un@example.com", "date_naissance": "1990-01-01"},
+            {"nom": "Ko", "prenom": "Deux", "email": "pas-un-email", "date_naissance": "1990-01-01"},
+        ]
+        report = self.post(rows, '?strict=1').json()
+        self.assertEqual((report['created'], [r['row'] for r in report['rejected']]), ([], [2]))
+        report = self.post(rows, '?dry_run=1').json()
+        self.assertEqual([c['row'] for c in report['created']], [1])
+        self.assertFalse(Technicien.objects.filter(email="un@example.com").exists())
+        self.assertEqual(self.post(rows, '?role=chef').status_code, 400)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write("nom;prenom;email;date_naissance\nTrabelsi;Rim;rim@example.com;05/06/1995\n")
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        call_command('import_personnel', f.name, '--no-email', stdout=out)
+        self.assertIn("1 ligne(s) créées, 0 rejetée(s)", out.getvalue())
+        user = ConnexUser.objects.get(username='rim.trabelsi')
+        self.assertEqual((user.role, user.technicien.date_naissance), ('technicien', date(1995, 6, 5)))
+        self.assertFalse(EmailOutbox.objects.filter(to_email="rim@example.com").exists())
+
+
+class EmailTemplateTests(TestCase):
+    """Gabarits d'emails: sujet en texte brut, HTML échappé, logo inline encodé une seule fois."""
+
+    def test_stock_alert(self):
+        msg = build_message('stock_alert', "admin@example.com", {
+            'reference': "R<1>", 'element': "Roulement & joint", 'quantite': 2, 'threshold': 2,
+        })
+        self.assertEqual(msg.subject, "Alerte stock — R<1> (2 restants)")
+        self.assertIn("Élément: Roulement & joint", msg.body)
+        html = msg.alternatives[0][0]
+        self.assertIn("Roulement &amp; joint", html)
+        self.assertNotIn("R<1>", html)
+        with self.assertRaises(ValueError):
+            build_message('inconnu', "admin@example.com", {})
+
+    def test_logo_loaded_once(self):
+        if load_logo() is None:
+            self.skipTest("logo absent")
+        with mock.patch('base.email_utils.Path.read_bytes') as read_bytes:
+            messages = [
+                build_credentials_message(f"u{i}@example.com", "Nom", "Prénom", f"u{i}", "secret", "technicien")
+                for i in range(2)
+            ]
+        read_bytes.assert_not_called()
+        for msg in messages:
+            logo = msg.attachments[-1]
+            self.assertEqual(logo['Content-ID'], f"<{LOGO_CID}>")
+            self.assertEqual(logo.get_payload(), load_logo().payload)
+            self.assertIn(f"cid:{LOGO_CID}", msg.alternatives[0][0])
+        self.assertIn("u1", messages[1].body)
+
+
+class FormulaireSearchTests(TestCase):
+    """Recherche plein texte /api/formulaires/search/: préfixes sans accents, ET implicite, classement, filtres."""
+
+    @classmethod
+    def setUpTestData(cls):
+        broyage = Atelier.objects.create(nom="Broyage")
+        cuisson = Atelier.objects.create(nom="Cuisson")
+        moteur = Equipement.objects.create(nom="Moteur principal", atelier=broyage)
+        four = Equipement.objects.create(nom="Four rotatif", atelier=cuisson)
+        electrique = NaturePanne.objects.get(label="Origine électrique")
+        mecanique = NaturePanne.objects.get(label="Origine Mécanique")
+        cls.moteur_elec = failure(broyage, moteur, date(2024, 3, 1), nature_panne=electrique)
+        cls.moteur_meca = failure(broyage, moteur, date(2024, 3, 2), nature_panne=mecanique)
+        cls.four_elec = failure(cuisson, four, date(2024, 3, 3), nature_panne=electrique)
+        for formulaire in (cls.moteur_elec, cls.moteur_meca, cls.four_elec):
+            formulaire.save()  # post_save: indexation
+
+    def search(self, query):
+        response = self.client.get(f'/api/formulaires/search/?{urlencode(query)}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def check_backend(self):
+        body = self.search({'q': "ELEC moteur"})
+        self.assertEqual((body['count'], [r['id'] for r in body['results']]), (1, [self.moteur_elec.pk]))
+        self.assertIn('score', body['results'][0])
+
+        body = self.search({'q': "electrique"})
+        self.assertEqual({r['id'] for r in body['results']}, {self.moteur_elec.pk, self.four_elec.pk})
+        body = self.search({'q': "mot", 'atelier': self.moteur_meca.atelier_id, 'page_size': 1})
+        self.assertEqual((body['count'], body['has_next'], len(body['results'])), (2, True, 1))
+        self.assertEqual(self.search({'q': "four", 'atelier': self.moteur_meca.atelier_id})['count'], 0)
+
+        # Renommage de l'équipement: les formulaires liés sont réindexés
+        four = Equipement.objects.get(pk=self.four_elec.equipement_id)
+        four.nom = "Calcinateur"
+        four.save()
+        self.assertEqual([r['id'] for r in self.search({'q': "calcin"})['results']], [self.four_elec.pk])
+        self.assertEqual(self.search({'q': "rotatif"})['count'], 0)
+
+        self.assertEqual(self.client.get('/api/formulaires/search/?q=%20').status_code, 400)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "FTS5: SQLite uniquement")
+    @override_settings(FORMULAIRE_SEARCH_BACKEND='fts5')
+    def test_fts5(self):
+        self.check_backend()
+
+    @override_settings(FORMULAIRE_SEARCH_BACKEND='python')
+    def test_python(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.check_backend()
+
+
+class StockMovementTests(TestCase):
+    """apply_movements et POST /stocks/movements/: tout ou rien, jamais de quantité négative."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vis = Stock.objects.create(reference="VIS-10", element="Vis M10", quantite=5)
+        cls.joint = Stock.objects.create(reference="JNT-2", element="Joint", quantite=1)
+
+    def post(self, movements):
+        return self.client.post('/api/stocks/movements/', {'movements': movements}, content_type='application/json')
+
+    def quantities(self):
+        return dict(Stock.objects.values_list('reference', 'quantite'))
+
+    def test_apply(self):
+        movements, quantities = apply_movements([
+            {'stock': self.vis.pk, 'delta': -5, 'motif': "Sortie"},
+            {'stock': self.vis.pk, 'delta': 2, 'motif': "Retour"},
+            {'stock': self.joint.pk, 'delta': 3},
+        ])
+        self.assertEqual(quantities, {self.vis.pk: 2, self.joint.pk: 4})
+        # Entrées journalisées avant les sorties: la quantité intermédiaire reste positive
+        self.assertEqual([(m.delta, m.quantite_apres) for m in movements], [(2, 7), (3, 4), (-5, 2)])
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.KIND_OUT).count(), 1)
+
+    def test_shortage_rejects_whole_set(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            apply_movements([
+                {'stock': self.vis.pk, 'delta': -2},
+                {'stock': self.joint.pk, 'delta': -1},
+                {'stock': self.joint.pk, 'delta': -1},  # 2 demandés au total pour 1 disponible
+            ])
+        self.assertEqual(ctx.exception.shortages, [{'stock': self.joint.pk, 'disponible': 1, 'demande': 2}])
+        self.assertEqual(self.quantities(), {"VIS-10": 5, "JNT-2": 1})
+        self.assertFalse(StockMovement.objects.exists())
+
+        response = self.post([{'stock': self.vis.pk, 'delta': -6}, {'reference': "JNT-2", 'delta': 4}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['shortages'], [{'stock': self.vis.pk, 'disponible': 5, 'demande': 6}])
+        self.assertEqual(self.quantities(), {"VIS-10": 5, "JNT-2": 1})
+
+    def test_never_negative(self):
+        response = self.post([{'reference': "VIS-10", 'delta': -5}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['stocks'], [{'id': self.vis.pk, 'quantite': 0}])
+        self.assertEqual(self.post([{'stock': self.vis.pk, 'delta': -1}]).status_code, 409)
+        self.assertEqual(self.quantities()["VIS-10"], 0)
+
+    def test_missing_reference(self):
+        response = self.post([{'reference': "INCONNUE", 'delta': -1}, {'stock': self.vis.pk, 'delta': -1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['movements'], [{'stock': "INCONNUE", 'error': "Stock introuvable."}])
+        self.assertEqual(self.post([{'stock': self.vis.pk, 'delta': 0}]).status_code, 400)
+        self.assertEqual(self.quantities()["VIS-10"], 5)
+
+
+class FormulairePiecesTests(TestCase):
+    """Pièces consommées à la création d'un formulaire: sortie de stock unique, tout ou rien."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.create(nom="Broyage")
+        cls.equipement = Equipement.objects.create(nom="Broyeur 1", atelier=cls.atelier)
+        cls.roulement = Stock.objects.create(reference="RLT-1", element="Roulement", quantite=4)
+        cls.courroie = Stock.objects.create(reference="CRR-1", element="Courroie", quantite=1)
+
+    def post(self, pieces):
+        return self.client.post('/api/formulaires/', {
+            'atelier': self.atelier.pk, 'equipement': self.equipement.pk, 'date_defaillance': '2024-03-01',
+            'heure_debut': '08:00', 'heure_fin': '09:00', 'methode_entretien': 'Dépannage',
+            'nature_panne': 'Origine Mécanique', 'cause_panne': 'Durée de vie',
+            'indice_gravite': 'Intervention programmable dans le mois',
+            'piece_rechange': '-', 'travaux_effectues': '-', 'etat_action_immediate': 'Fait', 'pilote': 'test',
+            'pieces': pieces,
+        }, content_type='application/json')
+
+    def quantities(self):
+        return dict(Stock.objects.values_list('reference', 'quantite'))
+
+    def test_stock_decremented_once(self):
+        response = self.post([{'stock': self.roulement.pk, 'quantite': 1}, {'stock': self.roulement.pk, 'quantite': 2}])
+        self.assertEqual(response.status_code, 201, response.content)
+        formulaire = Formulaire.objects.get(pk=response.json()['id'])
+        self.assertEqual(self.quantities(), {"RLT-1": 1, "CRR-1": 1})
+        self.assertEqual(list(formulaire.pieces.values_list('stock', 'quantite')), [(self.roulement.pk, 3)])
+        self.assertEqual(
+            list(StockMovement.objects.values_list('formulaire', 'delta', 'quantite_apres')), [(formulaire.pk, -3, 1)],
+        )
+        self.assertEqual(response.json()['pieces'], [
+            {'stock': self.roulement.pk, 'reference': "RLT-1", 'element': "Roulement", 'quantite': 3},
+        ])
+
+    def test_shortage_rolls_back_formulaire(self):
+        response = self.post([{'stock': self.roulement.pk, 'quantite': 2}, {'stock': self.courroie.pk, 'quantite': 2}])
+        self.assertEqual(response.status_code, 400)
+        # ValidationError DRF: valeurs du détail sérialisées en chaînes
+        self.assertEqual(response.json()['pieces'], [{'stock': str(self.courroie.pk), 'disponible': '1', 'demande': '2'}])
+        self.assertFalse(Formulaire.objects.exists())
+        self.assertFalse(FormulairePiece.objects.exists())
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(self.quantities(), {"RLT-1": 4, "CRR-1": 1})
+
+        self.assertEqual(self.post([{'stock': 999, 'quantite': 1}]).status_code, 400)
+        self.assertFalse(Formulaire.objects.exists())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Pragmas SQLite")
+class SqliteProfileTests(TestCase):
+    """Profil SQLite: pragmas appliqués à chaque nouvelle connexion (base.db.configure_sqlite)."""
+
+    def test_pragmas(self):
+        values = sqlite_pragma_values(connection, ['busy_timeout', 'synchronous', 'cache_size', 'temp_store'])
+        # Sans SQLITE_JOURNAL_MODE: synchronous FULL = 2; temp_store MEMORY = 2
+        self.assertEqual(values, {'busy_timeout': 5000, 'synchronous': 2, 'cache_size': -20000, 'temp_store': 2})
+
+    def connect(self, path, **overrides):
+        wrapper = connections['default'].__class__({**connection.settings_dict, 'NAME': path}, alias='profil')
+        wrapper.force_debug_cursor = True  # queries_log garde les pragmas du signal
+        with override_settings(**overrides):
+            wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_journal_mode_untouched_by_default(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = self.connect(os.path.join(tmp, 'profil.sqlite3'), SQLITE_PRAGMAS={'busy_timeout': 1234})
+            self.assertEqual(sqlite_pragma_values(wrapper, ['busy_timeout', 'journal_mode']),
+                             {'busy_timeout': 1234, 'journal_mode': 'delete'})
+            self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            wrapper.close()
+
+    def test_journal_mode_once_per_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'profil.sqlite3')
+            wrapper = self.connect(path, SQLITE_JOURNAL_MODE='WAL')
+            self.assertIn('PRAGMA journal_mode = wal', [q['sql'] for q in wrapper.queries_log])
+            self.assertEqual(sqlite_pragma_values(wrapper, ['journal_mode']), {'journal_mode': 'wal'})
+            wrapper.close()
+            # Le mode persiste dans le fichier: une nouvelle connexion ne le vérifie même plus
+            wrapper = self.connect(path, SQLITE_JOURNAL_MODE='WAL')
+            self.assertFalse([q for q in wrapper.queries_log if 'journal_mode' in q['sql']])
+            wrapper.close()
+
+
+class FormulaireExportTests(TestCase):
+    """/formulaires/export/: CSV et NDJSON en flux, filtres de la liste, cellules neutralisées."""
+
+    @classmethod
+    def setUpTestData(cls):
+        broyage = Atelier.objects.create(nom="Broyage")
+        cuisson = Atelier.objects.create(nom="Cuisson")
+        broyeur = Equipement.objects.create(nom="Broyeur", atelier=broyage)
+        four = Equipement.objects.create(nom="Four", atelier=cuisson)
+        Formulaire.objects.bulk_create([
+            failure(broyage, broyeur, date(2024, 3, 1), time(23, 30), time(0, 15), pilote="=1+1",
+                    travaux_effectues="@SOMME(A1)", nature_panne=NaturePanne.objects.get(label="Origine électrique")),
+            failure(broyage, broyeur, date(2024, 3, 2), time(8, 0), time(10, 30), pilote="Ali"),
+            failure(cuisson, four, date(2024, 3, 3), pilote="Sami"),
+        ])
+
+    def export(self, **params):
+        response = self.client.get('/api/formulaires/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv(self):
+        response, content = self.export(atelier=Atelier.objects.get(nom="Broyage").pk)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.reader(StringIO(content[1:]), delimiter=';'))
+        self.assertEqual(rows[0][:4], ['id', 'date_defaillance', 'atelier', 'equipement'])
+        columns = rows[0]
+        rows = [dict(zip(columns, row)) for row in rows[1:]]
+        self.assertEqual([r['date_defaillance'] for r in rows], ['2024-03-02', '2024-03-01'])
+        self.assertEqual([r['duree_heures'] for r in rows], ['2.5', '0.75'])  # 23:30 -> 00:15
+        self.assertEqual((rows[1]['pilote'], rows[1]['travaux_effectues'], rows[1]['piece_rechange']),
+                         ("'=1+1", "'@SOMME(A1)", "'-"))
+        self.assertEqual((rows[0]['pilote'], rows[1]['nature_panne'], rows[0]['nature_panne']),
+                         ("Ali", "Origine électrique", ""))
+
+    def test_ndjson(self):
+        response, content = self.export(format='ndjson', **{'from': '2024-03-01', 'to': '2024-03-02'})
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(r['equipement'], r['duree_heures']) for r in rows], [("Broyeur", 2.5), ("Broyeur", 0.75)])
+        self.assertEqual(rows[1]['pilote'], "=1+1")  # JSON: valeur brute
+
+    def test_errors_are_json(self):
+        response = self.client.get('/api/formulaires/export/', {'from': 'bad'})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+        self.assertIn('from', json.loads(response.content))
+        response = self.client.get('/api/formulaires/export/', {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+
+
+class PieceBackfillTests(TestCase):
+    """Analyse du texte libre piece_rechange et reprise des pièces des anciens formulaires."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.create(nom="Broyage")
+        cls.equipement = Equipement.objects.create(nom="Broyeur", atelier=cls.atelier)
+        cls.rlt = Stock.objects.create(reference="RLT-001", element="Roulement", quantite=5)
+        cls.rlt12 = Stock.objects.create(reference="RLT-0012", element="Roulement", quantite=5)
+        cls.courroie = Stock.objects.create(reference="CRR-7", element="Courroie trapézoïdale", quantite=1)
+
+    def test_split_quantity(self):
+        for chunk, expected in (
+            ("2 x Roulement", ("Roulement", 2)), ("3 pièces filtre", ("filtre", 3)), ("4 joint", ("joint", 4)),
+            ("roulement x2", ("roulement", 2)), ("filtre (3)", ("filtre", 3)), ("vis : 6", ("vis", 6)),
+            ("  Courroie ", ("Courroie", 1)),
+        ):
+            with self.subTest(chunk=chunk):
+                self.assertEqual(split_quantity(chunk), expected)
+
+    def test_parse_pieces(self):
+        matcher = StockMatcher()
+        # Élément ambigu (deux "Roulement") non reconnu; référence la plus longue d'abord
+        self.assertIsNone(matcher.match("roulement"))
+        self.assertEqual(matcher.match("Réf rlt-0012 neuve"), self.rlt12.pk)
+        self.assertEqual(matcher.match("COURROIE TRAPEZOIDALE"), self.courroie.pk)
+        found, unmatched = parse_pieces("2 x RLT-001, courroie trapézoïdale; rlt-001 (3) et graisse + néant", matcher)
+        self.assertEqual(found, {self.rlt.pk: 5, self.courroie.pk: 1})
+        self.assertEqual(unmatched, ["graisse"])
+        self.assertEqual(parse_pieces("-", matcher), ({}, []))
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command('backfill_formulaire_pieces', *args, stdout=out)
+        return out.getvalue()
+
+    def test_backfill(self):
+        ok, short = Formulaire.objects.bulk_create([
+            failure(self.atelier, self.equipement, date(2024, 3, 1), piece_rechange="2 x RLT-001"),
+            failure(self.atelier, self.equipement, date(2024, 3, 2), piece_rechange="RLT-001, 2 x CRR-7"),
+        ])
+        self.assertIn("3 ligne(s) créée(s)", self.backfill('--dry-run'))
+        self.assertFalse(FormulairePiece.objects.exists())
+
+        out = self.backfill('--decrement-stock')
+        self.assertIn("2 formulaire(s) analysé(s), 2 avec pièce(s) reconnue(s), 1 ligne(s) créée(s), "
+                      "1 formulaire(s) ignoré(s) (stock insuffisant)", out)
+        # Stock insuffisant: ni pièces ni mouvement pour ce formulaire (tout ou rien)
+        self.assertEqual(list(FormulairePiece.objects.values_list('formulaire', 'stock', 'quantite')),
+                         [(ok.pk, self.rlt.pk, 2)])
+        self.assertEqual(list(StockMovement.objects.values_list('formulaire', 'delta')), [(ok.pk, -2)])
+        self.assertEqual(dict(Stock.objects.values_list('reference', 'quantite')),
+                         {"RLT-001": 3, "RLT-0012": 5, "CRR-7": 1})
+
+        # Sans --decrement-stock: historique seul, quantités inchangées; déjà repris => ignoré
+        self.assertIn("1 formulaire(s) analysé(s)", self.backfill())
+        self.assertEqual(sorted(short.pieces.values_list('stock', 'quantite')),
+                         sorted([(self.rlt.pk, 1), (self.courroie.pk, 2)]))
+        self.assertEqual(Stock.objects.get(pk=self.rlt.pk).quantite, 3)
+
+
+class UnreachableEmailBackend(locmem.EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError(111, "Connection refused")
+
+
+class RejectingEmailBackend(locmem.EmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPRecipientsRefused({'x@example.com': (550, b'refused')})
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+    EMAIL_OUTBOX_BACKOFF_SECONDS=60,
+)
+class EmailOutboxTests(TestCase):
+    """send_outbox: envoi par lot, reprise avec backoff, serveur injoignable."""
+
+    def setUp(self):
+        self.row = EmailOutbox.enqueue_credentials("x@example.com", "Nom", "Prénom", "np", "secret", "technicien")
+
+    def test_sent(self):
+        self.assertEqual(process_outbox(), {'sent': 1, 'retry': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.row.refresh_from_db()
+        self.assertEqual((self.row.status, self.row.attempts), (EmailOutbox.STATUS_SENT, 1))
+        self.assertNotIn('password', self.row.context)
+
+    @override_settings(EMAIL_BACKEND='base.tests.RejectingEmailBackend')
+    def test_retry_then_failed(self):
+        with self.assertLogs('base.outbox', 'WARNING'):
+            self.assertEqual(process_outbox(), {'sent': 0, 'retry': 1, 'failed': 0})
+        self.row.refresh_from_db()
+        self.assertEqual((self.row.status, self.row.attempts), (EmailOutbox.STATUS_PENDING, 1))
+        self.assertIn('SMTPRecipientsRefused', self.row.last_error)
+        self.assertGreater(self.row.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(self.row.context['password'], "secret")  # encore nécessaire pour le prochain essai
+        self.assertEqual(process_outbox()['retry'], 0)  # pas encore dû
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('base.outbox', 'WARNING'):
+            self.assertEqual(process_outbox(), {'sent': 0, 'retry': 0, 'failed': 1})
+        self.row.refresh_from_db()
+        self.assertEqual((self.row.status, self.row.attempts), (EmailOutbox.STATUS_FAILED, 2))
+        self.assertNotIn('password', self.row.context)
+
+    @override_settings(EMAIL_BACKEND='base.tests.UnreachableEmailBackend')
+    def test_connection_refused(self):
+        other = EmailOutbox.enqueue(EmailOutbox.KIND_STOCK_ALERT, "y@example.com", reference="R-1", quantite=0)
+        with self.assertLogs('base.outbox', 'WARNING'):
+            self.assertEqual(process_outbox(), {'sent': 0, 'retry': 2, 'failed': 0})
+        for row in (self.row, other):
+            row.refresh_from_db()
+            self.assertEqual((row.status, row.attempts, row.claim_token), (EmailOutbox.STATUS_PENDING, 1, ''))
+            self.assertIn('ConnectionRefusedError', row.last_error)
+            self.assertGreater(row.next_attempt_at, timezone.now())
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        with mock.patch('base.management.commands.send_outbox.process_outbox', side_effect=[OSError("db"), {}]), \
+                mock.patch('base.management.commands.send_outbox.time.sleep', side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt), self.assertLogs('base.management.commands.send_outbox', 'ERROR'):
+                call_command('send_outbox', loop=True, stdout=StringIO())  # le worker survit au lot en erreur
+
+
+@override_settings(CONNEX_TOKEN_MAX_AGE=12 * 3600)
+class TokenTests(TestCase):
+    """Jetons signés de /login/: vérification, expiration, révocation, ancien format refusé."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = ConnexUser.objects.create(username="token.admin", password="x", role='admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_verify_and_tampering(self):
+        token = issue_token(self.admin)
+        self.assertEqual(verify_token(token), (self.admin.id, 'admin'))
+        for bad in (token[:-2] + 'xx', 'abc', ''):
+            with self.assertRaises(InvalidToken):
+                verify_token(bad)
+
+    def test_expired(self):
+        token = issue_token(self.admin)
+        later = timezone.now().timestamp() + 12 * 3600 + 1
+        with mock.patch('django.core.signing.time.time', return_value=later), self.assertRaises(InvalidToken):
+            verify_token(token)
+
+    def test_revoked(self):
+        token = issue_token(self.admin)
+        self.admin.password = "changed"
+        self.admin.save()
+        with self.assertRaises(InvalidToken):
+            verify_token(token)
+
+        # Changement fait par un autre worker (cache local non prévenu): relu en base après la TTL
+        token = issue_token(self.admin)
+        ConnexUser.objects.filter(pk=self.admin.pk).update(role='technicien')
+        self.assertEqual(verify_token(token), (self.admin.id, 'admin'))
+        cache.clear()  # = CONNEX_CREDENTIALS_CHECK_TTL écoulée
+        with self.assertRaises(InvalidToken):
+            verify_token(token)
+
+        token = issue_token(self.admin)
+        self.admin.delete()
+        with self.assertRaises(InvalidToken):
+            verify_token(token)
+
+    def test_legacy_session_id(self):
+        url = '/api/analytics/sessions/active/'
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Session {self.admin.id}").status_code, 403)
+        with override_settings(CONNEX_ALLOW_LEGACY_SESSION_ID=True):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Session {self.admin.id}").status_code, 200)
+        token = issue_token(self.admin)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Session {token}").status_code, 200)
+
+
+@override_settings(EVENTS_ENABLED=False)
+class ReferenceCacheTests(TestCase):
+    """Ateliers / équipements servis depuis le cache versionné, requêtes conditionnelles."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create: pas de rafraîchissement en attente dans la transaction de classe
+        cls.atelier = Atelier.objects.bulk_create([Atelier(nom="Broyage")])[0]
+        Equipement.objects.bulk_create([Equipement(nom="Broyeur 1", atelier=cls.atelier)])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_cached_and_conditional(self):
+        first = self.client.get('/api/ateliers/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/ateliers/')
+        self.assertEqual(second.json(), first.json())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/ateliers/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+            self.assertEqual(
+                self.client.get('/api/ateliers/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304,
+            )
+
+    def test_write_through_on_commit(self):
+        etag = self.client.get('/api/equipements/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            atelier = Atelier.objects.create(nom="Cuisson")
+            Equipement.objects.create(nom="Four", atelier=atelier)
+        self.assertEqual(len(callbacks), 1)  # un seul rafraîchissement par transaction
+        with self.assertNumQueries(0):  # liste déjà réécrite en cache
+            response = self.client.get('/api/equipements/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Four", [e['nom'] for e in response.json()])
+        self.assertIn("Four", [e['nom'] for a in self.client.get('/api/ateliers/').json() for e in a['equipements']])
+
+    def test_version_ttl_bounded_without_shared_cache(self):
+        # LocMem: un autre worker ne voit pas le changement de version, péremption bornée
+        self.assertEqual(version_ttl(), 300)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(version_ttl(), 3600)
+
+
+class BatchTests(TestCase):
+    """POST /<ressource>/batch/: tout ou rien par défaut, champs calculés et journaux tenus à jour."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.bulk_create([Atelier(nom="Broyage")])[0]
+        cls.equipement = Equipement.objects.bulk_create([Equipement(nom="Broyeur 1", atelier=cls.atelier)])[0]
+
+    def formulaire(self, **overrides):
+        return {
+            'atelier': self.atelier.pk, 'equipement': self.equipement.pk, 'date_defaillance': '2024-03-01',
+            'heure_debut': '23:30', 'heure_fin': '00:15', 'methode_entretien': 'Dépannage',
+            'nature_panne': 'Origine électrique', 'cause_panne': 'Surcharges',
+            'indice_gravite': 'Intervention immédiate (Perte de production)', 'piece_rechange': '-',
+            'travaux_effectues': 'Remplacement fusible', 'etat_action_immediate': 'Fait', 'pilote': 'Bench',
+            **overrides,
+        }
+
+    def create_formulaire(self):
+        response = self.client.post('/api/formulaires/', self.formulaire(), content_type='application/json')
+        return Formulaire.objects.get(pk=response.json()['id'])
+
+    def test_formulaires_create_update_delete(self):
+        old = self.create_formulaire()
+        response = self.client.post('/api/formulaires/batch/', {
+            'create': [self.formulaire(), self.formulaire(date_defaillance='2024-03-02')],
+            'update': [{'id': old.pk, 'heure_fin': '01:30'}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual([f['date_defaillance'] for f in body['created']], ['2024-03-01', '2024-03-02'])
+        self.assertFalse(Formulaire.objects.filter(heuregen__isnull=True).exists())
+        old.refresh_from_db()
+        self.assertEqual(old.heuregen, timedelta(hours=2))
+        rollup = EquipementRollup.objects.get(equipement=self.equipement, period='month')
+        self.assertEqual(rollup.failures, 3)
+
+        response = self.client.post('/api/formulaires/batch/', {'delete': [f['id'] for f in body['created']]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(EquipementRollup.objects.get(equipement=self.equipement, period='month').failures, 1)
+
+    def test_atomic_by_default(self):
+        response = self.client.post('/api/formulaires/batch/', {
+            'create': [self.formulaire(), self.formulaire(equipement=999999)],
+            'delete': [123456],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual({(e['op'], e['index']) for e in response.json()['errors']}, {('create', 1), ('delete', 0)})
+        self.assertFalse(Formulaire.objects.exists())
+
+        response = self.client.post('/api/formulaires/batch/', {
+            'create': [self.formulaire(), self.formulaire(equipement=999999)], 'atomic': False,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(Formulaire.objects.count(), 1)
+
+    def test_stocks_ledger_and_protected_delete(self):
+        used = Stock.objects.create(reference="R-1", element="Roulement", quantite=4)
+        FormulairePiece.objects.create(
+            formulaire=self.create_formulaire(), stock=used, quantite=1,
+        )
+        response = self.client.post('/api/stocks/batch/', {
+            'create': [{'reference': 'R-2', 'element': 'Courroie Été', 'quantite': 3}],
+            'update': [{'id': used.pk, 'quantite': 10}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        created = Stock.objects.get(reference='R-2')
+        self.assertEqual(created.element_norm, 'courroie ete')
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list('stock__reference', 'delta', 'motif')),
+            [('R-1', 6, 'Ajustement inventaire'), ('R-2', 3, 'Création')],
+        )
+
+        response = self.client.post('/api/stocks/batch/', {'delete': [created.pk, created.pk, used.pk], 'atomic': False},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['deleted'], [created.pk])
+        self.assertEqual([(e['op'], e['index']) for e in response.json()['errors']], [('delete', 2)])
+        self.assertTrue(Stock.objects.filter(pk=used.pk).exists())
+
+    def test_duplicate_unique_values(self):
+        Stock.objects.create(reference="R-1", element="Roulement", quantite=4)
+        items = [
+            {'reference': 'R-2', 'element': 'Courroie', 'quantite': 1},
+            {'reference': 'R-2', 'element': 'Courroie bis', 'quantite': 2},
+            {'reference': 'R-1', 'element': 'Doublon en base', 'quantite': 1},
+        ]
+        response = self.client.post('/api/stocks/batch/', {'create': items}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(e['index'], list(e['errors'])) for e in response.json()['errors']],
+                         [(2, ['reference']), (1, ['reference'])])
+
+        response = self.client.post('/api/stocks/batch/', {'create': items, 'atomic': False},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual(sorted(Stock.objects.values_list('reference', 'quantite')), [('R-1', 4), ('R-2', 1)])
+
+    def test_too_many_items(self):
+        with self.settings(BATCH_MAX_ITEMS=1):
+            response = self.client.post('/api/ateliers/batch/', {'create': [{'nom': 'A'}, {'nom': 'B'}]},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Atelier.objects.filter(nom__in=['A', 'B']).exists())
+
+
+@override_settings(SYNC_CURSOR_OVERLAP=0)
+class SyncChangesTests(TestCase):
+    """/api/changes/: seules les lignes modifiées ou supprimées depuis le curseur."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.stocks = Stock.objects.bulk_create([
+            Stock(reference=f"S-{i}", element="Filtre", quantite=5) for i in range(20)
+        ])
+
+    def changes(self, cursor=None, **params):
+        if cursor:
+            params['since'] = cursor
+        response = self.client.get('/api/changes/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_changes_and_tombstones(self):
+        first = self.changes()
+        self.assertTrue(first['reset'])
+        # Lignes existantes antérieures au curseur
+        Stock.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+
+        kept, removed = self.stocks[0], self.stocks[1]
+        self.client.patch(f'/api/stocks/{kept.pk}/', {'quantite': 1}, content_type='application/json')
+        self.client.post('/api/stocks/movements/', {'movements': [{'stock': self.stocks[2].pk, 'delta': 3}]},
+                         content_type='application/json')
+        removed_id = removed.pk
+        removed.delete()
+        with self.assertNumQueries(7):  # une requête par modèle + tombstones
+            body = self.changes(first['cursor'])
+        self.assertFalse(body['reset'])
+        self.assertEqual(sorted(s['id'] for s in body['changed']['stock']), [kept.pk, self.stocks[2].pk])
+        self.assertEqual(body['deleted']['stock'], [removed_id])
+        self.assertEqual(body['changed']['formulaire'], [])
+
+        body = self.changes(body['cursor'], models='stock')
+        self.assertEqual((body['changed'], body['deleted']), ({'stock': []}, {'stock': []}))
+
+    def test_reset_and_errors(self):
+        cursor = self.changes()['cursor']
+        Stock.objects.update(updated_at=timezone.now())
+        with self.settings(SYNC_MAX_CHANGES=5):
+            self.assertTrue(self.changes(cursor)['reset'])
+        self.assertEqual(self.client.get('/api/changes/', {'since': 'xyz'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/changes/', {'models': 'connexuser'}).status_code, 400)
+
+        Tombstone.objects.create(model='stock', object_id=1, deleted_at=timezone.now() - timedelta(days=90))
+        self.assertEqual(purge_tombstones(), 1)
+
+
+class EventStreamTests(TestCase):
+    """/api/events/: écritures validées poussées en SSE, messages compacts."""
+
+    def write(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stock = Stock.objects.create(reference="EV-1", element="Joint", quantite=3)
+            Atelier.objects.create(nom="Hors filtre")
+        return stock.pk
+
+    async def test_stream_receives_committed_changes(self):
+        response = await self.async_client.get('/api/events/', {'models': 'stock'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        # Écriture depuis un thread synchrone, comme une vue DRF sous ASGI
+        pk = await sync_to_async(self.write)()
+        message = await asyncio.wait_for(anext(stream), 1)
+        self.assertEqual(message, f'event: change\ndata: [{{"model":"stock","op":"save","ids":[{pk}]}}]\n\n'.encode())
+        await stream.aclose()
+
+    def test_wsgi_unavailable(self):
+        # Sous WSGI le flux ne serait jamais envoyé: réponse immédiate, le tableau de bord garde son polling
+        response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_cascade_delete_is_one_message(self):
+        atelier = Atelier.objects.bulk_create([Atelier(nom="Broyage")])[0]
+        Equipement.objects.bulk_create([Equipement(nom=f"E{i}", atelier=atelier) for i in range(5)])
+        atelier_id = atelier.pk
+        with self.captureOnCommitCallbacks() as callbacks:
+            atelier.delete()
+        pending = [c for c in callbacks if hasattr(c, 'events')]
+        self.assertEqual(len(pending), 1)
+        with self.settings(EVENTS_MAX_IDS=2):
+            self.assertEqual(compact(pending[0].events), [
+                {'model': 'equipement', 'op': 'delete', 'ids': None},
+                {'model': 'atelier', 'op': 'delete', 'ids': [atelier_id]},
+            ])
+
+    async def test_file_backend_shared_between_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'events.jsonl')
+            reader, writer = FileBackend(path=path, poll_interval=0.02), FileBackend(path=path)
+            subscription = reader.subscribe(['stock'])
+            await asyncio.sleep(0.05)  # le thread de lecture part de la fin du journal
+            writer.publish([{'model': 'atelier', 'op': 'save', 'ids': [1]}, {'model': 'stock', 'op': 'save', 'ids': [2]}])
+            self.assertEqual(await subscription.get(2), [{'model': 'stock', 'op': 'save', 'ids': [2]}])
+            reader.unsubscribe(subscription)
+
+
+@override_settings(CONNEXION_LOG_BATCH_SIZE=100, CONNEXION_LOG_FLUSH_INTERVAL=3600)
+class ConnexionLogTests(TestCase):
+    """Logs de connexion écrits en lot, durée calculée par la base, compactage."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = ConnexUser.objects.create(username="log.test", password=make_password("pw"), role='technicien')
+
+    def setUp(self):
+        connexion_log_buffer.flush()
+
+    def test_login_logout_buffered(self):
+        token = self.client.post('/api/login/', {'username': 'log.test', 'password': 'pw'},
+                                 content_type='application/json').json()['token']
+        self.assertEqual(self.client.post('/api/logout/', HTTP_AUTHORIZATION=f"Session {token}").status_code, 204)
+        # Jeton révoqué jusqu'à son expiration: une seconde déconnexion est refusée
+        self.assertEqual(self.client.post('/api/logout/', HTTP_AUTHORIZATION=f"Session {token}").status_code, 401)
+        with self.assertRaises(InvalidToken):
+            verify_token(token)
+        self.assertFalse(ConnexionLog.objects.exists())  # encore en mémoire
+        self.assertEqual(len(connexion_log_buffer), 2)
+
+        self.assertEqual(connexion_log_buffer.flush(), (1, 1))
+        log = ConnexionLog.objects.get()
+        self.assertEqual(log.user, self.user)
+        self.assertIsNotNone(log.heure_deconnexion)
+        self.assertEqual(log.duree_connexion, log.date_deconnexion - log.date_connexion)
+
+    def test_logout_before_login_written(self):
+        # Connexion encore dans le tampon d'un autre worker: la déconnexion attend son log
+        connexion_log_buffer.record_logout("jeton-autre-worker")
+        self.assertEqual(connexion_log_buffer.flush(), (0, 0))
+        ConnexionLog.objects.create(user=self.user, session_key=session_key("jeton-autre-worker"))
+        self.assertEqual(connexion_log_buffer.flush(), (0, 1))
+        self.assertIsNotNone(ConnexionLog.objects.get().duree_connexion)
+
+        with self.settings(CONNEXION_LOG_LOGOUT_RETENTION=0):
+            connexion_log_buffer.record_logout("jeton-jamais-vu")
+            connexion_log_buffer.flush()
+        ConnexionLog.objects.create(user=self.user, session_key=session_key("jeton-jamais-vu"))
+        self.assertEqual(connexion_log_buffer.flush(), (0, 0))  # abandonnée après la rétention
+
+    def test_failed_write_kept(self):
+        with mock.patch.object(ConnexionLog.objects, 'bulk_create', side_effect=DatabaseError("verrou")), \
+                self.assertLogs('base.connexions', 'ERROR'), self.settings(CONNEXION_LOG_BATCH_SIZE=1):
+            response = self.client.post('/api/login/', {'username': 'log.test', 'password': 'pw'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(connexion_log_buffer), 1)
+        self.assertEqual(connexion_log_buffer.flush(), (1, 0))
+        self.assertEqual(ConnexionLog.objects.get().user, self.user)
+
+    def test_compact_old_logs(self):
+        old = timezone.make_aware(datetime.combine(date.today() - timedelta(days=120), time(12)))
+        ConnexionLog.objects.bulk_create([
+            ConnexionLog(user=self.user, date_connexion=old, date_deconnexion=old + timedelta(hours=1),
+                         duree_connexion=timedelta(hours=1)),
+            ConnexionLog(user=self.user, date_connexion=old + timedelta(minutes=5)),
+            ConnexionLog(user=self.user),
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command('compact_connexion_logs', days=90, archive_dir=tmp, stdout=StringIO())
+            archives = os.listdir(tmp)
+            self.assertEqual(len(archives), 1)
+            with gzip.open(os.path.join(tmp, archives[0]), 'rt') as f:
+                self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(ConnexionLog.objects.count(), 1)
+        daily = ConnexionLogDaily.objects.get()
+        self.assertEqual((daily.sessions, daily.closed_sessions, daily.total_duration), (2, 1, timedelta(hours=1)))
+
+
+class SessionAnalyticsTests(TestCase):
+    """/api/analytics/sessions/...: agrégats admin sans charger la liste des logs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = ConnexUser.objects.create(username="stats.admin", password="x", role='admin')
+        cls.tech = ConnexUser.objects.create(username="stats.tech", password="x", role='technicien')
+        cls.day = timezone.localdate() - timedelta(days=2)
+        noon = timezone.make_aware(datetime.combine(cls.day, time(12)))
+        ConnexionLog.objects.bulk_create([
+            ConnexionLog(user=cls.admin, date_connexion=noon, date_deconnexion=noon + timedelta(minutes=60),
+                         duree_connexion=timedelta(minutes=60)),
+            ConnexionLog(user=cls.tech, date_connexion=noon + timedelta(minutes=30),
+                         date_deconnexion=noon + timedelta(minutes=40), duree_connexion=timedelta(minutes=10)),
+            ConnexionLog(user=cls.tech, date_connexion=noon + timedelta(minutes=50),
+                         date_deconnexion=noon + timedelta(minutes=70), duree_connexion=timedelta(minutes=20)),
+            ConnexionLog(user=cls.tech, date_connexion=timezone.now() - timedelta(minutes=5)),  # active
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f"Session {issue_token(self.admin)}"}
+
+    def test_admin_only(self):
+        tech = {'HTTP_AUTHORIZATION': f"Session {issue_token(self.tech)}"}
+        self.assertEqual(self.client.get('/api/analytics/sessions/active/', **tech).status_code, 403)
+
+    def test_active_and_daily(self):
+        active = self.client.get('/api/analytics/sessions/active/', **self.auth).json()
+        self.assertEqual((active['active_users'], active['users'][0]['username']), (1, 'stats.tech'))
+
+        day = self.day.isoformat()
+        daily = self.client.get(f'/api/analytics/sessions/daily/?from={day}&to={day}', **self.auth).json()
+        self.assertEqual(daily['results'], [
+            {'day': day, 'sessions': 3, 'users': 2, 'closed_sessions': 3, 'avg_seconds': 1800.0},
+        ])
+
+    def test_duration_percentiles(self):
+        day = self.day.isoformat()
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(
+                f'/api/analytics/sessions/durations/?from={day}&to={day}&percentiles=50,90', **self.auth,
+            ).json()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual((data['count'], data['avg_seconds'], data['max_seconds']), (3, 1800.0, 3600.0))
+        self.assertEqual(data['percentiles'], {'p50': 1200.0, 'p90': 3600.0})
+        bad = self.client.get('/api/analytics/sessions/durations/?percentiles=0', **self.auth)
+        self.assertEqual(bad.status_code, 400)
+
+    def test_concurrency_peak_per_hour(self):
+        day = self.day.isoformat()
+        data = self.client.get(f'/api/analytics/sessions/concurrency/?from={day}&to={day}', **self.auth).json()
+        peaks = {h['hour'][11:13]: h['peak'] for h in data['hours'] if h['peak']}
+        self.assertEqual(data['peak'], 2)
+        self.assertEqual(peaks, {'12': 2, '13': 1})
+
+    def test_sweep_counts_sessions_open_at_bucket_start(self):
+        start = timezone.make_aware(datetime(2026, 1, 1))
+        hour = timedelta(hours=1)
+        # A: [start - 1h, start + 2h[, B: [start + 1h30, start + 1h45[; A est terminée à start + 2h
+        events = [(start - hour, 1), (start + hour * 1.5, 1), (start + hour * 1.75, -1), (start + 2 * hour, -1)]
+        self.assertEqual(sweep_peaks(events, start, start + 3 * hour), [1, 2, 0])
+
+    def test_results_cached_per_bucket(self):
+        self.client.get('/api/analytics/sessions/active/', **self.auth)
+        ConnexionLog.objects.create(user=self.admin)
+        with self.assertNumQueries(0):
+            active = self.client.get('/api/analytics/sessions/active/', **self.auth).json()
+        self.assertEqual(active['active_users'], 1)
+
+
+class FormulaireChoiceTests(TestCase):
+    """Listes de choix des formulaires: entier en base, libellé dans l'API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.bulk_create([Atelier(nom="Broyage")])[0]
+        cls.equipement = Equipement.objects.bulk_create([Equipement(nom="Broyeur 1", atelier=cls.atelier)])[0]
+
+    formulaire = BatchTests.formulaire
+
+    def test_labels_round_trip(self):
+        response = self.client.post('/api/formulaires/', self.formulaire(), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['nature_panne'], 'Origine électrique')
+        formulaire = Formulaire.objects.get()
+        self.assertEqual(formulaire.nature_panne_id, NaturePanne.objects.get(label='Origine électrique').pk)
+
+        with self.assertNumQueries(2):  # formulaires + pièces: libellés lus dans le cache, sans jointure
+            self.client.get('/api/formulaires/?atelier_details=lite&etat_action_immediate=fait')
+        listed = self.client.get('/api/formulaires/?etat_action_immediate=FAIT').json()
+        self.assertEqual([f['etat_action_immediate'] for f in listed], ['Fait'])
+        self.assertEqual(self.client.get('/api/formulaires/?indice_gravite=inconnue').json(), [])
+
+        series = self.client.get('/api/api/anomalies/?from=2024-03-01&to=2024-03-01&group_by=nature_panne').json()
+        self.assertEqual(series['series'][0]['label'], 'Origine électrique')
+
+    def test_unknown_label(self):
+        # Par défaut refusé, sans rien ajouter à la liste
+        response = self.client.post('/api/formulaires/', self.formulaire(cause_panne='Grêle'), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cause_panne', response.json())
+        self.assertFalse(CausePanne.objects.filter(label='Grêle').exists())
+
+        # Casse différente: valeur existante, libellé de la liste
+        response = self.client.post('/api/formulaires/', self.formulaire(nature_panne='ORIGINE ÉLECTRIQUE'),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['nature_panne'], 'Origine électrique')
+        self.assertEqual(NaturePanne.objects.filter(label__iexact='origine électrique').count(), 1)
+
+    @override_settings(FORMULAIRE_CHOICES_AUTO_CREATE=True)
+    def test_auto_create_with_formulaire(self):
+        # Formulaire refusé (équipement manquant): le libellé nouveau n'est pas enregistré
+        response = self.client.post('/api/formulaires/', self.formulaire(cause_panne='Foudre', equipement=None),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CausePanne.objects.filter(label='Foudre').exists())
+
+        response = self.client.post('/api/formulaires/', self.formulaire(cause_panne='Foudre'), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Formulaire.objects.get().cause_panne.label, 'Foudre')
+
+        response = self.client.post('/api/formulaires/batch/', {'create': [
+            self.formulaire(cause_panne='Inondation'), self.formulaire(cause_panne='inondation'),
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(list(CausePanne.objects.filter(label__iexact='inondation').values_list('label', flat=True)),
+                         ['Inondation'])
+        self.assertEqual([f['cause_panne'] for f in response.json()['created']], ['Inondation', 'Inondation'])
+
+
+class ParetoTests(TestCase):
+    """heuregen calculée par la base (passage de minuit compris) et Pareto des arrêts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.atelier = Atelier.objects.bulk_create([Atelier(nom="Broyage")])[0]
+        cls.equipement = Equipement.objects.bulk_create([Equipement(nom="Broyeur 1", atelier=cls.atelier)])[0]
+        electrique = NaturePanne.objects.get(label="Origine électrique")
+        mecanique = NaturePanne.objects.get(label="Origine Mécanique")
+        spans = [(electrique, time(23, 30), time(0, 30)), (electrique, time(8, 0), time(11, 0)),
+                 (mecanique, time(10, 0), time(10, 0)), (mecanique, time(14, 0), time(14, 30)),
+                 (mecanique, time(9, 0), time(9, 30))]
+        cls.formulaires = Formulaire.objects.bulk_create([
+            Formulaire(
+                atelier=cls.atelier, equipement=cls.equipement, date_defaillance=date(2024, 3, 1),
+                heure_debut=start, heure_fin=end, nature_panne=nature, piece_rechange="-",
+                travaux_effectues="-", pilote="test",
+            )
+            for nature, start, end in spans
+        ])
+
+    def test_generated_downtime(self):
+        self.assertEqual(self.formulaires[0].heuregen, timedelta(hours=1))  # renvoyée par l'INSERT
+        Formulaire.objects.filter(pk=self.formulaires[2].pk).update(heure_fin=time(9, 45))
+        self.assertEqual(
+            list(Formulaire.objects.order_by('id').values_list('heuregen', flat=True)),
+            [timedelta(hours=1), timedelta(hours=3), timedelta(hours=23, minutes=45),
+             timedelta(minutes=30), timedelta(minutes=30)],
+        )
+        formulaire = Formulaire.objects.get(pk=self.formulaires[3].pk)
+        formulaire.heure_fin = time(13, 0)
+        formulaire.save()
+        self.assertEqual(formulaire.heuregen, timedelta(hours=23))
+
+    def test_pareto(self):
+        body = self.client.get('/api/reports/pareto/nature_panne/?metric=failures').json()
+        self.assertEqual([r['nom'] for r in body['results']], ["Origine Mécanique", "Origine électrique"])
+        self.assertEqual([r['cumulative'] for r in body['results']], [60.0, 100.0])
+        self.assertEqual(body['total'], {'failures': 5, 'downtime_hours': 5.0})
+        self.assertEqual(body['vital_few'], 2)
+
+        body = self.client.get('/api/reports/pareto/nature_panne/?limit=1').json()
+        self.assertEqual(body['results'][0]['nom'], "Origine électrique")
+        self.assertEqual(body['results'][0]['share'], 80.0)
+        self.assertEqual(body['vital_few'], 1)
+        self.assertEqual(body['others'], {'count': 1, 'failures': 3, 'downtime_hours': 1.0, 'share': 20.0})
+
+        self.assertEqual(self.client.get('/api/reports/pareto/pilote/').status_code, 400)
+        self.assertEqual(self.client.get('/api/reports/pareto/atelier/?metric=cout').status_code, 400)
@@ -0,0 +1,23 @@
+import re
+import unicodedata
+
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Minuscules sans accents (aligné sur le tokenizer FTS5 unicode61 remove_diacritics 2)."""
+    decomposed = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text, max_length=64):
+    return [t[:max_length] for t in _TOKEN_RE.findall(normalize(text))]
+
+
+def prefix_range(field, prefix):
+    """
+    Lookup "commence par" exprimé en intervalle (field >= p AND field < p + U+FFFF):
+    contrairement à LIKE 'p%' sous SQLite, il reste un range scan sur l'index.
+    """
+    return {f"{field}__gte": prefix, f"{field}__lt": prefix + '\uffff'}
@@ -0,0 +1,151 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from .connexions import session_key
+from .models import ConnexUser
+
+
+TOKEN_SALT = "base.connex-token"
+CREDENTIALS_KEY = "base:connex:credentials:{}"
+REVOKED_KEY = "base:connex:revoked:{}"
+DELETED = "deleted"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+# ---------- JETONS SIGNÉS ----------
+def token_max_age():
+    return getattr(settings, 'CONNEX_TOKEN_MAX_AGE', 12 * 3600)
+
+
+def credentials_check_ttl():
+    return getattr(settings, 'CONNEX_CREDENTIALS_CHECK_TTL', 60)
+
+
+def _fingerprint(password, role):
+    return hashlib.sha256(f"{password}:{role}".encode()).hexdigest()[:12]
+
+
+def credentials_fingerprint(user):
+    """Empreinte courte du hash de mot de passe + rôle: change dès que l'un change."""
+    return _fingerprint(user.password, user.role)
+
+
+def current_fingerprint(user_id):
+    """
+    Empreinte du compte en cache, relue en base (une requête) après
+    CONNEX_CREDENTIALS_CHECK_TTL. Avec un cache par process (LocMem), un
+    changement fait sur un autre worker n'y est visible qu'après ce délai:
+    c'est la durée max pendant laquelle un jeton révoqué reste accepté
+    (immédiat avec un cache partagé, ex. Redis).
+    """
+    key = CREDENTIALS_KEY.format(user_id)
+    current = cache.get(key)
+    if current is None:
+        row = ConnexUser.objects.filter(id=user_id).values_list('password', 'role').first()
+        current = _fingerprint(*row) if row else DELETED
+        cache.set(key, current, credentials_check_ttl())
+    return current
+
+
+def issue_token(user):
+    """Jeton signé (HMAC SECRET_KEY) et horodaté portant l'id, le rôle et l'empreinte."""
+    payload = {"id": user.id, "role": user.role, "fp": credentials_fingerprint(user)}
+    remember_credentials(user)  # premières requêtes du jeton vérifiées sans accès base
+    return signing.dumps(payload, salt=TOKEN_SALT, compress=True)
+
+
+def verify_token(token):
+    """
+    Vérifie signature + expiration, puis l'empreinte courante du compte
+    (current_fingerprint: cache, base au plus une fois par TTL): mot de
+    passe/rôle changé ou compte supprimé => jeton refusé. Un jeton fermé par
+    /logout/ (revoke_token) est refusé aussi.
+    Retourne (id, role).
+    """
+    try:
+        value = signing.loads(token, salt=TOKEN_SALT, max_age=token_max_age())
+        uid, role, fp = int(value["id"]), value["role"], value["fp"]
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise InvalidToken
+    if current_fingerprint(uid) != fp or cache.get(REVOKED_KEY.format(session_key(token))):
+        raise InvalidToken
+    return uid, role
+
+
+def revoke_token(token):
+    """
+    Déconnexion: le jeton est refusé jusqu'à son expiration (au plus
+    CONNEX_TOKEN_MAX_AGE). Conservé dans le cache: avec LocMem (par process),
+    seul le worker qui a traité /logout/ le refuse; cache partagé requis en
+    multi-workers.
+    """
+    cache.set(REVOKED_KEY.format(session_key(token)), True, token_max_age())
+
+
+def remember_credentials(user):
+    """Publie l'empreinte courante: les jetons portant une autre empreinte sont révoqués."""
+    cache.set(CREDENTIALS_KEY.format(user.id), credentials_fingerprint(user), credentials_check_ttl())
+
+
+def revoke_user_tokens(user_id):
+    """Révoque tous les jetons d'un compte (suppression)."""
+    cache.set(CREDENTIALS_KEY.format(user_id), DELETED, credentials_check_ttl())
+
+
+# ---------- CACHE TTL/LRU DES COMPTES ----------
+class ConnexUserCache:
+    """
+    Cache en mémoire (par process) des ConnexUser avec leur profil admin /
+    technicien déjà joint. Invalidé par les signaux de base.signals; la TTL
+    borne la péremption entre workers.
+    """
+
+    def __init__(self, maxsize=512, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(user_id)
+            if entry and entry[0] > now:
+                self._items.move_to_end(user_id)
+                return copy.copy(entry[1])
+            self._items.pop(user_id, None)
+        user = (
+            ConnexUser.objects.select_related("admin", "technicien")
+            .filter(id=user_id).first()
+        )
+        if user is not None:
+            with self._lock:
+                self._items[user_id] = (now + self.ttl, user)
+                self._items.move_to_end(user_id)
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+            user = copy.copy(user)
+        return user
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._items.clear()
+            else:
+                self._items.pop(user_id, None)
+
+
+user_cache = ConnexUserCache(
+    maxsize=getattr(settings, 'CONNEX_USER_CACHE_SIZE', 512),
+    ttl=getattr(settings, 'CONNEX_USER_CACHE_TTL', 60),
+)
@@ -1,23 +1,39 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TechnicienViewSet, AdminViewSet,ConnexUserViewSet,FormulaireViewSet, StockViewSet, AtelierViewSet, EquipementViewSet, LoginView, get_user_stats, anomalies_timeseries, ChangeMyPasswordView, MeView
+from .views import TechnicienViewSet, AdminViewSet,ConnexUserViewSet,ConnexionLogViewSet,FormulaireViewSet, StockViewSet, AtelierViewSet, EquipementViewSet, LoginView, LogoutView, PersonnelBulkView, EquipementRollupViewSet, AtelierRollupViewSet, reliability_kpis, parts_consumption, pareto_report, get_user_stats, dashboard_summary, anomalies_timeseries, sync_changes, event_stream, sessions_active, sessions_daily, sessions_durations, sessions_concurrency, MetricsView, ChangeMyPasswordView, MeView
 
 router = DefaultRouter()
 router.register('techniciens', TechnicienViewSet,basename='technicien')
 router.register('admins', AdminViewSet,basename='admin')
 router.register('connexusers', ConnexUserViewSet, basename='connexuser')
+router.register('connexionlogs', ConnexionLogViewSet, basename='connexionlog')
 router.register('formulaires', FormulaireViewSet, basename='formulaire')
 router.register('stocks', StockViewSet, basename='stock')
 router.register('ateliers', AtelierViewSet, basename='atelier')
 router.register('equipements', EquipementViewSet, basename='equipement')
+router.register('rollups/equipements', EquipementRollupViewSet, basename='equipement-rollup')
+router.register('rollups/ateliers', AtelierRollupViewSet, basename='atelier-rollup')
 
 
 urlpatterns = router.urls
 
 urlpatterns += [
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('personnel/bulk/', PersonnelBulkView.as_view(), name='personnel-bulk'),
     path('stats/', get_user_stats, name='user-stats'),
+    path('dashboard/summary/', dashboard_summary, name='dashboard-summary'),
+    path('reliability/', reliability_kpis, name='reliability-kpis'),
+    path('reports/parts-consumption/', parts_consumption, name='parts-consumption'),
+    path('reports/pareto/<str:dimension>/', pareto_report, name='pareto-report'),
     path('api/anomalies/', anomalies_timeseries, name='anomalies-timeseries'),
+    path('analytics/sessions/active/', sessions_active, name='sessions-active'),
+    path('analytics/sessions/daily/', sessions_daily, name='sessions-daily'),
+    path('analytics/sessions/durations/', sessions_durations, name='sessions-durations'),
+    path('analytics/sessions/concurrency/', sessions_concurrency, name='sessions-concurrency'),
+    path('changes/', sync_changes, name='sync-changes'),
+    path('events/', event_stream, name='event-stream'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('me/change-password/', ChangeMyPasswordView.as_view(), name='me-change-password'),
     path('me/', MeView.as_view(), name='me'),
 ]
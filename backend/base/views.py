@@ -1,28 +1,71 @@
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, serializers
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from rest_framework.decorators import api_view, action
+from rest_framework.decorators import api_view, action, authentication_classes, permission_classes
 from rest_framework.authentication import BaseAuthentication
+from rest_framework.parsers import JSONParser, MultiPartParser
 from django.contrib.auth.hashers import check_password, make_password
 from django.utils import timezone
 from django.db import transaction
-from datetime import date, timedelta
+from django.db.models import Prefetch
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import require_GET
+from datetime import timedelta
+import json
 import secrets
 import string
 
-from .models import Technicien, Admin, ConnexUser, ConnexionLog, Formulaire, Equipement, Atelier, Stock
-from .email_utils import send_credentials_email
+from .models import Technicien, Admin, ConnexUser, ConnexionLog, Formulaire, FormulairePiece, Equipement, Atelier, Stock, StockMovement, EquipementRollup, AtelierRollup, EmailOutbox
+from .aggregations import AggregationError, resolve_range, timeseries
+from .filters import (
+    FormulaireFilterBackend, ConnexionLogFilterBackend, RollupFilterBackend, StockFilterBackend,
+    filter_formulaires, filter_stock_movements, stock_ordering, parse_date_param, parse_id_list,
+)
+from .pagination import KeysetPagination
+from .cache_utils import get_version, make_etag, etag_matches
+from .dashboard import build_summary
+from .lookups import LOOKUP_FIELDS, save_missing
+from .rollups import affected_keys, refresh_buckets, reliability
+from .search import index_formulaires, search as search_formulaires
+from .stock import InsufficientStock, apply_movements, notify_low_stock, record_adjustment, record_adjustments
+from .parts import REPORT_GROUPS, consumption_report
+from .pareto import PARETO_DIMENSIONS, PARETO_METRICS, pareto
+from .profiling import registry as metrics_registry
+from .onboarding import PROFILE_MODELS, onboard_personnel, parse_rows
+from .parsers import CSVTextParser
+from .renderers import CSVStreamRenderer, NDJSONStreamRenderer
+from .exports import export_rows, stream_csv, stream_ndjson
+from .reference_cache import VersionedCacheMixin, refresh_on_commit as refresh_reference_cache
+from .tokens import InvalidToken, issue_token, revoke_token, verify_token, token_max_age, user_cache
+from .signals import DASHBOARD_CACHE_NAMESPACE, enqueue_failure_report
+from .batch import BatchMixin
+from .connexions import buffer as connexion_log_buffer, client_ip
+from .events import get_backend
+from .sync import InvalidCursor, changes_since, decode_cursor, encode_cursor, sync_name
+from .session_stats import DEFAULT_PERCENTILES, active_now, cached, day_bounds, duration_stats, peak_concurrency, sessions_per_day
 from .serializers import (
     TechnicienSerializer, AdminSerializer, ConnexUserSerializer, ConnexionLogSerializer,
-    FormulaireSerializer, StockSerializer, AtelierSerializer, EquipementSerializer
+    FormulaireSerializer, StockSerializer, AtelierSerializer, EquipementSerializer,
+    EquipementRollupSerializer, AtelierRollupSerializer,
+    StockMovementSerializer, StockMovementBatchSerializer,
 )
 
 # ---------- AUTH LÉGÈRE ----------
 class SessionIdAuthentication(BaseAuthentication):
     """
-    Attend un header: Authorization: Session <connex_user_id>
+    Attend un header: Authorization: Session <jeton signé émis par /login/>
+    Le jeton porte id + rôle; l'empreinte du compte est relue en base au plus
+    une fois par CONNEX_CREDENTIALS_CHECK_TTL et un jeton fermé par /logout/
+    est refusé. Le ConnexUser n'est chargé (via le cache user_cache) que si
+    la vue y accède.
+    L'ancien format Session <connex_user_id> (sans secret) n'est accepté que si
+    CONNEX_ALLOW_LEGACY_SESSION_ID est activé.
     """
     keyword = "session"
 
@@ -33,22 +76,37 @@ class SessionIdAuthentication(BaseAuthentication):
         parts = auth.split()
         if len(parts) != 2 or parts[0].lower() != "session":
             return None
-        try:
-            uid = int(parts[1])
-            user = ConnexUser.objects.get(id=uid)
-            # Accroche l'objet ConnexUser sur la requête pour les permissions
-            request.connex_user = user
-            return (user, None)
-        except (ValueError, ConnexUser.DoesNotExist):
-            return None
+        credential = parts[1]
+        legacy_id = credential.removeprefix("session-")
+        if legacy_id.isdigit():
+            if not getattr(settings, 'CONNEX_ALLOW_LEGACY_SESSION_ID', False):
+                return None
+            user = user_cache.get(int(legacy_id))
+            if user is None:
+                return None
+            role = user.role
+        else:
+            try:
+                uid, role = verify_token(credential)
+            except InvalidToken:
+                return None
+            user = SimpleLazyObject(lambda: user_cache.get(uid))
+        # Accroche l'objet ConnexUser (et le rôle du jeton) sur la requête pour les permissions
+        request.connex_user = user
+        request.connex_role = role
+        return (user, credential)
 
 class IsAdminConnex(permissions.BasePermission):
     """
-    Autorise uniquement si request.connex_user.role == 'admin'
+    Autorise uniquement si le rôle du compte connecté est 'admin'
+    (lu dans le jeton, sans requête).
     """
     def has_permission(self, request, view):
-        user = getattr(request, "connex_user", None)
-        return bool(user and getattr(user, "role", None) == "admin")
+        role = getattr(request, "connex_role", None)
+        if role is None:
+            user = getattr(request, "connex_user", None)
+            role = getattr(user, "role", None) if user else None
+        return role == "admin"
 
 
 # ---------- TECHNICIENS ----------
@@ -56,12 +114,10 @@ class TechnicienViewSet(viewsets.ModelViewSet):
     queryset = Technicien.objects.all()
     serializer_class = TechnicienSerializer
     authentication_classes = [SessionIdAuthentication]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
     permission_classes = [permissions.AllowAny]  # libre, si tu veux ensuite restreindre, remplace par IsAuthenticated
 
-    def list(self, request):
-        serializer = self.get_serializer(self.get_queryset(), many=True)
-        return Response(serializer.data)
-
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
@@ -92,12 +148,10 @@ class AdminViewSet(viewsets.ModelViewSet):
     queryset = Admin.objects.all()
     serializer_class = AdminSerializer
     authentication_classes = [SessionIdAuthentication]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
     permission_classes = [permissions.AllowAny]
 
-    def list(self, request):
-        serializer = self.get_serializer(self.get_queryset(), many=True)
-        return Response(serializer.data)
-
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
@@ -123,17 +177,52 @@ class AdminViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+# ---------- ONBOARDING EN LOT ----------
+class PersonnelBulkView(APIView):
+    """
+    Création en lot de techniciens/admins (admin uniquement).
+    Body JSON: liste de personnes ou {"rows": [...]}; ou CSV (text/csv ou fichier 'file').
+    Query params: role=technicien|admin (défaut par ligne), strict=1, dry_run=1
+    Réponse: {"created": [...], "rejected": [...]}
+    """
+    authentication_classes = [SessionIdAuthentication]
+    permission_classes = [IsAdminConnex]
+    parser_classes = [JSONParser, MultiPartParser, CSVTextParser]
+
+    def post(self, request):
+        params = request.query_params
+        role = params.get('role', 'technicien')
+        if role not in PROFILE_MODELS:
+            return Response({"error": "Rôle invalide."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = request.FILES.get('file') if hasattr(request, 'FILES') else None
+            if upload is not None:
+                rows = parse_rows(upload.read().decode('utf-8-sig'), 'csv')
+            elif isinstance(request.data, str):
+                rows = parse_rows(request.data, 'csv')
+            else:
+                rows = parse_rows(request.data, 'json')
+            report = onboard_personnel(
+                rows,
+                default_role=role,
+                strict=params.get('strict') in ('1', 'true'),
+                dry_run=params.get('dry_run') in ('1', 'true'),
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        code = status.HTTP_201_CREATED if report["created"] and not report.get("dry_run") else status.HTTP_200_OK
+        return Response(report, status=code)
+
+
 # ---------- UTILISATEURS DE CONNEXION (PAGE USERS) ----------
 class ConnexUserViewSet(viewsets.ModelViewSet):
-    queryset = ConnexUser.objects.all()
+    queryset = ConnexUser.objects.select_related("admin", "technicien")
     serializer_class = ConnexUserSerializer
     authentication_classes = [SessionIdAuthentication]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
     permission_classes = [IsAdminConnex]  #  Admin uniquement (liste, création, suppression, change-password)
 
-    def list(self, request):
-        serializer = self.get_serializer(self.get_queryset(), many=True)
-        return Response(serializer.data)
-
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
@@ -206,33 +295,33 @@ class ConnexUserViewSet(viewsets.ModelViewSet):
         if not email:
             return Response({"error": "Adresse email indisponible pour cet utilisateur."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Envoyer l'email avec les nouvelles informations
-        try:
-            send_credentials_email(
-                email,
-                nom or user.username,
-                prenom or '',
-                user.username,
-                new_pwd,
-                user.role,
-            )
-        except Exception:
-            # Même si l'email échoue, le mot de passe est modifié
-            return Response({"message": "Mot de passe réinitialisé, mais l'envoi d'email a échoué."}, status=status.HTTP_200_OK)
+        # Mettre l'email en file: l'envoi SMTP se fait hors requête (commande send_outbox)
+        EmailOutbox.enqueue_password_reset(
+            email,
+            nom or user.username,
+            prenom or '',
+            user.username,
+            new_pwd,
+            user.role,
+        )
 
-        return Response({"message": "Mot de passe réinitialisé et envoyé par email."}, status=status.HTTP_200_OK)
+        return Response({"message": "Mot de passe réinitialisé, l'email est en cours d'envoi."}, status=status.HTTP_200_OK)
 
 
 # ---------- LOGS CONNEXION ----------
 class ConnexionLogViewSet(viewsets.ModelViewSet):
-    queryset = ConnexionLog.objects.all()
+    queryset = ConnexionLog.objects.select_related("user__admin", "user__technicien")
     serializer_class = ConnexionLogSerializer
     authentication_classes = [SessionIdAuthentication]
-    permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date_connexion', '-id')
+    filter_backends = [ConnexionLogFilterBackend]
+    permission_classes = [IsAdminConnex]
 
-    def list(self, request):
-        serializer = self.get_serializer(self.get_queryset(), many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        # Connexions / déconnexions encore en mémoire (base.connexions) visibles à la lecture
+        connexion_log_buffer.flush()
+        return super().get_queryset()
 
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -243,43 +332,324 @@ class ConnexionLogViewSet(viewsets.ModelViewSet):
 
 
 # ---------- FORMULAIRE / STOCK / ATELIER / EQUIPEMENT ----------
-class FormulaireViewSet(viewsets.ModelViewSet):
+def equipements_prefetch(lookup="equipements"):
+    """Prefetch ordonné lu par AtelierSerializer.get_equipements (pas de N+1)."""
+    return Prefetch(lookup, queryset=Equipement.objects.order_by("id"))
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+class FormulaireViewSet(BatchMixin, viewsets.ModelViewSet):
     queryset = Formulaire.objects.select_related("atelier", "equipement").order_by("-date_defaillance", "-id")
     serializer_class = FormulaireSerializer
     authentication_classes = [SessionIdAuthentication]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date_defaillance', '-id')
+    filter_backends = [FormulaireFilterBackend]
     permission_classes = [permissions.AllowAny]
 
-    def list(self, request):
-        serializer = self.get_serializer(self.get_queryset(), many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        qs = super().get_queryset().prefetch_related(
+            Prefetch("pieces", queryset=FormulairePiece.objects.select_related("stock").order_by("id"))
+        )
+        if FormulaireSerializer.details_mode(self.request) == 'full':
+            qs = qs.prefetch_related(equipements_prefetch("atelier__equipements"))
+        return qs
 
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(consumed_by=connex_user_or_none(request))
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
-
-class StockViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Recherche plein texte classée: ?q=...&page=1&page_size=20 combinable avec
+        les filtres de la liste (etat_action_immediate, atelier, from/to...).
+        """
+        q = (request.query_params.get('q') or '').strip()
+        if not q:
+            return Response({"error": "Paramètre q requis."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+            page_size = min(SEARCH_MAX_PAGE_SIZE, max(1, int(request.query_params.get('page_size', SEARCH_PAGE_SIZE))))
+        except ValueError:
+            return Response({"error": "page et page_size doivent être des entiers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        filtered = self.filter_queryset(Formulaire.objects.all())
+        total, hits = search_formulaires(q, filtered, offset=(page - 1) * page_size, limit=page_size)
+        objects = self.get_queryset().filter(id__in=[i for i, _score in hits]).in_bulk()
+        results = []
+        for pk, score in hits:
+            if pk in objects:
+                item = self.get_serializer(objects[pk]).data
+                item['score'] = score
+                results.append(item)
+        return Response({
+            'count': total,
+            'page': page,
+            'page_size': page_size,
+            'has_next': page * page_size < total,
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVStreamRenderer, NDJSONStreamRenderer])
+    def export(self, request):
+        """
+        Export brut des formulaires en flux: ?format=csv (défaut) ou ?format=ndjson,
+        avec les mêmes filtres que la liste (from/to, atelier, equipement...).
+        Les lignes sont lues par lots (iterator) et écrites au fil de l'eau:
+        mémoire constante quel que soit le nombre de lignes.
+        """
+        rows = export_rows(self.filter_queryset(Formulaire.objects.all()))
+        if request.accepted_renderer.format == 'ndjson':
+            response = StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson; charset=utf-8')
+            extension = 'ndjson'
+        else:
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+            extension = 'csv'
+        filename = f"formulaires_{timezone.localdate():%Y%m%d}.{extension}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    # ---------- ÉCRITURES EN LOT (POST /formulaires/batch/) ----------
+    def batch_clean(self, validated_data):
+        # La consommation de pièces (sorties de stock) reste unitaire
+        if validated_data.pop('pieces', None):
+            raise serializers.ValidationError({'pieces': ["Pièces non gérées en lot: utiliser POST /formulaires/."]})
+        return validated_data
+
+    def batch_prepare(self, instance):
+        # Libellés nouveaux des listes de choix, créés dans la transaction du lot
+        choices = save_missing({field: getattr(instance, field) for field in LOOKUP_FIELDS})
+        for field, choice in choices.items():
+            setattr(instance, field, choice)
+
+    def batch_snapshot(self, instance):
+        return affected_keys(instance.atelier_id, instance.equipement_id, instance.date_defaillance)
+
+    def batch_applied(self, result):
+        # Équivalent groupé des signaux post_save (rollups, index, rapports)
+        changed = result.created + result.updated
+        keys = set()
+        for formulaire in changed:
+            keys |= affected_keys(formulaire.atelier_id, formulaire.equipement_id, formulaire.date_defaillance)
+        for previous in result.previous.values():
+            keys |= previous
+        refresh_buckets(keys)
+        index_formulaires([f.pk for f in changed])
+        for formulaire in result.created:
+            enqueue_failure_report(formulaire)
+        super().batch_applied(result)
+
+
+class StockMovementPagination(KeysetPagination):
+    default_ordering = ('-created_at', '-id')
+
+
+def connex_user_or_none(request):
+    """ConnexUser authentifié (jeton) ou None, pour l'attribution des écritures."""
+    user = getattr(request, "connex_user", None)
+    return user if getattr(user, "pk", None) else None
+
+
+class StockViewSet(BatchMixin, viewsets.ModelViewSet):
+    """
+    Stocks avec recherche par préfixe (?q=), stock bas (?low_stock=1), tri
+    (?ordering=) et pagination keyset optionnelle. Les quantités évoluent par
+    mouvements atomiques (POST /stocks/movements/); une quantité saisie en
+    PUT/PATCH est journalisée comme ajustement d'inventaire.
+    """
     queryset = Stock.objects.all()
     serializer_class = StockSerializer
     authentication_classes = [SessionIdAuthentication]
+    pagination_class = KeysetPagination
+    filter_backends = [StockFilterBackend]
     permission_classes = [permissions.AllowAny]
 
+    @property
+    def keyset_ordering(self):
+        return stock_ordering(self.request.query_params)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            stock = serializer.save()
+            record_adjustment(stock, 0, user=connex_user_or_none(self.request), motif='Création')
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Verrou de la ligne: l'écart journalisé est calculé sur la valeur réellement remplacée
+            previous = Stock.objects.select_for_update().values_list('quantite', flat=True).get(pk=serializer.instance.pk)
+            stock = serializer.save()
+            record_adjustment(stock, previous, user=connex_user_or_none(self.request))
+
+    # ---------- ÉCRITURES EN LOT (POST /stocks/batch/) ----------
+    def batch_prepare(self, instance):
+        instance.normalize_fields()
+
+    def batch_prepared_fields(self):
+        return ('reference_norm', 'element_norm')
+
+    def batch_snapshot(self, instance):
+        return instance.quantite
+
+    def batch_applied(self, result):
+        # Quantités saisies journalisées comme en PUT/PATCH, en un seul INSERT
+        changes = [(stock, 0, 'Création') for stock in result.created]
+        changes += [(stock, result.previous[stock.pk], 'Ajustement inventaire') for stock in result.updated]
+        record_adjustments(changes, user=connex_user_or_none(self.request))
+        for stock in result.created:
+            notify_low_stock(stock, None)
+        for stock in result.updated:
+            notify_low_stock(stock, result.previous[stock.pk])
+        super().batch_applied(result)
+
+    @action(detail=False, methods=['get', 'post'])
+    def movements(self, request):
+        """
+        GET: journal des mouvements (?stock=, kind, from/to), pagination keyset.
+        POST: {"movements": [{"stock": 3, "delta": -2, "motif": "..."}, ...]}
+        appliqués tous ou aucun (409 si une sortie dépasse le stock).
+        """
+        if request.method == 'GET':
+            qs = filter_stock_movements(
+                StockMovement.objects.select_related('stock', 'user'), request.query_params
+            ).order_by('-created_at', '-id')
+            paginator = StockMovementPagination()
+            page = paginator.paginate_queryset(qs, request)
+            if page is None:
+                return Response(StockMovementSerializer(qs, many=True).data)
+            return paginator.get_paginated_response(StockMovementSerializer(page, many=True).data)
+
+        batch = StockMovementBatchSerializer(data=request.data)
+        if not batch.is_valid():
+            return Response(batch.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            movements, quantities = apply_movements(
+                batch.validated_data['movements'], user=connex_user_or_none(request)
+            )
+        except InsufficientStock as e:
+            return Response({"error": "Stock insuffisant.", "shortages": e.shortages}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            "stocks": [{"id": pk, "quantite": q} for pk, q in quantities.items()],
+            "movements": [
+                {"stock": m.stock_id, "kind": m.kind, "delta": m.delta, "quantite_apres": m.quantite_apres}
+                for m in movements
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+
+class ReferenceBatchMixin(BatchMixin):
+    """Lots d'ateliers / équipements: cache de référence et index de recherche à jour."""
+    formulaire_field = None
+
+    def batch_snapshot(self, instance):
+        return instance.nom
+
+    def batch_applied(self, result):
+        refresh_reference_cache()
+        # Le nom fait partie du texte indexé des formulaires (cf. signals.reindex_on_rename)
+        renamed = [obj.pk for obj in result.updated if obj.nom != result.previous[obj.pk]]
+        if renamed:
+            index_formulaires(
+                Formulaire.objects.filter(**{f"{self.formulaire_field}__in": renamed}).values_list('id', flat=True)
+            )
+        super().batch_applied(result)
+
 
-class AtelierViewSet(viewsets.ModelViewSet):
-    queryset = Atelier.objects.all()
+class AtelierViewSet(VersionedCacheMixin, ReferenceBatchMixin, viewsets.ModelViewSet):
+    queryset = Atelier.objects.prefetch_related(equipements_prefetch())
     serializer_class = AtelierSerializer
+    formulaire_field = 'atelier'
     authentication_classes = [SessionIdAuthentication]
     permission_classes = [permissions.AllowAny]
 
 
-class EquipementViewSet(viewsets.ModelViewSet):
+class EquipementViewSet(VersionedCacheMixin, ReferenceBatchMixin, viewsets.ModelViewSet):
     queryset = Equipement.objects.all()
     serializer_class = EquipementSerializer
+    formulaire_field = 'equipement'
+    authentication_classes = [SessionIdAuthentication]
+    permission_classes = [permissions.AllowAny]
+
+
+# ---------- ROLLUPS FIABILITÉ (lecture seule) ----------
+class EquipementRollupViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = EquipementRollup.objects.all()
+    serializer_class = EquipementRollupSerializer
+    authentication_classes = [SessionIdAuthentication]
+    permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('period_start', 'id')
+    filter_backends = [RollupFilterBackend]
+
+
+class AtelierRollupViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = AtelierRollup.objects.all()
+    serializer_class = AtelierRollupSerializer
     authentication_classes = [SessionIdAuthentication]
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('period_start', 'id')
+    filter_backends = [RollupFilterBackend]
+
+
+@api_view(['GET'])
+def reliability_kpis(request):
+    """
+    KPIs de fiabilité (défaillances, arrêt, MTTR, MTBF) lus dans les rollups.
+    Query params: scope=equipement|atelier, from/to (défaut: 12 derniers mois),
+    period=month|day, ids=1,2,3
+    """
+    params = request.query_params
+    scope = params.get('scope', 'equipement')
+    period = params.get('period', 'month')
+    if scope not in ('equipement', 'atelier') or period not in ('day', 'month'):
+        return Response({"error": "scope ou period invalide."}, status=status.HTTP_400_BAD_REQUEST)
+    today = timezone.localdate()
+    date_to = parse_date_param(params, 'to') or today
+    date_from = parse_date_param(params, 'from') or date_to - timedelta(days=365)
+    results = reliability(scope, date_from, date_to, period=period, ids=parse_id_list(params, 'ids'))
+    return Response({"scope": scope, "from": date_from, "to": date_to, "results": results})
+
+
+@api_view(['GET'])
+def parts_consumption(request):
+    """
+    Consommation de pièces (FormulairePiece) par équipement, atelier ou pièce.
+    Query params: group=equipement|atelier|stock + filtres des formulaires
+    (from/to, atelier, equipement, indice_gravite, etat_action_immediate).
+    """
+    group = request.query_params.get('group', 'equipement')
+    if group not in REPORT_GROUPS:
+        return Response({"error": "group invalide (equipement, atelier ou stock)."}, status=status.HTTP_400_BAD_REQUEST)
+    formulaires = filter_formulaires(Formulaire.objects.all(), request.query_params)
+    return Response({"group": group, "results": consumption_report(formulaires, group=group)})
+
+
+
+@api_view(['GET'])
+def pareto_report(request, dimension):
+    """
+    Pareto des défaillances par nature_panne, cause_panne, equipement ou atelier.
+    Query params: metric=downtime|failures, limit (catégories détaillées, le
+    reste dans "others") + filtres des formulaires (from/to, atelier, ...).
+    """
+    metric = request.query_params.get('metric', 'downtime')
+    if dimension not in PARETO_DIMENSIONS or metric not in PARETO_METRICS:
+        return Response({"error": "dimension ou metric invalide."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = request.query_params.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            return Response({"error": "limit doit être un entier positif."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = int(limit)
+    formulaires = filter_formulaires(Formulaire.objects.all(), request.query_params)
+    return Response(pareto(dimension, formulaires, metric=metric, limit=limit))
 
 
 # ---------- LOGIN ----------
@@ -291,13 +661,20 @@ class LoginView(APIView):
         password = request.data.get("password")
 
         try:
-            connex_user = ConnexUser.objects.get(username=username)
+            connex_user = ConnexUser.objects.select_related("admin", "technicien").get(username=username)
             if not check_password(password, connex_user.password):
                 return Response({"error": "Nom d'utilisateur ou mot de passe invalide."}, status=status.HTTP_401_UNAUTHORIZED)
 
+            token = issue_token(connex_user)
+            # Log de connexion écrit en lot (base.connexions), pas dans la requête
+            connexion_log_buffer.record_login(
+                connex_user, token, ip_address=client_ip(request), user_agent=request.META.get("HTTP_USER_AGENT"),
+            )
+
             # On garde le payload tel que tu l’as déjà
             return Response({
-                "token": f"session-{connex_user.id}",  # fake token
+                "token": token,  # à envoyer en "Authorization: Session <token>"
+                "expires_in": token_max_age(),
                 "role": connex_user.role,
                 "user": {
                     "id": connex_user.id,
@@ -310,6 +687,19 @@ class LoginView(APIView):
             return Response({"error": "Nom d'utilisateur ou mot de passe invalide."}, status=status.HTTP_401_UNAUTHORIZED)
 
 
+class LogoutView(APIView):
+    """Ferme le log de connexion de la session et révoque le jeton de l'en-tête Authorization."""
+    authentication_classes = [SessionIdAuthentication]
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        if not request.auth:
+            return Response({"error": "Jeton de session requis."}, status=status.HTTP_401_UNAUTHORIZED)
+        connexion_log_buffer.record_logout(request.auth)
+        revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 @api_view(['GET'])
 def get_user_stats(request):
     return Response({
@@ -320,41 +710,247 @@ def get_user_stats(request):
 
 
 @api_view(['GET'])
-def anomalies_timeseries(request):
-    tf = request.query_params.get('timeframe', 'week')
-    today = timezone.now().date()
-
-    def count_day(d):
-        return Formulaire.objects.filter(date_defaillance=d).count()
-
-    if tf == 'year':
-        labels, data = [], []
-        y, m = today.year, today.month
-        for i in range(11, -1, -1):
-            total_months = (y * 12 + m - 1) - i
-            year = total_months // 12
-            month = total_months % 12 + 1
-            start = date(year, month, 1)
-            end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
-            c = Formulaire.objects.filter(date_defaillance__gte=start, date_defaillance__lt=end).count()
-            labels.append(start.strftime("%b %y"))
-            data.append(c)
-    elif tf == 'month':
-        start = today - timedelta(days=29)
-        labels, data = [], []
-        for i in range(30):
-            d = start + timedelta(days=i)
-            labels.append(d.strftime("%d/%m"))
-            data.append(count_day(d))
+def dashboard_summary(request):
+    """
+    KPIs pré-agrégés du tableau de bord (remplace les fetchs des listes complètes).
+    Supporte ETag / If-None-Match: un poll sans changement coûte un 304.
+    La version est invalidée par les signaux post_save/post_delete (base.signals).
+    """
+    today = timezone.localdate()
+    version = get_version(DASHBOARD_CACHE_NAMESPACE)
+    etag = make_etag(DASHBOARD_CACHE_NAMESPACE, version, today)
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
     else:
-        start = today - timedelta(days=6)
-        labels, data = [], []
-        for i in range(7):
-            d = start + timedelta(days=i)
-            labels.append(d.strftime("%a"))
-            data.append(count_day(d))
+        cache_key = f"base:dashboard:summary:{etag}"
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = build_summary(today)
+            cache.set(cache_key, payload, getattr(settings, 'CACHE_VERSION_TTL', 300))
+        response = Response(payload)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@api_view(['GET'])
+def anomalies_timeseries(request):
+    """
+    Série temporelle des défaillances, calculée en une seule requête groupée.
+    Query params:
+      - timeframe=week|month|year (historique) ou from/to=YYYY-MM-DD
+      - granularity=day|week|month|year
+      - group_by=atelier|equipement|indice_gravite|nature_panne (optionnel)
+    Réponse: {labels, data} (+ buckets, series si group_by)
+    """
+    params = request.query_params
+    try:
+        start, end, granularity, label_format = resolve_range(params, timezone.now().date())
+        payload = timeseries(
+            Formulaire.objects.all(), start, end,
+            granularity=granularity,
+            group_by=params.get('group_by') or None,
+            label_format=label_format,
+        )
+    except AggregationError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(payload)
+
+
+# ---------- STATISTIQUES DE SESSIONS (admin) ----------
+def _session_range(request, default_days, max_days):
+    """from/to (YYYY-MM-DD, inclus; défaut: les `default_days` derniers jours) -> (from, to, inclut aujourd'hui)."""
+    today = timezone.localdate()
+    date_to = parse_date_param(request.query_params, 'to') or today
+    date_from = parse_date_param(request.query_params, 'from') or date_to - timedelta(days=default_days - 1)
+    if date_from > date_to:
+        raise serializers.ValidationError({"from": "La date de début doit précéder la date de fin."})
+    if (date_to - date_from).days >= max_days:
+        raise serializers.ValidationError({"from": f"Période limitée à {max_days} jours."})
+    return date_from, date_to, date_to >= today
+
+
+@api_view(['GET'])
+@authentication_classes([SessionIdAuthentication])
+@permission_classes([IsAdminConnex])
+def sessions_active(request):
+    """Comptes connectés maintenant (session ouverte, jeton non expiré)."""
+    def build():
+        connexion_log_buffer.flush()
+        return active_now(timezone.now())
+    return Response(cached('active', (), build, live=True))
+
+
+@api_view(['GET'])
+@authentication_classes([SessionIdAuthentication])
+@permission_classes([IsAdminConnex])
+def sessions_daily(request):
+    """
+    Sessions, comptes distincts et durée moyenne par jour.
+    Query params: from/to (défaut: 30 derniers jours, SESSION_ANALYTICS_MAX_DAYS au plus)
+    """
+    date_from, date_to, live = _session_range(request, 30, getattr(settings, 'SESSION_ANALYTICS_MAX_DAYS', 366))
+
+    def build():
+        if live:
+            connexion_log_buffer.flush()
+        return {"from": date_from, "to": date_to, "results": sessions_per_day(date_from, date_to)}
+    return Response(cached('daily', (date_from, date_to), build, live))
 
-    return Response({"labels": labels, "data": data})
+
+@api_view(['GET'])
+@authentication_classes([SessionIdAuthentication])
+@permission_classes([IsAdminConnex])
+def sessions_durations(request):
+    """
+    Durée moyenne, percentiles et maximum des sessions fermées.
+    Query params: from/to (défaut: 30 derniers jours), percentiles=50,90,95,99
+    """
+    date_from, date_to, live = _session_range(request, 30, getattr(settings, 'SESSION_ANALYTICS_MAX_DAYS', 366))
+    raw = request.query_params.get('percentiles')
+    try:
+        percentiles = tuple(sorted({int(p) for p in raw.split(',') if p.strip()})) if raw else DEFAULT_PERCENTILES
+    except ValueError:
+        percentiles = ()
+    if not percentiles or not all(0 < p <= 100 for p in percentiles):
+        return Response({"error": "percentiles invalides (entiers de 1 à 100)."}, status=status.HTTP_400_BAD_REQUEST)
+
+    def build():
+        if live:
+            connexion_log_buffer.flush()
+        return {"from": date_from, "to": date_to, **duration_stats(*day_bounds(date_from, date_to), percentiles)}
+    return Response(cached('durations', (date_from, date_to, *percentiles), build, live))
+
+
+@api_view(['GET'])
+@authentication_classes([SessionIdAuthentication])
+@permission_classes([IsAdminConnex])
+def sessions_concurrency(request):
+    """
+    Pic de sessions simultanées par heure (balayage des connexions/déconnexions).
+    Query params: from/to (défaut: 7 derniers jours, SESSION_ANALYTICS_CONCURRENCY_MAX_DAYS au plus)
+    """
+    date_from, date_to, live = _session_range(
+        request, 7, getattr(settings, 'SESSION_ANALYTICS_CONCURRENCY_MAX_DAYS', 31),
+    )
+
+    def build():
+        if live:
+            connexion_log_buffer.flush()
+        start, end = day_bounds(date_from, date_to)
+        return {"from": date_from, "to": date_to, **peak_concurrency(start, end, timezone.now())}
+    return Response(cached('concurrency', (date_from, date_to), build, live))
+
+
+# ---------- SYNCHRONISATION INCRÉMENTALE ----------
+# Viewsets dont /changes/ réutilise le queryset (select_related / prefetch) et le sérialiseur
+SYNC_VIEWSETS = {
+    sync_name(viewset.queryset.model): viewset
+    for viewset in (FormulaireViewSet, StockViewSet, AtelierViewSet, EquipementViewSet, TechnicienViewSet, AdminViewSet)
+}
+
+
+def _sync_source(viewset_class, request):
+    view = viewset_class(request=request, format_kwarg=None, action='list', kwargs={})
+    return view.get_queryset(), lambda rows: view.get_serializer(rows, many=True).data
+
+
+@api_view(['GET'])
+def sync_changes(request):
+    """
+    Changements depuis un curseur, tous modèles confondus, pour les écrans qui
+    rafraîchissent leurs listes (le coût suit le volume de changements, pas la table).
+    Query params:
+      - since=<curseur> renvoyé par l'appel précédent (absent: premier appel)
+      - models=formulaire,stock,... (défaut: formulaire, stock, atelier, equipement, technicien, admin)
+      - mêmes options d'affichage que les listes (ex. atelier_details=lite)
+    Réponse: {cursor, reset, changed: {modèle: [objets]}, deleted: {modèle: [ids]}}
+    reset=true: charger les listes complètes puis repartir du nouveau curseur
+    (premier appel, curseur expiré, ou trop de changements).
+    """
+    now = timezone.now()
+    names = [n for n in (request.query_params.get('models') or '').split(',') if n] or list(SYNC_VIEWSETS)
+    unknown = [n for n in names if n not in SYNC_VIEWSETS]
+    if unknown:
+        return Response({"error": f"Modèle(s) inconnu(s): {', '.join(unknown)}."}, status=status.HTTP_400_BAD_REQUEST)
+    since = request.query_params.get('since')
+    payload = None
+    if since:
+        try:
+            since = decode_cursor(since)
+        except InvalidCursor:
+            return Response({"error": "Curseur invalide."}, status=status.HTTP_400_BAD_REQUEST)
+        payload = changes_since(since, {n: _sync_source(SYNC_VIEWSETS[n], request) for n in names}, now=now)
+    response = Response({
+        'cursor': encode_cursor(now),
+        'reset': payload is None,
+        **(payload or {'changed': {}, 'deleted': {}}),
+    })
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+# ---------- ÉVÉNEMENTS TEMPS RÉEL (SSE) ----------
+def _sse_message(events):
+    return f"event: change\ndata: {json.dumps(events, separators=(',', ':'))}\n\n"
+
+
+@require_GET
+async def event_stream(request):
+    """
+    Flux Server-Sent Events des écritures validées (base.events):
+        event: change
+        data: [{"model": "formulaire", "op": "save", "ids": [12]}]
+    ?models=formulaire,stock pour filtrer. "ids": null ou {"op": "resync"}:
+    recharger (ou /api/changes/). Après une (re)connexion, le client se
+    resynchronise lui-même: aucun historique n'est rejoué.
+
+    Vue asynchrone: sous ASGI un client inactif ne coûte qu'une connexion
+    ouverte et une tâche en attente (pas de thread, pas de requête SQL);
+    un commentaire est envoyé toutes les EVENTS_HEARTBEAT secondes.
+    Sous WSGI (runserver, gunicorn sync) le flux infini serait lu en entier
+    avant l'envoi et bloquerait un thread: 503, le client garde son polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "Flux temps réel disponible uniquement sous ASGI (uvicorn backend.asgi:application)."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    models = [m for m in request.GET.get('models', '').split(',') if m] or None
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT', 25)
+
+    async def stream():
+        # Abonnement dans la boucle qui consomme la réponse (pas celle de la vue)
+        backend = get_backend()
+        subscription = backend.subscribe(models)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                events = await subscription.get(heartbeat)
+                yield ": ping\n\n" if events is None else _sse_message(events)
+        finally:
+            backend.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: pas de mise en tampon du flux
+    return response
+
+
+# ---------- MÉTRIQUES (profilage des requêtes) ----------
+class MetricsView(APIView):
+    """
+    Métriques du RequestProfilingMiddleware au format texte Prometheus.
+    Admin uniquement; vide tant que REQUEST_PROFILING_ENABLED est à False.
+    """
+    authentication_classes = [SessionIdAuthentication]
+    permission_classes = [IsAdminConnex]
+
+    def get(self, request):
+        return HttpResponse(
+            metrics_registry.to_prometheus(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
 
 
 # ---------- changer mon mot de passe ----------
@@ -371,7 +967,8 @@ class ChangeMyPasswordView(APIView):
             return Response({"error": "Mot de passe invalide (min 6 caractères)."}, status=status.HTTP_400_BAD_REQUEST)
         user.password = make_password(new_pwd)
         user.save(update_fields=["password"])
-        return Response({"message": "Mot de passe mis à jour."}, status=status.HTTP_200_OK)
+        # L'empreinte du compte a changé (signal post_save): les anciens jetons sont refusés
+        return Response({"message": "Mot de passe mis à jour.", "token": issue_token(user)}, status=status.HTTP_200_OK)
 
 
 # ---------- ME (profil courant) ----------
@@ -1,4 +1,4 @@
-import React, { useEffect, useMemo, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import {
   Box, Paper, Typography, TextField, InputAdornment, IconButton, Tooltip, Chip,
   Table, TableHead, TableRow, TableCell, TableBody, TableContainer,
@@ -23,7 +23,9 @@ const Transition = React.forwardRef(function Transition(props, ref) {
 export default function FormList() {
   const navigate = useNavigate();
 
+  // Page courante de la liste (pagination par curseur côté serveur)
   const [rows, setRows] = useState([]);
+  const [hasNext, setHasNext] = useState(false);
   const [loading, setLoading] = useState(true);
   const [snack, setSnack] = useState({ open: false, message: "", severity: "success" });
 
@@ -45,12 +47,33 @@ export default function FormList() {
     etat_action_immediate: "",
   });
 
+  // Curseur de /api/changes/: le rafraîchissement ne rapporte que les fiches modifiées / supprimées
+  const cursorRef = useRef(null);
+  // Curseur de /api/formulaires/ de chaque page déjà atteinte (page 0: pas de curseur)
+  const pageCursorsRef = useRef([null]);
+
+  const resetPages = () => {
+    pageCursorsRef.current = [null];
+    setPage(0);
+  };
+
   const fetchData = async () => {
     try {
       setLoading(true);
-      const res = await fetch("http://localhost:8000/api/formulaires/");
+      const params = new URLSearchParams({ atelier_details: "lite", page_size: String(rowsPerPage) });
+      const cursor = pageCursorsRef.current[page];
+      if (cursor) params.set("cursor", cursor);
+      if (etat !== "tous") params.set("etat_action_immediate", etat);
+      // Curseur pris AVANT la page: rien ne se perd entre les deux appels
+      const sync = await fetch("http://localhost:8000/api/changes/?models=formulaire").then((r) => r.json());
+      const res = await fetch(`http://localhost:8000/api/formulaires/?${params}`);
+      if (!res.ok) throw new Error();
       const data = await res.json();
-      setRows(Array.isArray(data) ? data : []);
+      const next = data.next ? new URL(data.next).searchParams.get("cursor") : null;
+      pageCursorsRef.current[page + 1] = next;
+      setRows(Array.isArray(data.results) ? data.results : []);
+      setHasNext(Boolean(next));
+      cursorRef.current = sync.cursor || null;
     } catch (e) {
       setSnack({ open: true, message: "Erreur de chargement des formulaires", severity: "error" });
     } finally {
@@ -58,7 +81,76 @@ export default function FormList() {
     }
   };
 
-  useEffect(() => { fetchData(); }, []);
+  const refresh = async () => {
+    if (!cursorRef.current) return fetchData();
+    try {
+      const params = new URLSearchParams({ since: cursorRef.current, models: "formulaire", atelier_details: "lite" });
+      const res = await fetch(`http://localhost:8000/api/changes/?${params}`);
+      if (!res.ok) throw new Error();
+      const sync = await res.json();
+      if (sync.reset) return fetchData();
+      const changed = sync.changed?.formulaire ?? [];
+      const deleted = new Set(sync.deleted?.formulaire ?? []);
+      // Fiche nouvelle / hors de la page, ou filtre d'état actif: la page est rechargée
+      const onPage = new Set(rows.map((r) => r.id));
+      if (changed.some((r) => !onPage.has(r.id)) || (etat !== "tous" && changed.length)) return fetchData();
+      if (changed.length || deleted.size) {
+        setRows((prev) => {
+          const byId = new Map(prev.map((r) => [r.id, r]));
+          deleted.forEach((id) => byId.delete(id));
+          changed.forEach((r) => byId.set(r.id, r));
+          return Array.from(byId.values());
+        });
+      }
+      cursorRef.current = sync.cursor;
+    } catch {
+      setSnack({ open: true, message: "Erreur de chargement des formulaires", severity: "error" });
+    }
+  };
+
+  useEffect(() => {
+    if (!query.trim()) fetchData();
+  }, [page, rowsPerPage, etat, query]);
+
+  // Fiches modifiées ailleurs: poussées en SSE puis rapatriées via /api/changes/
+  const refreshRef = useRef(refresh);
+  refreshRef.current = refresh;
+  useEffect(() => {
+    if (typeof EventSource === "undefined") return undefined;
+    const source = new EventSource("http://localhost:8000/api/events/?models=formulaire");
+    source.addEventListener("change", () => { if (cursorRef.current) refreshRef.current(); });
+    return () => source.close();
+  }, []);
+
+  // ------ recherche serveur (index plein texte, résultats classés et paginés) ------
+  const [search, setSearch] = useState({ count: 0, results: [] });
+  const [searching, setSearching] = useState(false);
+  const searchQuery = query.trim();
+
+  useEffect(() => {
+    if (!searchQuery) return undefined;
+    const params = new URLSearchParams({
+      q: searchQuery,
+      page: String(page + 1),
+      page_size: String(rowsPerPage),
+      atelier_details: "lite",
+    });
+    if (etat !== "tous") params.set("etat_action_immediate", etat);
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        setSearching(true);
+        const res = await fetch(`http://localhost:8000/api/formulaires/search/?${params}`);
+        const data = await res.json();
+        if (!cancelled) setSearch({ count: data.count || 0, results: Array.isArray(data.results) ? data.results : [] });
+      } catch (e) {
+        if (!cancelled) setSnack({ open: true, message: "Erreur de recherche", severity: "error" });
+      } finally {
+        if (!cancelled) setSearching(false);
+      }
+    }, 300);
+    return () => { cancelled = true; clearTimeout(timer); };
+  }, [searchQuery, etat, page, rowsPerPage, rows]);
 
   const statusColor = (s) => {
     const v = (s || "").toLowerCase();
@@ -68,33 +160,12 @@ export default function FormList() {
     return "default";
   };
 
-  // ------ filtre + recherche (sur noms lisibles) ------
-  const filtered = useMemo(() => {
-    const q = query.trim().toLowerCase();
-    const list = rows.filter((r) => {
-      const etatVal = (r.etat_action_immediate || r.etat_immediate || "").toLowerCase();
-      const okEtat = etat === "tous" || etatVal === etat;
-      if (!okEtat) return false;
-
-      if (!q) return true;
-      const atelierTxt = r.atelier_details?.nom ?? String(r.atelier ?? "");
-      const equipTxt   = r.equipement_details?.nom ?? String(r.equipement ?? "");
-      const hay = (
-        `${r.id} ${atelierTxt} ${equipTxt} ${r.nature_panne} ${r.cause_panne} ` +
-        `${r.pilote} ${r.methode_entretien} ${r.indice_gravite}`
-      ).toLowerCase();
-      return hay.includes(q);
-    });
-
-    // tri décroissant par date (si présent)
-    list.sort((a, b) => String(b.date_defaillance || "").localeCompare(String(a.date_defaillance || "")));
-    return list;
-  }, [rows, query, etat]);
-
-  const paged = useMemo(() => {
-    const start = page * rowsPerPage;
-    return filtered.slice(start, start + rowsPerPage);
-  }, [filtered, page, rowsPerPage]);
+  // ------ sans recherche: page serveur (filtre d'état et tri appliqués par l'API) ------
+  const paged = searchQuery ? search.results : rows;
+  const loadedCount = page * rowsPerPage + rows.length;
+  // Curseur: total inconnu tant qu'il reste une page suivante (-1 pour TablePagination)
+  const totalCount = searchQuery ? search.count : (hasNext ? -1 : loadedCount);
+  const countLabel = totalCount === -1 ? `${loadedCount}+` : String(totalCount);
 
   const handleDelete = async (id) => {
     try {
@@ -149,7 +220,7 @@ export default function FormList() {
             <Typography variant="h4" className="hero-title">Formulaires</Typography>
             <Typography variant="body2" className="hero-sub">Gestion et suivi des fiches d’anomalie</Typography>
             <div className="hero-stats">
-              <Chip icon={<CalendarMonthIcon />} label={`${rows.length} au total`} className="stat-chip" />
+              <Chip icon={<CalendarMonthIcon />} label={`${countLabel} au total`} className="stat-chip" />
               <Chip icon={<AccessTimeIcon />} label="Recherche + pagination" className="stat-chip" />
             </div>
           </div>
@@ -160,7 +231,7 @@ export default function FormList() {
               </Button>
             </Tooltip>
             <Tooltip title="Rafraîchir">
-              <IconButton className="btn-refresh" onClick={fetchData}><RefreshIcon /></IconButton>
+              <IconButton className="btn-refresh" onClick={refresh}><RefreshIcon /></IconButton>
             </Tooltip>
           </div>
         </Paper>
@@ -170,7 +241,7 @@ export default function FormList() {
           <TextField
             placeholder="Rechercher (atelier, équipement, pilote, nature...)"
             value={query}
-            onChange={(e) => { setQuery(e.target.value); setPage(0); }}
+            onChange={(e) => { setQuery(e.target.value); resetPages(); }}
             className="search-field"
             InputProps={{
               startAdornment: (
@@ -185,7 +256,7 @@ export default function FormList() {
             label="État"
             className="filter-field"
             value={etat}
-            onChange={(e) => { setEtat(e.target.value); setPage(0); }}
+            onChange={(e) => { setEtat(e.target.value); resetPages(); }}
             InputLabelProps={{ shrink: true }}
           >
             <MenuItem value="tous">Tous</MenuItem>
@@ -195,7 +266,7 @@ export default function FormList() {
           </TextField>
           <div className="spacer" />
           <div className="toolbar-right">
-            <span className="count-badge">{filtered.length}</span>
+            <span className="count-badge">{countLabel}</span>
           </div>
         </Paper>
 
@@ -224,7 +295,7 @@ export default function FormList() {
             </TableHead>
 
             <TableBody>
-              {loading ? (
+              {loading || searching ? (
                 Array.from({ length: 6 }).map((_, i) => (
                   <TableRow key={`sk-${i}`} className="row loading">
                     {Array.from({ length: 16 }).map((__, j) => (
@@ -297,13 +368,14 @@ export default function FormList() {
           <TablePagination
             component="div"
             className="pagination"
-            count={filtered.length}
+            count={totalCount}
             page={page}
             onPageChange={(_, p) => setPage(p)}
             rowsPerPage={rowsPerPage}
-            onRowsPerPageChange={(e) => { setRpp(parseInt(e.target.value, 10)); setPage(0); }}
+            onRowsPerPageChange={(e) => { setRpp(parseInt(e.target.value, 10)); resetPages(); }}
             rowsPerPageOptions={[5, 10, 25, 50]}
             labelRowsPerPage="Lignes/ page"
+            labelDisplayedRows={({ from, to, count }) => `${from}–${to} sur ${count !== -1 ? count : `plus de ${to}`}`}
           />
         </TableContainer>
 
@@ -6,6 +6,14 @@ export default function Logout() {
   const navigate = useNavigate();
 
   useEffect(() => {
+    // Ferme le log de connexion côté serveur (sans attendre la réponse)
+    const token = localStorage.getItem('auth_token') || sessionStorage.getItem('auth_token');
+    if (token) {
+      axios.post('http://localhost:8000/api/logout/', null, {
+        headers: { Authorization: `Session ${token}` },
+      }).catch(() => {});
+    }
+
     try {
       // Clear both persistent and session auth
       localStorage.removeItem('auth_token');
@@ -16,8 +16,9 @@ export default function Settings() {
     const ls = localStorage.getItem('auth_user');
     const ss = sessionStorage.getItem('auth_user');
     const user = ls ? JSON.parse(ls) : (ss ? JSON.parse(ss) : null);
-    if (user?.id) {
-      axios.defaults.headers.common['Authorization'] = `Session ${user.id}`;
+    const token = localStorage.getItem('auth_token') || sessionStorage.getItem('auth_token');
+    if (user?.id && token) {
+      axios.defaults.headers.common['Authorization'] = `Session ${token}`;
     }
   }, []);
 
@@ -28,7 +29,13 @@ export default function Settings() {
     }
     try {
       setSaving(true);
-      await axios.post('http://localhost:8000/api/me/change-password/', { password: pwd });
+      const { data } = await axios.post('http://localhost:8000/api/me/change-password/', { password: pwd });
+      // l'ancien jeton est révoqué côté serveur: on garde le nouveau
+      if (data?.token) {
+        const storage = localStorage.getItem('auth_token') ? localStorage : sessionStorage;
+        storage.setItem('auth_token', data.token);
+        axios.defaults.headers.common['Authorization'] = `Session ${data.token}`;
+      }
       setPwd(''); setPwd2('');
       setToast({ open: true, msg: 'Mot de passe mis à jour', sev: 'success' });
     } catch (e) {
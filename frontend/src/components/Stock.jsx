@@ -3,7 +3,7 @@ import {
   Box, Paper, Typography, TextField, InputAdornment, IconButton, Tooltip, Chip,
   Table, TableHead, TableRow, TableCell, TableBody, TableContainer,
   Snackbar, Alert, Button, Divider, Dialog, DialogTitle, DialogContent,
-  DialogActions, Slide, TablePagination, Stack, useMediaQuery
+  DialogActions, Slide, TablePagination, Stack, useMediaQuery, MenuItem
 } from "@mui/material";
 import SearchIcon from "@mui/icons-material/Search";
 import RefreshIcon from "@mui/icons-material/Refresh";
@@ -27,6 +27,8 @@ export default function Stock() {
 
   // UI
   const [query, setQuery] = useState("");
+  const [ordering, setOrdering] = useState("reference");
+  const [lowOnly, setLowOnly] = useState(false);
   const [page, setPage] = useState(0);
   const [rowsPerPage, setRpp] = useState(10);
 
@@ -38,12 +40,19 @@ export default function Stock() {
   // Confirm delete
   const [confirm, setConfirm] = useState({ open: false, id: null });
 
-  useEffect(() => { fetchRows(); }, []);
+  // Recherche / tri / stock bas côté serveur (requête relancée après 300 ms de pause)
+  useEffect(() => {
+    const timer = setTimeout(() => { fetchRows(); }, 300);
+    return () => clearTimeout(timer);
+  }, [query, ordering, lowOnly]);
 
   const fetchRows = async () => {
     try {
       setLoading(true);
-      const res = await fetch("http://localhost:8000/api/stocks/");
+      const params = new URLSearchParams({ ordering });
+      if (query.trim()) params.set("q", query.trim());
+      if (lowOnly) params.set("low_stock", "1");
+      const res = await fetch(`http://localhost:8000/api/stocks/?${params}`);
       const data = await res.json();
       setRows(Array.isArray(data) ? data : []);
     } catch (e) {
@@ -111,18 +120,8 @@ export default function Stock() {
     }
   };
 
-  // ------- recherche + pagination -------
-  const filtered = useMemo(() => {
-    const q = query.trim().toLowerCase();
-    const list = rows.filter((r) => {
-      if (!q) return true;
-      const hay = `${r.reference} ${r.element} ${r.quantite}`.toLowerCase();
-      return hay.includes(q);
-    });
-    // tri alphabétique par référence puis élément
-    list.sort((a, b) => String(a.reference || "").localeCompare(String(b.reference || "")));
-    return list;
-  }, [rows, query]);
+  // ------- pagination (liste déjà filtrée et triée par le serveur) -------
+  const filtered = rows;
 
   const paged = useMemo(() => {
     const start = page * rowsPerPage;
@@ -184,6 +183,24 @@ export default function Stock() {
             ),
           }}
         />
+        <TextField
+          select
+          label="Tri"
+          value={ordering}
+          onChange={(e) => { setOrdering(e.target.value); setPage(0); }}
+          InputLabelProps={{ shrink: true }}
+        >
+          <MenuItem value="reference">Référence</MenuItem>
+          <MenuItem value="element">Élément</MenuItem>
+          <MenuItem value="quantite">Quantité croissante</MenuItem>
+          <MenuItem value="-quantite">Quantité décroissante</MenuItem>
+        </TextField>
+        <Chip
+          label="Stock bas"
+          color={lowOnly ? "warning" : "default"}
+          variant={lowOnly ? "filled" : "outlined"}
+          onClick={() => { setLowOnly((v) => !v); setPage(0); }}
+        />
         <div className="spacer" />
         <div className="toolbar-right">
           <span className="count-badge">{filtered.length}</span>
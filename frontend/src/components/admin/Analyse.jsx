@@ -15,6 +15,7 @@ import {
 } from "@mui/material";
 import RefreshIcon from "@mui/icons-material/Refresh";
 import FileDownloadIcon from "@mui/icons-material/FileDownload";
+import TableViewIcon from "@mui/icons-material/TableView";
 import TimelineIcon from "@mui/icons-material/Timeline";
 import axios from "axios";
 import Header from "./Header";
@@ -136,6 +137,32 @@ export default function Analyse() {
     URL.revokeObjectURL(url);
   };
 
+  // Historique brut de la période (export serveur en flux, mêmes filtres que la liste)
+  const exportHistory = async () => {
+    const iso = (d) => `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, "0")}-${String(d.getDate()).padStart(2, "0")}`;
+    const today = new Date();
+    let from = new Date(today);
+    let to = today;
+    if (timeframe === "year") {
+      from = new Date(today.getFullYear(), today.getMonth() - 11, 1);
+      to = new Date(today.getFullYear(), today.getMonth() + 1, 0);
+    } else {
+      from.setDate(today.getDate() - (timeframe === "month" ? 29 : 6));
+    }
+    try {
+      const { data } = await axios.get("http://localhost:8000/api/formulaires/export/", {
+        params: { format: "csv", from: iso(from), to: iso(to) },
+        responseType: "blob",
+      });
+      const url = URL.createObjectURL(data);
+      const a = document.createElement("a");
+      a.href = url; a.download = `formulaires_${timeframe}_${iso(today)}.csv`; a.click();
+      URL.revokeObjectURL(url);
+    } catch {
+      /* export indisponible: rien à télécharger */
+    }
+  };
+
   return (
     <Box className="analyse-root">
       <Header />
@@ -179,6 +206,12 @@ export default function Analyse() {
               <FileDownloadIcon />
             </IconButton>
           </MUITooltip>
+
+          <MUITooltip title="Exporter l'historique des défaillances (CSV)">
+            <IconButton onClick={exportHistory} className="btn-icon">
+              <TableViewIcon />
+            </IconButton>
+          </MUITooltip>
         </Stack>
       </Paper>
 
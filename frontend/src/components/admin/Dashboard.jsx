@@ -23,6 +23,8 @@ const ENDPOINTS = {
   forms: `${API}/api/formulaires/`,
   stocks: `${API}/api/stocks/`,
   stats: `${API}/api/stats/`,
+  summary: `${API}/api/dashboard/summary/`,
+  events: `${API}/api/events/?models=formulaire,stock,technicien,admin,connexuser`,
 };
 
 const theme = createTheme({
@@ -167,10 +169,33 @@ function useDashboardData() {
     };
   };
 
+  /* KPIs pré-agrégés côté serveur (ETag: le navigateur revalide, 304 si inchangé) */
+  const buildFromSummary = async () => {
+    const r = await fetch(ENDPOINTS.summary);
+    if (!r.ok) throw new Error(`summary ${r.status}`);
+    const s = await r.json();
+    const toItem = (it) => ({ ...mapStock(it), minQty: s.stock_alerts?.threshold ?? null });
+
+    return {
+      counts: {
+        users: s.counts?.users ?? 0,
+        techniciens: s.counts?.techniciens ?? 0,
+        admins: s.counts?.admins ?? 0,
+        forms: s.counts?.forms ?? 0,
+      },
+      recentForms: s.recent_forms ?? [],
+      natures: s.natures ?? [],
+      stockAlerts: {
+        rupture: (s.stock_alerts?.rupture ?? []).map(toItem),
+        critical: (s.stock_alerts?.critical ?? []).map(toItem),
+      },
+    };
+  };
+
   const fetchOnce = async () => {
     try {
       setLoading(true);
-      setData(await buildFromFallback());
+      setData(await buildFromSummary());
     } catch {
       setData(await buildFromFallback());
     } finally {
@@ -180,8 +205,38 @@ function useDashboardData() {
 
   useEffect(() => {
     fetchOnce();
-    timerRef.current = setInterval(fetchOnce, 10000);
-    return () => { if (timerRef.current) clearInterval(timerRef.current); };
+    // Polling toutes les 10 s tant que le flux SSE n'est pas ouvert: navigateur
+    // sans EventSource, serveur WSGI (503) ou connexion perdue
+    let poller = null;
+    const startPolling = () => {
+      if (!poller) poller = setInterval(fetchOnce, 10000);
+    };
+    const stopPolling = () => {
+      clearInterval(poller);
+      poller = null;
+    };
+    startPolling();
+    if (typeof EventSource === "undefined") return stopPolling;
+
+    // Push SSE: on ne recharge qu'après une écriture (regroupées sur 1 s)
+    const source = new EventSource(ENDPOINTS.events);
+    const schedule = () => {
+      if (timerRef.current) return;
+      timerRef.current = setTimeout(() => { timerRef.current = null; fetchOnce(); }, 1000);
+    };
+    source.addEventListener("change", schedule);
+    let opened = false;
+    source.onopen = () => {
+      stopPolling();
+      if (opened) schedule(); // reconnexion: des écritures ont pu être manquées
+      opened = true;
+    };
+    source.onerror = startPolling;
+    return () => {
+      source.close();
+      stopPolling();
+      if (timerRef.current) clearTimeout(timerRef.current);
+    };
   }, []);
 
   return { loading, data, reload: fetchOnce };
@@ -249,10 +304,10 @@ export default function DashboardPro() {
     { label: "Formulaires", value: data.counts.forms, icon: <DescriptionIcon />, hint: "Entrés" },
   ];
 
-  // Agrégation par nature (sur l’ensemble des formulaires)
+  // Agrégation par nature (fournie par le serveur, sinon calculée en fallback)
   const natureCounts = useMemo(
-    () => aggregateNatures(data.formsAll || data.recentForms || []),
-    [data.formsAll, data.recentForms]
+    () => data.natures || aggregateNatures(data.formsAll || data.recentForms || []),
+    [data.natures, data.formsAll, data.recentForms]
   );
 
   return (
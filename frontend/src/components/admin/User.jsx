@@ -26,8 +26,9 @@ function ensureAxiosAuth() {
   const ls = localStorage.getItem('auth_user');
   const ss = sessionStorage.getItem('auth_user');
   const user = ls ? JSON.parse(ls) : (ss ? JSON.parse(ss) : null);
-  if (user?.id) {
-    axios.defaults.headers.common['Authorization'] = `Session ${user.id}`;
+  const token = localStorage.getItem('auth_token') || sessionStorage.getItem('auth_token');
+  if (user?.id && token) {
+    axios.defaults.headers.common['Authorization'] = `Session ${token}`;
   }
 }
 
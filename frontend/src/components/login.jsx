@@ -9,8 +9,9 @@ function applyAxiosAuthFromStorage() {
   const ss = sessionStorage.getItem('auth_user');
   const user = ls ? JSON.parse(ls) : (ss ? JSON.parse(ss) : null);
   axios.defaults.baseURL = 'http://localhost:8000/api';
-  if (user?.id) {
-    axios.defaults.headers.common['Authorization'] = `Session ${user.id}`;
+  const token = localStorage.getItem('auth_token') || sessionStorage.getItem('auth_token');
+  if (user?.id && token) {
+    axios.defaults.headers.common['Authorization'] = `Session ${token}`;
   } else {
     delete axios.defaults.headers.common['Authorization'];
   }